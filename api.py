@@ -9,23 +9,29 @@ import os
 import time
 import uuid
 from pathlib import Path
-from typing import List, Optional, Tuple
+from typing import Any, Dict, List, Optional, Tuple
 
 from fastapi import BackgroundTasks, FastAPI, HTTPException, Response
 from pydantic import BaseModel, Field
 import uvicorn
 
 from editor import Config
-from editor.Registry import PromptRegistry
+from editor.registry_loader import get_registry
 from editor.docx_load import ParagraphRecord, document_to_big_text_with_mapping
 from editor.export_local import save_document_with_edits
-from editor.llm import OpenAIChatLLM, OllamaChatLLM
+from editor.llm import OpenAIChatLLM, OllamaChatLLM, configure_logging
+from editor.llm_pool import get_shared_pool
+from editor.noop import build_noop_filter
+from editor.routing import build_llm_router
+from editor.profiling import get_shared_sampler
+from editor.tracing import start_trace
 from editor.pipeline import EditorPipeline
 
 from finetune_v2.docx_utils import build_paragraph_updates
 
 # --- FastAPI setup -------------------------------------------------------
 app = FastAPI(title="MucVu Editor Pipeline API", version="1.5.0")
+configure_logging(getattr(Config, "LLM_LOG_LEVEL", "INFO"))
 
 
 class ProcessRequest(BaseModel):
@@ -39,12 +45,26 @@ class ChunkAudit(BaseModel):
     labels: List[str]
     edit_prompt_ids: List[str]
     latency_ms: int
+    timings_ms: Dict[str, float] = Field(default_factory=dict, description="Thoi gian tung giai doan (ms).")
+    max_tokens: Optional[int] = Field(None, description="Tran token dau ra cua buoc bien tap.")
+    truncated: bool = Field(False, description="Ban bien tap bi cat o tran max_tokens.")
+    status: str = Field("ok", description="'ok' hoac 'failed' (doan loi giu nguyen van ban goc).")
+    error: Optional[str] = Field(None, description="Ly do loi: ly do kiem tra (empty, too_long, ...), no_label hoac exception.")
+    attempts: int = Field(1, description="So lan bien tap doan nay (tinh ca cac lan goi lai).")
+    backend: Optional[str] = Field(None, description="Backend LLM da bien tap doan nay (Config.LLM_BACKENDS; null = model chinh).")
+    skipped: Optional[str] = Field(
+        None, description="Doan khong can sua, bo qua LLM (ly do: history, scripture, date, ...; editor/noop.py)."
+    )
 
 
 class ProcessResponse(BaseModel):
     final_text: str
     audit: List[ChunkAudit]
     docx_path: Optional[str] = Field(None, description="Duong dan file DOCX da duoc chinh sua.")
+    failed_chunks: List[str] = Field(
+        default_factory=list, description="chunk_id cac doan khong bien tap duoc (giu nguyen van ban goc)."
+    )
+    trace: Optional[Dict[str, Any]] = Field(None, description="Tong hop thoi gian theo giai doan (trace_id, stages).")
 
 
 class ProcessTextResponse(BaseModel):
@@ -52,10 +72,14 @@ class ProcessTextResponse(BaseModel):
 
 
 def _make_llm_from_config():
+    pool = get_shared_pool(Config)
+    if pool is not None:
+        return pool
     if getattr(Config, "USE_OLLAMA", True):
         return OllamaChatLLM(
             model=Config.OLLAMA_MODEL,
             api_url=Config.OLLAMA_API_URL,
+            debug_sample_every=getattr(Config, "LLM_STREAM_DEBUG_SAMPLE", 0),
         )
     if not getattr(Config, "OPENAI_API_KEY", ""):
         raise HTTPException(status_code=400, detail="OPENAI_API_KEY chua co trong Config.py.")
@@ -86,6 +110,21 @@ def _resolve_docx_context(docx_path: Optional[str]) -> Tuple[str, Optional[Path]
 
 
 def _run_pipeline(big_text: Optional[str], docx_path: Optional[str]) -> ProcessResponse:
+    sampler = get_shared_sampler(Config)
+    with start_trace(
+        "process_document",
+        config=Config,
+        on_end=sampler.annotate if sampler is not None else None,
+        api="v1",
+    ) as trace:
+        response = _process_document(big_text, docx_path)
+    response.trace = trace.summary()
+    if sampler is not None:
+        response.trace["resources"] = sampler.summarize(trace.root.start_unix_ns, trace.root.end_unix_ns)
+    return response
+
+
+def _process_document(big_text: Optional[str], docx_path: Optional[str]) -> ProcessResponse:
     document_context: Optional[Tuple[object, List[ParagraphRecord]]] = None
     docx_output_path: Optional[Path] = None
 
@@ -99,16 +138,23 @@ def _run_pipeline(big_text: Optional[str], docx_path: Optional[str]) -> ProcessR
         if resolved_path is not None:
             Config.DOCUMENT = str(resolved_path)
 
-    registry = PromptRegistry.from_dict(Config.REGISTRY_DICT)
+    registry = get_registry(Config)
 
     try:
         llm = _make_llm_from_config()
+        router = build_llm_router(Config, llm)
     except HTTPException:
         raise
     except Exception as exc:  # noqa: BLE001
         raise HTTPException(status_code=400, detail=f"Loi khoi tao LLM: {exc}") from exc
 
-    pipeline = EditorPipeline(classifier_llm=llm, editor_llm=llm, registry=registry)
+    pipeline = EditorPipeline(
+        classifier_llm=llm,
+        editor_llm=llm,
+        registry=registry,
+        router=router,
+        noop=build_noop_filter(Config, registry, router or llm),
+    )
 
     try:
         final_text, results = pipeline.process(working_text)
@@ -128,12 +174,21 @@ def _run_pipeline(big_text: Optional[str], docx_path: Optional[str]) -> ProcessR
             labels=r.labels,
             edit_prompt_ids=r.edit_prompt_ids,
             latency_ms=r.latency_ms,
+            timings_ms=r.timings_ms,
+            max_tokens=r.max_tokens,
+            truncated=r.truncated,
+            status=r.status,
+            error=r.error,
+            attempts=r.attempts,
+            backend=r.backend,
+            skipped=r.skipped,
         )
         for r in results
     ]
     return ProcessResponse(
         final_text=final_text,
         audit=audit,
+        failed_chunks=[entry.chunk_id for entry in audit if entry.status == "failed"],
         docx_path=str(docx_output_path) if docx_output_path else None,
     )
 
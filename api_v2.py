@@ -6,20 +6,28 @@ sys.stderr.reconfigure(encoding="utf-8")
 
 import json
 import os
+import threading
 import time
 import uuid
 from pathlib import Path
-from typing import List, Optional, Tuple
+from typing import Any, Dict, List, Optional, Tuple
 
 from fastapi import BackgroundTasks, FastAPI, HTTPException, Query, Response
 from fastapi.responses import FileResponse
 from pydantic import BaseModel, Field
 import uvicorn
 
-from editor.Registry import PromptRegistry
+from editor.registry_loader import get_registry
 from editor.docx_load import ParagraphRecord, document_to_big_text_with_mapping
 from editor.export_local import save_document_with_edits
-from editor.llm import OpenAIChatLLM, OllamaChatLLM
+from editor import metrics
+from editor.checkpoint import open_checkpoint
+from editor.llm import OpenAIChatLLM, OllamaChatLLM, configure_logging
+from editor.llm_pool import get_shared_pool, shared_pools
+from editor.noop import build_noop_filter
+from editor.routing import build_llm_router
+from editor.profiling import get_shared_sampler
+from editor.tracing import start_trace
 
 from finetune_v2 import Config as ConfigV2
 from finetune_v2.docx_utils import build_paragraph_updates
@@ -28,10 +36,13 @@ from finetune_v2.label_matcher import (
     LabelSemanticMatcher,
     SentenceTransformerEmbedder,
 )
+from finetune_v2.cascade import build_label_classifier, classifier_mode
+from finetune_v2.sequence import LabelSequenceSmoother, build_sequence_smoother
 from finetune_v2.pipeline import SemanticEditorPipeline
 
 # --- FastAPI setup -------------------------------------------------------
 app_v2 = FastAPI(title="MucVu Editor Pipeline API (finetune-v2)", version="2.0.0")
+configure_logging(getattr(ConfigV2, "LLM_LOG_LEVEL", "INFO"))
 
 # ====== Schemas ======
 
@@ -47,12 +58,27 @@ class ChunkAudit(BaseModel):
     labels: List[str]
     edit_prompt_ids: List[str]
     latency_ms: int
+    timings_ms: Dict[str, float] = Field(default_factory=dict, description="Thoi gian tung giai doan (ms).")
+    max_tokens: Optional[int] = Field(None, description="Tran token dau ra cua buoc bien tap.")
+    truncated: bool = Field(False, description="Ban bien tap bi cat o tran max_tokens.")
+    status: str = Field("ok", description="'ok' hoac 'failed' (doan loi giu nguyen van ban goc).")
+    error: Optional[str] = Field(None, description="Ly do loi: ly do kiem tra (empty, too_long, ...), no_label hoac exception.")
+    attempts: int = Field(1, description="So lan bien tap doan nay (tinh ca cac lan goi lai).")
+    backend: Optional[str] = Field(None, description="Backend LLM da bien tap doan nay (Config.LLM_BACKENDS; null = model chinh).")
+    resumed: bool = Field(False, description="Lay lai tu checkpoint, khong bien tap lai trong lan chay nay.")
+    skipped: Optional[str] = Field(
+        None, description="Doan khong can sua, bo qua LLM (ly do: history, scripture, date, ...; editor/noop.py)."
+    )
 
 
 class ProcessResponse(BaseModel):
     final_text: str
     audit: List[ChunkAudit]
     docx_path: Optional[str] = Field(None, description="Duong dan file DOCX da duoc chinh sua.")
+    failed_chunks: List[str] = Field(
+        default_factory=list, description="chunk_id cac doan khong bien tap duoc (giu nguyen van ban goc)."
+    )
+    trace: Optional[Dict[str, Any]] = Field(None, description="Tong hop thoi gian theo giai doan (trace_id, stages).")
 
 
 class ProcessTextResponse(BaseModel):
@@ -63,10 +89,14 @@ class ProcessTextResponse(BaseModel):
 
 
 def _make_llm_from_config():
+    pool = get_shared_pool(ConfigV2)
+    if pool is not None:
+        return pool
     if getattr(ConfigV2, "USE_OLLAMA", True):
         return OllamaChatLLM(
             model=ConfigV2.OLLAMA_MODEL,
             api_url=ConfigV2.OLLAMA_API_URL,
+            debug_sample_every=getattr(ConfigV2, "LLM_STREAM_DEBUG_SAMPLE", 0),
         )
     if not getattr(ConfigV2, "OPENAI_API_KEY", ""):
         raise HTTPException(status_code=400, detail="OPENAI_API_KEY chua co trong Config.py.")
@@ -78,6 +108,16 @@ def _make_llm_from_config():
 
 
 _MATCHER_SINGLETON: Optional[LabelSemanticMatcher] = None
+# Classifier per (mode, classifier model), built on first use: the cascade's escalation stats then
+# accumulate over every request instead of restarting with each document, and the trained head
+# (CLASSIFIER_MODE="head") is read from disk once.
+_CLASSIFIERS: Dict[Tuple[str, ...], Any] = {}
+_CLASSIFIERS_LOCK = threading.Lock()
+# Sequence smoother (SEQUENCE_SMOOTHING), loaded once: keeps the parsed prior and its log_probs cache.
+_SMOOTHER_CACHE: Dict[str, Optional[LabelSequenceSmoother]] = {}
+
+metrics.REGISTRY.register_collector(metrics.registry_cache_collector(lambda: get_registry(ConfigV2)))
+metrics.REGISTRY.register_collector(metrics.llm_pool_collector(shared_pools))
 
 
 def _load_label_matcher() -> LabelSemanticMatcher:
@@ -85,7 +125,11 @@ def _load_label_matcher() -> LabelSemanticMatcher:
     if _MATCHER_SINGLETON is not None:
         return _MATCHER_SINGLETON
     try:
-        index = LabelSemanticIndex.load(ConfigV2.FAISS_INDEX_PATH, ConfigV2.FAISS_METADATA_PATH)
+        index = LabelSemanticIndex.load(
+            ConfigV2.FAISS_INDEX_PATH,
+            ConfigV2.FAISS_METADATA_PATH,
+            mmap=getattr(ConfigV2, "FAISS_INDEX_MMAP", False),
+        )
     except FileNotFoundError as exc:
         raise HTTPException(
             status_code=500,
@@ -94,19 +138,36 @@ def _load_label_matcher() -> LabelSemanticMatcher:
                 "Vui long chuan bi mo ta nhan va chay `python -m finetune_v2.build_label_index`."
             ),
         ) from exc
-    embedder = SentenceTransformerEmbedder(
-        ConfigV2.EMBEDDING_MODEL_NAME,
-        device=ConfigV2.EMBEDDING_DEVICE,
-    )
+    embedder = SentenceTransformerEmbedder.from_config(ConfigV2)
     _MATCHER_SINGLETON = LabelSemanticMatcher(
         index=index,
         embedder=embedder,
         top_k=ConfigV2.SIMILARITY_TOP_K,
         threshold=ConfigV2.SIMILARITY_THRESHOLD,
+        neighbors=getattr(ConfigV2, "SIMILARITY_NEIGHBORS", None),
+        aggregation=getattr(ConfigV2, "SIMILARITY_AGGREGATION", "max"),
     )
     return _MATCHER_SINGLETON
 
 
+def _load_label_classifier(matcher: LabelSemanticMatcher, llm: Any) -> Optional[Any]:
+    mode = classifier_mode(ConfigV2)
+    # Only the cascade calls the LLM; the head and plain semantic matching do not depend on it.
+    key = (mode, type(llm).__name__, str(getattr(llm, "model", ""))) if mode == "cascade" else (mode,)
+    with _CLASSIFIERS_LOCK:
+        if key not in _CLASSIFIERS:
+            _CLASSIFIERS[key] = build_label_classifier(ConfigV2, matcher=matcher, classifier_llm=llm)
+        return _CLASSIFIERS[key]
+
+
+def _load_sequence_smoother() -> Optional[LabelSequenceSmoother]:
+    key = str(getattr(ConfigV2, "LABEL_TRANSITIONS_PATH", "")) if getattr(ConfigV2, "SEQUENCE_SMOOTHING", False) else ""
+    with _CLASSIFIERS_LOCK:
+        if key not in _SMOOTHER_CACHE:
+            _SMOOTHER_CACHE[key] = build_sequence_smoother(ConfigV2)
+        return _SMOOTHER_CACHE[key]
+
+
 def _resolve_docx_context(docx_path: Optional[str]) -> Tuple[str, Optional[Path], Optional[Tuple[object, List[ParagraphRecord]]]]:
     """
     Determine the working text along with optional DOCX context (document + paragraphs).
@@ -129,7 +190,51 @@ def _resolve_docx_context(docx_path: Optional[str]) -> Tuple[str, Optional[Path]
     return big_text, Path(ConfigV2.DOCUMENT), (document, paragraphs)
 
 
-def _run_pipeline(big_text: Optional[str], docx_path: Optional[str]) -> ProcessResponse:
+def _run_pipeline(
+    big_text: Optional[str],
+    docx_path: Optional[str],
+    *,
+    checkpoint: bool = False,
+    resume: Optional[bool] = None,
+) -> ProcessResponse:
+    sampler = get_shared_sampler(ConfigV2)
+    metrics.INFLIGHT.inc(api="v2")
+    status, chunks, failed, trace = "error", 0, 0, None
+    try:
+        with start_trace(
+            "process_document",
+            config=ConfigV2,
+            on_end=sampler.annotate if sampler is not None else None,
+            api="v2",
+        ) as trace:
+            response = _process_document(big_text, docx_path, checkpoint=checkpoint, resume=resume)
+        chunks, failed = len(response.audit), len(response.failed_chunks)
+        status = "partial" if failed else "ok"
+    except HTTPException as exc:
+        status = str(exc.status_code)
+        raise
+    finally:
+        metrics.INFLIGHT.dec(api="v2")
+        if trace is not None:
+            metrics.observe_document(trace, api="v2", status=status, chunks=chunks, failed=failed)
+    response.trace = trace.summary()
+    if sampler is not None:
+        response.trace["resources"] = sampler.summarize(trace.root.start_unix_ns, trace.root.end_unix_ns)
+    return response
+
+
+def _process_document(
+    big_text: Optional[str],
+    docx_path: Optional[str],
+    *,
+    checkpoint: bool = False,
+    resume: Optional[bool] = None,
+) -> ProcessResponse:
+    """
+    Run the semantic pipeline on one document. With `checkpoint`, finished
+    chunks are logged on disk (editor.checkpoint) and, when resuming, chunks
+    from an earlier interrupted run of the same document are reused.
+    """
     document_context: Optional[Tuple[object, List[ParagraphRecord]]] = None
     docx_output_path: Optional[Path] = None
 
@@ -144,24 +249,42 @@ def _run_pipeline(big_text: Optional[str], docx_path: Optional[str]) -> ProcessR
             resolved_path = Path(ConfigV2.DOCUMENT)
         ConfigV2.DOCUMENT = str(resolved_path)
 
-    registry = PromptRegistry.from_dict(ConfigV2.REGISTRY_DICT)
+    registry = get_registry(ConfigV2)
     matcher = _load_label_matcher()
 
     try:
         llm = _make_llm_from_config()
+        router = build_llm_router(ConfigV2, llm)
     except HTTPException:
         raise
     except Exception as exc:  # noqa: BLE001
         raise HTTPException(status_code=400, detail=f"Loi khoi tao LLM: {exc}") from exc
 
+    try:
+        classifier = _load_label_classifier(matcher, llm)
+        smoother = _load_sequence_smoother()
+    except (ValueError, FileNotFoundError) as exc:
+        # Thiếu/hỏng head hoặc prior, CLASSIFIER_MODE sai: lỗi cấu hình server, không phải lỗi request
+        raise HTTPException(status_code=500, detail=f"Loi cau hinh classifier: {exc}") from exc
+
     pipeline = SemanticEditorPipeline(
         editor_llm=llm,
         registry=registry,
         matcher=matcher,
+        classifier=classifier,
+        smoother=smoother,
+        router=router,
+        noop=build_noop_filter(ConfigV2, registry, router or llm),
     )
 
+    checkpoint_log = None
+    if checkpoint:
+        checkpoint_log = open_checkpoint(
+            working_text, pipeline="semantic", registry=registry, llm=router or llm, config=ConfigV2, resume=resume
+        )
+
     try:
-        final_text, results = pipeline.process(working_text)
+        final_text, results = pipeline.process(working_text, checkpoint=checkpoint_log)
     except Exception as exc:  # noqa: BLE001
         raise HTTPException(status_code=500, detail=f"Loi khi xu ly pipeline: {exc}") from exc
 
@@ -178,12 +301,22 @@ def _run_pipeline(big_text: Optional[str], docx_path: Optional[str]) -> ProcessR
             labels=result.labels,
             edit_prompt_ids=result.edit_prompt_ids,
             latency_ms=result.latency_ms,
+            timings_ms=result.timings_ms,
+            max_tokens=result.max_tokens,
+            truncated=result.truncated,
+            status=result.status,
+            error=result.error,
+            attempts=result.attempts,
+            resumed=result.resumed,
+            backend=result.backend,
+            skipped=result.skipped,
         )
         for result in results
     ]
     return ProcessResponse(
         final_text=final_text,
         audit=audit,
+        failed_chunks=[entry.chunk_id for entry in audit if entry.status == "failed"],
         docx_path=str(docx_output_path) if docx_output_path else None,
     )
 
@@ -215,13 +348,14 @@ def _validate_docx_download_path(raw_path: str) -> Path:
 # ================= Background job =================
 
 
-def run_default_pipeline_and_save_v2(job_id: str):
+def run_default_pipeline_and_save_v2(job_id: str, resume: Optional[bool] = None):
+    metrics.QUEUED.dec(api="v2")
     try:
         start = time.time()
         default_doc = getattr(ConfigV2, "DOCUMENT", "").strip()
         if not default_doc:
             raise RuntimeError("Config.DOCUMENT chua duoc cau hinh.")
-        result = _run_pipeline(None, default_doc)
+        result = _run_pipeline(None, default_doc, checkpoint=True, resume=resume)
         elapsed = round(time.time() - start, 2)
         data = {
             "status": "done",
@@ -247,6 +381,11 @@ def read_root_v2():
     return _run_pipeline(None, default_doc)
 
 
+@app_v2.get("/metrics", include_in_schema=False)
+def metrics_v2():
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
 @app_v2.get("/favicon.ico", include_in_schema=False)
 def favicon_placeholder_v2():
     return Response(status_code=204)
@@ -283,13 +422,20 @@ def process_default_v2():
 
 
 @app_v2.post("/process/default_async")
-def process_default_async_v2(background_tasks: BackgroundTasks):
+def process_default_async_v2(
+    background_tasks: BackgroundTasks,
+    resume: Optional[bool] = Query(
+        None,
+        description="Dung lai cac doan da xong cua lan chay truoc bi gian doan (mac dinh: Config.CHECKPOINT_RESUME).",
+    ),
+):
     default_doc = getattr(ConfigV2, "DOCUMENT", "").strip()
     if not default_doc:
         raise HTTPException(status_code=400, detail="Config.DOCUMENT chua duoc cau hinh.")
 
     job_id = str(uuid.uuid4())
-    background_tasks.add_task(run_default_pipeline_and_save_v2, job_id)
+    metrics.QUEUED.inc(api="v2")
+    background_tasks.add_task(run_default_pipeline_and_save_v2, job_id, resume)
     return {"job_id": job_id, "status": "processing"}
 
 
@@ -0,0 +1,2 @@
+# -*- coding: utf-8 -*-
+"""Benchmark scripts (run from the repository root with `python -m benchmarks.<name>`)."""
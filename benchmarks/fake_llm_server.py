@@ -0,0 +1,571 @@
+# -*- coding: utf-8 -*-
+"""
+Deterministic stand-in LLM server for benchmarks.
+
+Speaks the two APIs the adapters in editor.llm call:
+
+- POST /api/generate          (Ollama; NDJSON stream unless "stream": false)
+- POST /v1/chat/completions   (OpenAI Chat Completions; SSE when "stream": true)
+- GET  /stats, POST /stats/reset  (request counts, status codes, drops, peak concurrency)
+- GET  /api/tags, /v1/models     (health checks; always 200, not counted)
+
+Answers are derived from the prompt only, so the same input always yields the
+same output: classifier prompts (the ones listing "Danh sách nhãn cho phép")
+get a JSON array with one allowed label (`{"labels": [...]}` when the request
+asks for JSON output via Ollama `format` / OpenAI `response_format`), every
+other prompt gets the paragraph back ("Doan van:" block of the editor user
+message). Ollama `options.num_predict` / OpenAI `max_tokens` cut the answer
+and report `done_reason` / `finish_reason` "length". Timing follows a
+time-to-first-token distribution plus a fixed token rate, sampled from an RNG
+seeded by (seed, prompt), so latency is reproducible too.
+
+For load tests it can also inject 429s, 5xx errors and dropped connections
+(seeded by request number, so retries see fresh draws), cap concurrent
+requests (queue like Ollama or reject with 429/503), and replay a per-request
+script, e.g. `[{"status": 429}, {"ttft": 2.0}, {"drop_after": 3}]`.
+
+Run standalone:
+    python -m benchmarks.fake_llm_server --port 11500 --ttft lognormal:-2.3,0.5 --tokens-per-s 40
+    python -m benchmarks.fake_llm_server --error-429 0.05 --error-5xx 0.02 --drop-rate 0.01 --max-concurrency 2
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import math
+import random
+import re
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+_LABEL_LIST_MARKER = "Danh sách nhãn cho phép"
+_PARAGRAPH_MARKER = "Doan van:\n"
+
+
+@dataclass
+class LatencyModel:
+    """
+    Time-to-first-token distribution, parsed from "kind:args":
+
+    - "const:0.2"               always 0.2 s
+    - "uniform:0.1,0.5"         uniform between 0.1 and 0.5 s
+    - "lognormal:-2.3,0.5"      exp(N(mu, sigma)) seconds (long right tail)
+    """
+
+    kind: str = "const"
+    params: Tuple[float, ...] = (0.0,)
+
+    @classmethod
+    def parse(cls, spec: str) -> "LatencyModel":
+        kind, _, raw = (spec or "const:0").partition(":")
+        kind = kind.strip().lower()
+        params = tuple(float(part) for part in raw.split(",") if part.strip()) or (0.0,)
+        expected = {"const": 1, "uniform": 2, "lognormal": 2}
+        if kind not in expected or len(params) != expected[kind]:
+            raise ValueError(f"Invalid latency spec '{spec}' (const:S | uniform:A,B | lognormal:MU,SIGMA)")
+        return cls(kind, params)
+
+    def sample(self, rng: random.Random) -> float:
+        if self.kind == "uniform":
+            return rng.uniform(*self.params)
+        if self.kind == "lognormal":
+            return math.exp(rng.gauss(*self.params))
+        return self.params[0]
+
+
+@dataclass
+class ScriptStep:
+    """
+    Per-request override, consumed in request order from `FakeLLMConfig.script`.
+
+    Unset fields fall back to the server-wide settings. `status` answers with
+    that HTTP error instead of a completion; `drop_after` closes the connection
+    after that many streamed tokens (0 = before any body).
+    """
+
+    ttft: Optional[float] = None
+    tokens_per_s: Optional[float] = None
+    status: Optional[int] = None
+    drop_after: Optional[int] = None
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ScriptStep":
+        unknown = set(data) - {"ttft", "tokens_per_s", "status", "drop_after"}
+        if unknown:
+            raise ValueError(f"Unknown script keys: {sorted(unknown)}")
+        return cls(**data)
+
+
+@dataclass
+class FakeLLMConfig:
+    ttft: LatencyModel = field(default_factory=LatencyModel)
+    tokens_per_s: float = 0.0   # 0 → stream every token immediately
+    seed: int = 0
+    # Error injection (probabilities per request, drawn from a seeded RNG).
+    rate_429: float = 0.0
+    rate_5xx: float = 0.0
+    drop_rate: float = 0.0      # close the connection mid-response
+    # Concurrency limit: 0 = unlimited. "queue" waits for a slot (like Ollama's
+    # request queue); "reject" answers 429 (OpenAI) / 503 (Ollama) when full.
+    max_concurrency: int = 0
+    overload: str = "queue"
+    script: List[ScriptStep] = field(default_factory=list)
+    script_loop: bool = False
+
+
+def load_script(path: str) -> Tuple[List[ScriptStep], bool]:
+    """Read a script file: a JSON list of steps, or {"steps": [...], "loop": true}."""
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    loop = False
+    if isinstance(data, dict):
+        loop = bool(data.get("loop", False))
+        data = data.get("steps", [])
+    return [ScriptStep.from_dict(step) for step in data], loop
+
+
+@dataclass
+class _RequestPlan:
+    ttft: float
+    tokens_per_s: float
+    status: Optional[int] = None
+    drop_after: Optional[int] = None
+    json_output: bool = False
+    max_tokens: Optional[int] = None
+    truncated: bool = False
+
+    @property
+    def finish_reason(self) -> str:
+        return "length" if self.truncated else "stop"
+
+
+def _rng_for(seed: int, prompt: str) -> random.Random:
+    digest = hashlib.sha1(f"{seed}\x00{prompt}".encode("utf-8")).digest()
+    return random.Random(int.from_bytes(digest[:8], "big"))
+
+
+def fake_completion(prompt: str, json_output: bool = False) -> str:
+    """Deterministic answer for a classifier or editor prompt."""
+    if _LABEL_LIST_MARKER in prompt:
+        section = prompt.split(_LABEL_LIST_MARKER, 1)[1]
+        labels = re.findall(r"^- (.+)$", section, flags=re.MULTILINE)
+        picked = []
+        if labels:
+            text = section.rsplit("\n\n", 1)[-1]
+            pick = int(hashlib.sha1(text.encode("utf-8")).hexdigest(), 16) % len(labels)
+            picked = [labels[pick].strip()]
+        return json.dumps({"labels": picked} if json_output else picked, ensure_ascii=False)
+    if _PARAGRAPH_MARKER in prompt:
+        return prompt.split(_PARAGRAPH_MARKER, 1)[1].strip()
+    return prompt.rsplit("\n\n", 1)[-1].strip()
+
+
+def _tokens(text: str) -> List[str]:
+    # Word pieces keep their trailing whitespace so "".join(tokens) == text.
+    return re.findall(r"\S+\s*|\s+", text) or [""]
+
+
+class _DroppedConnection(Exception):
+    """Raised inside a handler to cut the response short (injected failure)."""
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: "FakeLLMServer"
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):  # noqa: A002 - signature from BaseHTTPRequestHandler
+        return
+
+    def _read_json(self) -> dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length).decode("utf-8") or "{}")
+
+    def _send_json(self, status: int, payload: dict, headers: Optional[Dict[str, str]] = None) -> None:
+        self._send_body(status, json.dumps(payload, ensure_ascii=False).encode("utf-8"), headers)
+
+    def _send_body(
+        self, status: int, body: bytes, headers: Optional[Dict[str, str]] = None, *, write_body: bool = True
+    ) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        if write_body:
+            self.wfile.write(body)
+
+    def _send_error(self, status: int, api: str) -> None:
+        self.server.record("status", status)
+        headers = {"Retry-After": "1"} if status in (429, 503) else None
+        message = "rate limit exceeded" if status == 429 else f"injected error {status}"
+        if api == "openai":
+            kind = "rate_limit_error" if status == 429 else "server_error"
+            payload = {"error": {"message": message, "type": kind, "code": status}}
+        else:
+            payload = {"error": message}
+        self._send_json(status, payload, headers)
+
+    def _drop(self, partial: bytes = b"") -> None:
+        # Send part of the body (or nothing), then let the server close the socket.
+        if partial:
+            self.wfile.write(partial)
+            self.wfile.flush()
+        self.close_connection = True
+        raise _DroppedConnection()
+
+    def _timed_tokens(self, prompt: str, plan: _RequestPlan) -> Iterator[str]:
+        time.sleep(max(0.0, plan.ttft))
+        delay = 1.0 / plan.tokens_per_s if plan.tokens_per_s > 0 else 0.0
+        tokens = _tokens(fake_completion(prompt, plan.json_output))
+        if plan.max_tokens is not None and len(tokens) > plan.max_tokens:
+            tokens, plan.truncated = tokens[: plan.max_tokens], True
+        for i, token in enumerate(tokens):
+            if plan.drop_after is not None and i >= plan.drop_after:
+                self._drop()
+            if i and delay:
+                time.sleep(delay)
+            yield token
+
+    def do_GET(self):  # noqa: N802 - http.server naming
+        path = self.path.rstrip("/")
+        if path == "/stats":
+            self._send_json(200, self.server.stats())
+        elif path == "/api/tags":
+            self._send_json(200, {"models": [{"name": "fake"}]})
+        elif path == "/v1/models":
+            self._send_json(200, {"object": "list", "data": [{"id": "fake", "object": "model"}]})
+        else:
+            self._send_json(404, {"error": f"unknown path {self.path}"})
+
+    def do_POST(self):  # noqa: N802 - http.server naming
+        path = self.path.rstrip("/")
+        if path == "/stats/reset":
+            self.server.reset_stats()
+            self._send_json(200, self.server.stats())
+            return
+        api = {"/api/generate": "ollama", "/v1/chat/completions": "openai"}.get(path)
+        if api is None:
+            self._send_json(404, {"error": f"unknown path {self.path}"})
+            return
+        try:
+            payload = self._read_json()
+        except ValueError:
+            self._send_json(400, {"error": "invalid JSON"})
+            return
+
+        if api == "openai":
+            messages = payload.get("messages") or []
+            prompt = "\n\n".join(str(m.get("content", "")) for m in messages)
+        else:
+            prompt = str(payload.get("prompt", ""))
+        plan = self.server.plan_request(prompt)
+        plan.json_output = bool(payload.get("format") or payload.get("response_format"))
+        max_tokens = payload.get("max_tokens") or (payload.get("options") or {}).get("num_predict")
+        plan.max_tokens = int(max_tokens) if max_tokens else None
+
+        if not self.server.acquire_slot():
+            self._send_error(429 if api == "openai" else 503, api)
+            return
+        try:
+            if plan.status is not None:
+                self._send_error(plan.status, api)
+                return
+            stream = bool(payload.get("stream", api == "ollama"))
+            model = payload.get("model", "fake")
+            if api == "openai":
+                self._openai_chat(prompt, model, stream, plan)
+            else:
+                self._ollama_generate(prompt, model, stream, plan)
+            self.server.record("status", 200)
+        except _DroppedConnection:
+            self.server.record("dropped")
+        except (BrokenPipeError, ConnectionResetError):
+            self.server.record("client_disconnects")
+        finally:
+            self.server.release_slot()
+
+    def _start_chunked(self, content_type: str) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+    def _write_chunk(self, line: str) -> None:
+        data = line.encode("utf-8")
+        self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def _end_chunked(self) -> None:
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    def _send_whole(self, prompt: str, plan: _RequestPlan, build: Any) -> None:
+        # Non-streaming: generate everything first. A drop cuts the JSON body in half,
+        # or sends no body at all for drop_after=0 (as a stream dropped before its first token).
+        drop_after, plan.drop_after = plan.drop_after, None
+        text = "".join(self._timed_tokens(prompt, plan))
+        body = json.dumps(build(text), ensure_ascii=False).encode("utf-8")
+        if drop_after is None:
+            self._send_body(200, body)
+            return
+        self._send_body(200, body, write_body=False)
+        self._drop(body[: len(body) // 2] if drop_after > 0 else b"")
+
+    def _ollama_generate(self, prompt: str, model: str, stream: bool, plan: _RequestPlan) -> None:
+        if not stream:
+            self._send_whole(
+                prompt,
+                plan,
+                lambda text: {
+                    "model": model,
+                    "response": text,
+                    "done": True,
+                    "done_reason": plan.finish_reason,
+                    "prompt_eval_count": len(_tokens(prompt)),
+                    "eval_count": len(_tokens(text)),
+                },
+            )
+            return
+        self._start_chunked("application/x-ndjson")
+        eval_count = 0
+        for token in self._timed_tokens(prompt, plan):
+            eval_count += 1
+            self._write_chunk(json.dumps({"model": model, "response": token, "done": False}, ensure_ascii=False) + "\n")
+        done = {
+            "model": model,
+            "response": "",
+            "done": True,
+            "done_reason": plan.finish_reason,
+            "prompt_eval_count": len(_tokens(prompt)),
+            "eval_count": eval_count,
+        }
+        self._write_chunk(json.dumps(done) + "\n")
+        self._end_chunked()
+
+    def _openai_chat(self, prompt: str, model: str, stream: bool, plan: _RequestPlan) -> None:
+        if not stream:
+            self._send_whole(
+                prompt,
+                plan,
+                lambda text: {
+                    "id": "chatcmpl-fake",
+                    "object": "chat.completion",
+                    "model": model,
+                    "choices": [
+                        {"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": plan.finish_reason}
+                    ],
+                    "usage": {"prompt_tokens": len(_tokens(prompt)), "completion_tokens": len(_tokens(text))},
+                },
+            )
+            return
+
+        def event(delta: Dict[str, str], finish_reason: Optional[str]) -> str:
+            chunk = {
+                "id": "chatcmpl-fake",
+                "object": "chat.completion.chunk",
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }
+            return f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+
+        self._start_chunked("text/event-stream")
+        self._write_chunk(event({"role": "assistant"}, None))
+        for token in self._timed_tokens(prompt, plan):
+            self._write_chunk(event({"content": token}, None))
+        self._write_chunk(event({}, plan.finish_reason))
+        self._write_chunk("data: [DONE]\n\n")
+        self._end_chunked()
+
+
+class FakeLLMServer(ThreadingHTTPServer):
+    """Threaded HTTP server; use `start()` to serve from a background thread."""
+
+    daemon_threads = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, config: Optional[FakeLLMConfig] = None):
+        super().__init__((host, port), _Handler)
+        self.config = config or FakeLLMConfig()
+        if self.config.overload not in ("queue", "reject"):
+            raise ValueError("overload must be 'queue' or 'reject'")
+        self._lock = threading.Lock()
+        self._slots = (
+            threading.BoundedSemaphore(self.config.max_concurrency) if self.config.max_concurrency > 0 else None
+        )
+        self._thread: Optional[threading.Thread] = None
+        self.reset_stats()
+
+    # --- request planning / accounting ----------------------------------
+
+    def plan_request(self, prompt: str) -> _RequestPlan:
+        """Decide latency and injected failures for the next request."""
+        config = self.config
+        with self._lock:
+            request_no = self._stats["requests"]
+            self._stats["requests"] += 1
+        plan = _RequestPlan(ttft=config.ttft.sample(_rng_for(config.seed, prompt)), tokens_per_s=config.tokens_per_s)
+
+        if config.script and (config.script_loop or request_no < len(config.script)):
+            step = config.script[request_no % len(config.script)]
+            if step.ttft is not None:
+                plan.ttft = step.ttft
+            if step.tokens_per_s is not None:
+                plan.tokens_per_s = step.tokens_per_s
+            plan.status, plan.drop_after = step.status, step.drop_after
+            return plan
+
+        # Failures depend on the request number, not the prompt, so a retry can succeed.
+        rng = random.Random(config.seed * 1_000_003 + request_no)
+        roll = rng.random()
+        if roll < config.rate_429:
+            plan.status = 429
+        elif roll < config.rate_429 + config.rate_5xx:
+            plan.status = rng.choice((500, 502, 503))
+        elif rng.random() < config.drop_rate:
+            plan.drop_after = rng.randint(0, max(0, len(_tokens(fake_completion(prompt))) - 1))
+        return plan
+
+    def acquire_slot(self) -> bool:
+        if self._slots is not None:
+            blocking = self.config.overload == "queue"
+            if not self._slots.acquire(blocking=blocking):
+                self.record("rejected")
+                return False
+        with self._lock:
+            self._stats["in_flight"] += 1
+            self._stats["peak_in_flight"] = max(self._stats["peak_in_flight"], self._stats["in_flight"])
+        return True
+
+    def release_slot(self) -> None:
+        with self._lock:
+            self._stats["in_flight"] -= 1
+        if self._slots is not None:
+            self._slots.release()
+
+    def record(self, key: str, status: Optional[int] = None) -> None:
+        with self._lock:
+            if status is not None:
+                statuses = self._stats["statuses"]
+                statuses[str(status)] = statuses.get(str(status), 0) + 1
+            else:
+                self._stats[key] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot["statuses"] = dict(self._stats["statuses"])
+        return snapshot
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self._stats: Dict[str, Any] = {
+                "requests": 0,
+                "statuses": {},
+                "dropped": 0,
+                "rejected": 0,
+                "client_disconnects": 0,
+                "in_flight": 0,
+                "peak_in_flight": 0,
+            }
+
+    @property
+    def requests_served(self) -> int:
+        return self._stats["requests"]
+
+    # --- lifecycle --------------------------------------------------------
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def ollama_url(self) -> str:
+        return f"{self.base_url}/api/generate"
+
+    @property
+    def openai_url(self) -> str:
+        return f"{self.base_url}/v1/chat/completions"
+
+    def handle_error(self, request, client_address) -> None:
+        # Clients closing idle keep-alive connections are normal under load; report anything else.
+        if isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+            return
+        super().handle_error(request, client_address)
+
+    def start(self) -> "FakeLLMServer":
+        self._thread = threading.Thread(target=self.serve_forever, name="fake-llm", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def __enter__(self) -> "FakeLLMServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+def add_server_arguments(parser: argparse.ArgumentParser) -> None:
+    """Latency / failure / concurrency flags shared with pipeline_bench."""
+    parser.add_argument("--ttft", default="const:0.05", help="time-to-first-token: const:S | uniform:A,B | lognormal:MU,SIGMA")
+    parser.add_argument("--tokens-per-s", type=float, default=50.0, help="streaming rate after the first token (0 = instant)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--error-429", type=float, default=0.0, metavar="P", help="probability of a 429 per request")
+    parser.add_argument("--error-5xx", type=float, default=0.0, metavar="P", help="probability of a 500/502/503 per request")
+    parser.add_argument("--drop-rate", type=float, default=0.0, metavar="P", help="probability of cutting a response short")
+    parser.add_argument("--max-concurrency", type=int, default=0, help="simultaneous requests served (0 = unlimited)")
+    parser.add_argument("--overload", choices=("queue", "reject"), default="queue", help="behaviour when the limit is hit")
+    parser.add_argument("--script", default=None, metavar="JSON", help="per-request script (see ScriptStep)")
+
+
+def config_from_args(args: argparse.Namespace) -> FakeLLMConfig:
+    script, loop = load_script(args.script) if args.script else ([], False)
+    return FakeLLMConfig(
+        ttft=LatencyModel.parse(args.ttft),
+        tokens_per_s=args.tokens_per_s,
+        seed=args.seed,
+        rate_429=args.error_429,
+        rate_5xx=args.error_5xx,
+        drop_rate=args.drop_rate,
+        max_concurrency=args.max_concurrency,
+        overload=args.overload,
+        script=script,
+        script_loop=loop,
+    )
+
+
+def parse_args(argv: Optional[Sequence[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Deterministic Ollama/OpenAI stand-in for benchmarks and load tests.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11500)
+    add_server_arguments(parser)
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    args = parse_args(argv)
+    server = FakeLLMServer(args.host, args.port, config_from_args(args))
+    print(f"[fake_llm_server] Ollama: {server.ollama_url}  OpenAI: {server.openai_url}  stats: {server.base_url}/stats")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
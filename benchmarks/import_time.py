@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+Import-time benchmark for the editor / finetune_v2 packages.
+
+Each target is imported in a fresh interpreter (so nothing is cached in
+sys.modules) several times; the median wall time is compared with a budget and
+the heavy libraries that got pulled in are listed. The script exits with code 1
+when a target is over budget or imports a forbidden module, so it can guard
+startup time in CI:
+
+    python -m benchmarks.import_time
+    python -m benchmarks.import_time --repeat 10 --json
+    python -m benchmarks.import_time --target finetune_v2.pipeline=0.5
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import List, Optional, Sequence
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+
+# Thư viện nặng không được phép nạp chỉ vì import package.
+HEAVY_MODULES = ("torch", "faiss", "sentence_transformers", "transformers", "onnxruntime")
+
+# (target, budget in seconds, forbidden heavy modules)
+DEFAULT_TARGETS = (
+    ("editor", 0.3, HEAVY_MODULES + ("docx", "requests")),
+    ("finetune_v2", 0.3, HEAVY_MODULES + ("docx", "requests")),
+    ("editor.pipeline", 0.5, HEAVY_MODULES),
+    ("finetune_v2.pipeline", 0.8, HEAVY_MODULES),
+    ("finetune_v2.label_matcher", 0.5, HEAVY_MODULES),
+    ("finetune_v2.build_label_index", 0.8, HEAVY_MODULES),
+    ("receive_docx_server_V2", 1.0, HEAVY_MODULES),
+    ("api_v2", 1.5, HEAVY_MODULES),
+)
+
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {target}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"elapsed": elapsed, "modules": sorted(sys.modules)}}))
+"""
+
+
+@dataclass
+class ImportResult:
+    target: str
+    budget_s: float
+    median_s: float
+    runs_s: List[float] = field(default_factory=list)
+    heavy_loaded: List[str] = field(default_factory=list)
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None and not self.heavy_loaded and self.median_s <= self.budget_s
+
+
+def measure(target: str, budget: float, forbidden: Sequence[str], repeat: int) -> ImportResult:
+    runs: List[float] = []
+    loaded: set = set()
+    for _ in range(repeat):
+        proc = subprocess.run(
+            [sys.executable, "-c", _PROBE.format(target=target)],
+            cwd=str(ROOT_DIR),
+            capture_output=True,
+            text=True,
+            encoding="utf-8",
+        )
+        if proc.returncode != 0:
+            tail = (proc.stderr or "").strip().splitlines()[-1:] or ["unknown error"]
+            return ImportResult(target, budget, float("nan"), runs, [], tail[0])
+        payload = json.loads(proc.stdout.strip().splitlines()[-1])
+        runs.append(payload["elapsed"])
+        modules = set(payload["modules"])
+        loaded.update(name for name in forbidden if name in modules)
+    return ImportResult(target, budget, statistics.median(runs), runs, sorted(loaded))
+
+
+def _parse_target(raw: str) -> tuple:
+    name, _, budget = raw.partition("=")
+    return name.strip(), float(budget) if budget else 1.0, HEAVY_MODULES
+
+
+def parse_args(argv: Optional[Sequence[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Measure cold import time of the editor packages.")
+    parser.add_argument("--repeat", type=int, default=5, help="fresh interpreters per target (default: 5)")
+    parser.add_argument(
+        "--target",
+        action="append",
+        default=[],
+        metavar="MODULE[=BUDGET_S]",
+        help="measure only these modules (repeatable); default: the built-in list",
+    )
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    args = parse_args(argv)
+    targets = [_parse_target(raw) for raw in args.target] or list(DEFAULT_TARGETS)
+    results = [measure(name, budget, forbidden, max(1, args.repeat)) for name, budget, forbidden in targets]
+
+    if args.json:
+        print(json.dumps([dict(asdict(r), ok=r.ok) for r in results], ensure_ascii=False, indent=2))
+    else:
+        print(f"{'target':<32} {'median':>8} {'budget':>8}  status")
+        for r in results:
+            status = "OK" if r.ok else "FAIL"
+            if r.error:
+                status += f" ({r.error})"
+            elif r.heavy_loaded:
+                status += f" (loaded: {', '.join(r.heavy_loaded)})"
+            print(f"{r.target:<32} {r.median_s:>7.3f}s {r.budget_s:>7.2f}s  {status}")
+    return 0 if all(r.ok for r in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,456 @@
+# -*- coding: utf-8 -*-
+"""
+End-to-end benchmark for EditorPipeline, SemanticEditorPipeline and the
+FastAPI apps, against the deterministic stand-in LLM in fake_llm_server.
+
+For every (target, size) the suite processes `--docs` synthetic bulletins of
+`size` paragraphs, `--concurrency` documents at a time, and reports
+throughput, p50/p95/p99 document latency, LLM calls and memory (RSS).
+
+Targets:
+    editor    EditorPipeline (LLM classifier + LLM editor)
+    semantic  SemanticEditorPipeline (FAISS classifier + LLM editor)
+    api       POST /process on api.app        (in-process, via TestClient)
+    api_v2    POST /process on api_v2.app_v2  (in-process, via TestClient)
+
+Examples:
+    python -m benchmarks.pipeline_bench --targets editor --sizes 10,100,1000
+    python -m benchmarks.pipeline_bench --targets semantic,api_v2 --embedding-model /models/bi-encoder
+    python -m benchmarks.pipeline_bench --ttft lognormal:-2.3,0.5 --tokens-per-s 40 --concurrency 4 --json
+    python -m benchmarks.pipeline_bench --error-429 0.05 --drop-rate 0.01 --max-concurrency 2
+    python -m benchmarks.pipeline_bench --targets semantic --route-model fake-small
+    python -m benchmarks.pipeline_bench --pool 3 --pool-dead 1 --concurrency 4
+    python -m benchmarks.pipeline_bench --targets editor,semantic --docs 5 --noop
+
+The semantic targets load the FAISS index from Config. `--embedding-model`
+instead embeds Config.LABEL_DESCRIPTIONS_PATH with that model into an
+in-memory index (useful on machines without the production model).
+"""
+
+from __future__ import annotations
+
+import argparse
+import contextlib
+import json
+import logging
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Callable, List, Optional, Sequence
+
+try:
+    import psutil  # type: ignore
+except ImportError:  # pragma: no cover
+    psutil = None
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - Windows
+    resource = None
+
+from editor import Config
+
+from .fake_llm_server import FakeLLMServer, add_server_arguments, config_from_args
+from .synthetic import make_bulletin
+
+LLM_LOGGER_NAME = "editor.llm"  # editor.llm.LOGGER_NAME, kept literal so --help stays import-light
+
+TARGETS = ("editor", "semantic", "api", "api_v2")
+
+
+@dataclass
+class BenchResult:
+    target: str
+    paragraphs: int
+    docs: int
+    failed_docs: int
+    concurrency: int
+    wall_s: float
+    docs_per_s: float
+    paragraphs_per_s: float
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    llm_calls: int
+    llm_errors: int
+    rss_mb: float
+    peak_rss_mb: float
+
+
+def percentile(values: Sequence[float], q: float) -> float:
+    """Linear-interpolated percentile (q in 0..100)."""
+    ordered = sorted(values)
+    if not ordered:
+        return float("nan")
+    pos = (len(ordered) - 1) * q / 100.0
+    low = int(pos)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (pos - low)
+
+
+def _rss_mb() -> float:
+    if psutil is not None:
+        return psutil.Process().memory_info().rss / (1024 * 1024)
+    return float("nan")
+
+
+def _peak_rss_mb() -> float:
+    if resource is None:
+        return float("nan")
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KiB on Linux, bytes on macOS.
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _make_llm(server: FakeLLMServer, backend: str):
+    from editor.llm import OllamaChatLLM, OpenAIChatLLM
+    from editor.llm_pool import get_shared_pool
+
+    pool = get_shared_pool(Config)  # --pool: Config.LLM_POOL lists every fake server
+    if pool is not None:
+        return pool
+    if backend == "openai":
+        return OpenAIChatLLM(model="fake", api_key="bench", api_url=server.openai_url)
+    return OllamaChatLLM(model="fake", api_url=server.ollama_url)
+
+
+def _point_config_at(server: FakeLLMServer, backend: str) -> None:
+    # Config is what api.py / api_v2.py read when they build their LLM per request.
+    Config.USE_OLLAMA = backend != "openai"
+    Config.OLLAMA_MODEL = "fake"
+    Config.OLLAMA_API_URL = server.ollama_url
+    Config.OPENAI_MODEL = "fake"
+    Config.OPENAI_API_KEY = "bench"
+    Config.OPENAI_API_URL = server.openai_url
+
+
+def build_matcher(embedding_model: Optional[str] = None):
+    """Semantic matcher from the Config index, or an in-memory one for `embedding_model`."""
+    from finetune_v2.label_matcher import (
+        LabelSemanticIndex,
+        LabelSemanticMatcher,
+        SentenceTransformerEmbedder,
+        build_index_from_descriptions,
+    )
+
+    if embedding_model:
+        from finetune_v2.build_label_index import _load_descriptions
+
+        embedder = SentenceTransformerEmbedder(embedding_model, device="cpu")
+        descriptions = _load_descriptions(Config.LABEL_DESCRIPTIONS_PATH, None)
+        index, entries = build_index_from_descriptions(descriptions, embedder)
+        label_index = LabelSemanticIndex(index, entries, embedding_model=embedding_model)
+    else:
+        label_index = LabelSemanticIndex.load(
+            Config.FAISS_INDEX_PATH,
+            Config.FAISS_METADATA_PATH,
+            mmap=getattr(Config, "FAISS_INDEX_MMAP", False),
+        )
+        embedder = SentenceTransformerEmbedder.from_config(Config)
+    return LabelSemanticMatcher(
+        index=label_index,
+        embedder=embedder,
+        top_k=getattr(Config, "SIMILARITY_TOP_K", 1),
+        threshold=getattr(Config, "SIMILARITY_THRESHOLD", None),
+        neighbors=getattr(Config, "SIMILARITY_NEIGHBORS", None),
+        aggregation=getattr(Config, "SIMILARITY_AGGREGATION", "max"),
+    )
+
+
+def make_runner(target: str, server: FakeLLMServer, backend: str, matcher: Any) -> Callable[[str], Any]:
+    """Return a callable that processes one big_text end to end for `target`."""
+    from editor.noop import build_noop_filter
+    from editor.registry_loader import get_registry
+    from editor.routing import build_llm_router
+
+    if target == "editor":
+        from editor.pipeline import EditorPipeline
+
+        def run_editor(big_text: str):
+            llm = _make_llm(server, backend)
+            registry = get_registry()
+            router = build_llm_router(Config, llm)
+            return EditorPipeline(
+                classifier_llm=llm,
+                editor_llm=llm,
+                registry=registry,
+                router=router,
+                noop=build_noop_filter(Config, registry, router or llm),
+            ).process(big_text)
+
+        return run_editor
+
+    if target == "semantic":
+        from finetune_v2.pipeline import SemanticEditorPipeline
+
+        from finetune_v2.cascade import build_label_classifier
+        from finetune_v2.sequence import build_sequence_smoother
+
+        smoother = build_sequence_smoother(Config)
+
+        def run_semantic(big_text: str):
+            llm = _make_llm(server, backend)
+            registry = get_registry()
+            router = build_llm_router(Config, llm)
+            pipeline = SemanticEditorPipeline(
+                editor_llm=llm,
+                registry=registry,
+                matcher=matcher,
+                classifier=build_label_classifier(Config, matcher=matcher, classifier_llm=llm),
+                smoother=smoother,
+                router=router,
+                noop=build_noop_filter(Config, registry, router or llm),
+            )
+            return pipeline.process(big_text)
+
+        return run_semantic
+
+    from fastapi.testclient import TestClient
+
+    _point_config_at(server, backend)
+    if target == "api":
+        import api
+
+        client = TestClient(api.app)
+    else:
+        import api_v2
+
+        # Reuse the benchmark's matcher instead of loading the index per app.
+        api_v2._MATCHER_SINGLETON = matcher
+        client = TestClient(api_v2.app_v2)
+
+    def run_api(big_text: str):
+        response = client.post("/process", json={"big_text": big_text})
+        response.raise_for_status()
+        return response.json()
+
+    return run_api
+
+
+def run_case(
+    target: str,
+    runner: Callable[[str], Any],
+    paragraphs: int,
+    docs: int,
+    concurrency: int,
+    seed: int,
+    server: FakeLLMServer,
+    replicas: Sequence[FakeLLMServer] = (),
+) -> BenchResult:
+    texts = [make_bulletin(paragraphs, seed=seed + i) for i in range(docs)]
+    latencies: List[float] = []
+    failures: List[str] = []
+
+    def one(text: str) -> None:
+        start = time.perf_counter()
+        try:
+            runner(text)
+        except Exception as exc:  # noqa: BLE001 - injected LLM failures surface here
+            failures.append(f"{type(exc).__name__}: {exc}")
+            return
+        latencies.append((time.perf_counter() - start) * 1000.0)
+
+    servers = [server, *replicas]
+    for item in servers:
+        item.reset_stats()
+    wall_start = time.perf_counter()
+    if concurrency <= 1:
+        for text in texts:
+            one(text)
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(one, texts))
+    wall = time.perf_counter() - wall_start
+    stats = _merge_stats([item.stats() for item in servers])
+    ok_docs = len(latencies)
+
+    return BenchResult(
+        target=target,
+        paragraphs=paragraphs,
+        docs=docs,
+        failed_docs=len(failures),
+        concurrency=concurrency,
+        wall_s=round(wall, 3),
+        docs_per_s=round(ok_docs / wall, 3) if wall else float("inf"),
+        paragraphs_per_s=round(ok_docs * paragraphs / wall, 1) if wall else float("inf"),
+        p50_ms=round(percentile(latencies, 50), 1),
+        p95_ms=round(percentile(latencies, 95), 1),
+        p99_ms=round(percentile(latencies, 99), 1),
+        llm_calls=stats["requests"],
+        # Count failures directly: a 200 is recorded after the last byte is sent and can land after reset_stats().
+        llm_errors=sum(n for code, n in stats["statuses"].items() if code != "200") + stats.get("dropped", 0),
+        rss_mb=round(_rss_mb(), 1),
+        peak_rss_mb=round(_peak_rss_mb(), 1),
+    )
+
+
+def _merge_stats(snapshots: Sequence[dict]) -> dict:
+    merged = {"requests": 0, "dropped": 0, "statuses": {}}
+    for snapshot in snapshots:
+        merged["requests"] += snapshot["requests"]
+        merged["dropped"] += snapshot.get("dropped", 0)
+        for code, count in snapshot["statuses"].items():
+            merged["statuses"][code] = merged["statuses"].get(code, 0) + count
+    return merged
+
+
+def _pool_specs(servers: Sequence[FakeLLMServer], backend: str, dead: int) -> List[dict]:
+    specs = [
+        {
+            "name": f"fake{index}",
+            "provider": backend,
+            "model": "fake",
+            "api_url": item.openai_url if backend == "openai" else item.ollama_url,
+            "api_key": "bench",
+        }
+        for index, item in enumerate(servers)
+    ]
+    for index in range(dead):
+        # Port 9 (discard) on localhost: connections are refused, so the pool must fail over.
+        path = "/v1/chat/completions" if backend == "openai" else "/api/generate"
+        specs.append({"name": f"dead{index}", "provider": backend, "model": "fake", "api_url": f"http://127.0.0.1:9{path}"})
+    return specs
+
+
+@contextlib.contextmanager
+def _llm_log_sink(show: bool):
+    # The adapters log one line per call (and retries); silence them unless asked to keep them.
+    logger = logging.getLogger(LLM_LOGGER_NAME)
+    previous = logger.level
+    if not show:
+        logger.setLevel(logging.CRITICAL)
+    try:
+        yield
+    finally:
+        logger.setLevel(previous)
+
+
+def _csv_ints(raw: str) -> List[int]:
+    return [int(part) for part in raw.split(",") if part.strip()]
+
+
+def parse_args(argv: Optional[Sequence[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="End-to-end pipeline benchmark with a fake LLM server.")
+    parser.add_argument("--targets", default="editor", help=f"comma-separated subset of {','.join(TARGETS)}")
+    parser.add_argument("--sizes", default="10,100,1000", help="paragraphs per document (comma-separated)")
+    parser.add_argument("--docs", type=int, default=3, help="documents per size (default: 3)")
+    parser.add_argument("--concurrency", type=int, default=1, help="documents processed in parallel")
+    parser.add_argument("--backend", choices=("ollama", "openai"), default="ollama", help="LLM adapter to exercise")
+    add_server_arguments(parser)
+    parser.set_defaults(ttft="const:0.002", tokens_per_s=0.0)
+    parser.add_argument("--embedding-model", default=None, help="build an in-memory label index with this model")
+    parser.add_argument(
+        "--classifier",
+        choices=("semantic", "cascade", "head"),
+        default=None,
+        help="override Config.CLASSIFIER_MODE for the semantic targets",
+    )
+    parser.add_argument(
+        "--label-transitions",
+        type=Path,
+        default=None,
+        help="enable positional label smoothing with this transition prior (semantic targets)",
+    )
+    parser.add_argument(
+        "--route-model",
+        default=None,
+        help="define Config.LLM_BACKENDS['small'] with this model on the fake server (exercises registry routes)",
+    )
+    parser.add_argument(
+        "--pool",
+        type=int,
+        default=0,
+        help="run N fake servers and send all LLM calls through an LLMPool over them (Config.LLM_POOL)",
+    )
+    parser.add_argument(
+        "--pool-dead",
+        type=int,
+        default=0,
+        help="with --pool: also add M unreachable backends to exercise failover and circuit breaking",
+    )
+    parser.add_argument(
+        "--noop",
+        action="store_true",
+        help="enable the no-op pre-filter (editor.noop) with an in-memory history; off by default because "
+        "the fake editor echoes every paragraph, so the history would soon skip them all",
+    )
+    parser.add_argument("--show-llm-logs", action="store_true", help="keep the adapters' per-call log lines")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    args = parse_args(argv)
+    targets = [t.strip() for t in args.targets.split(",") if t.strip()]
+    unknown = [t for t in targets if t not in TARGETS]
+    if unknown:
+        print(f"[pipeline_bench] Target không hợp lệ: {unknown}. Chọn trong {TARGETS}.")
+        return 2
+
+    Config.NOOP_FILTER = args.noop
+    Config.NOOP_HISTORY_PATH = None  # never touch the real history file
+    if args.classifier:
+        Config.CLASSIFIER_MODE = args.classifier
+    if args.label_transitions:
+        Config.SEQUENCE_SMOOTHING = True
+        Config.LABEL_TRANSITIONS_PATH = args.label_transitions
+    config = config_from_args(args)
+    results: List[BenchResult] = []
+    with FakeLLMServer(config=config) as server, contextlib.ExitStack() as stack:
+        replicas = [stack.enter_context(FakeLLMServer(config=config)) for _ in range(max(0, args.pool - 1))]
+        if args.pool > 0:
+            Config.LLM_POOL = _pool_specs([server, *replicas], args.backend, args.pool_dead)
+        if args.route_model:
+            Config.LLM_BACKENDS = {
+                "small": {
+                    "provider": args.backend,
+                    "model": args.route_model,
+                    "api_url": server.openai_url if args.backend == "openai" else server.ollama_url,
+                    "api_key": "bench",
+                }
+            }
+        matcher = None
+        if any(t in ("semantic", "api_v2") for t in targets):
+            matcher = build_matcher(args.embedding_model)
+        for target in targets:
+            runner = make_runner(target, server, args.backend, matcher)
+            with _llm_log_sink(args.show_llm_logs):
+                try:
+                    runner(make_bulletin(3, seed=args.seed))  # warm-up: imports, first connection, model caches
+                except Exception as exc:  # noqa: BLE001
+                    print(f"[pipeline_bench] Warm-up {target} lỗi (bỏ qua): {exc}")
+            for size in _csv_ints(args.sizes):
+                with _llm_log_sink(args.show_llm_logs):
+                    result = run_case(
+                        target, runner, size, args.docs, args.concurrency, args.seed, server, replicas
+                    )
+                results.append(result)
+                if not args.json:
+                    print(
+                        f"[pipeline_bench] {target:<8} {size:>5} đoạn: {result.docs_per_s:.2f} docs/s, "
+                        f"p50={result.p50_ms:.0f}ms p95={result.p95_ms:.0f}ms p99={result.p99_ms:.0f}ms, "
+                        f"lỗi={result.failed_docs}/{result.docs}, rss={result.rss_mb:.0f}MB"
+                    )
+
+    if args.json:
+        print(json.dumps([asdict(r) for r in results], ensure_ascii=False, indent=2))
+    else:
+        header = (
+            "target", "paras", "docs", "failed", "conc", "docs/s", "paras/s",
+            "p50_ms", "p95_ms", "p99_ms", "llm", "llm_err", "rss_mb", "peak_mb",
+        )
+        print("\n" + "  ".join(f"{h:>8}" for h in header))
+        for r in results:
+            row = (
+                r.target, r.paragraphs, r.docs, r.failed_docs, r.concurrency, r.docs_per_s, r.paragraphs_per_s,
+                r.p50_ms, r.p95_ms, r.p99_ms, r.llm_calls, r.llm_errors, r.rss_mb, r.peak_rss_mb,
+            )
+            print("  ".join(f"{v:>8}" for v in row))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.stdout.reconfigure(encoding="utf-8")
+    sys.exit(main())
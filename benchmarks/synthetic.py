@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+Synthetic Vietnamese parish bulletins for benchmarks.
+
+`make_bulletin(n_paragraphs, seed)` returns a big_text (paragraphs joined by
+blank lines, as produced by editor.docx_load) shaped like the real inputs: a
+title, a lead, Mass/homily/activity reports and a closing paragraph. The same
+(n_paragraphs, seed) always yields the same text.
+"""
+
+from __future__ import annotations
+
+import random
+from typing import List
+
+_SAINTS = ("Augustinô", "Micae", "Têrêsa", "Faustina", "Giuse", "Phanxicô", "Anrê Dũng Lạc", "Maria")
+_PARISHES = ("Vĩnh Hoà", "Chánh Thiện", "Phong Cốc", "Tân Định", "Thủ Đức", "Bình Thái")
+_GROUPS = ("Giới trẻ", "Ca đoàn Cêcilia", "Hội các Bà mẹ Công giáo", "Thiếu nhi Thánh Thể", "Legio Mariae")
+_PRIESTS = ("cha Giuse Nguyễn Văn An", "cha Phêrô Trần Minh", "cha Gioan Lê Quang", "Đức cha Phêrô")
+
+_TITLES = (
+    "MỪNG LỄ KÍNH THÁNH {saint} - BỔN MẠNG {group_upper} GIÁO XỨ {parish_upper}",
+    "GIÁO XỨ {parish_upper}: THÁNH LỄ TẠ ƠN KỶ NIỆM {years} NĂM THÀNH LẬP {group_upper}",
+)
+_LEADS = (
+    "Vào lúc {hour}g{minute}, {weekday}, ngày {day}/{month}/2025, tại nhà thờ giáo xứ {parish}, "
+    "cộng đoàn đã long trọng hiệp dâng Thánh lễ mừng kính thánh {saint}, bổn mạng {group}.",
+    "Trong bầu khí hân hoan của mùa {season}, giáo xứ {parish} đã quy tụ đông đảo cộng đoàn "
+    "để cùng {group} dâng lời tạ ơn Thiên Chúa vào chiều {weekday}, ngày {day}/{month}/2025.",
+)
+_REPORTS = (
+    "Thánh lễ do {priest} chủ tế, cùng với quý cha đồng tế trong giáo hạt, với sự tham dự của quý Sơ, "
+    "Hội đồng Mục vụ và khoảng {people} anh chị em giáo dân.",
+    "Trước Thánh lễ, {group} đã tổ chức giờ chầu Thánh Thể và lần hạt Mân Côi cầu nguyện cho giáo xứ.",
+    "Ca đoàn đã góp phần làm cho Thánh lễ thêm sốt sắng qua những bài thánh ca trang trọng.",
+    "Nghi thức dâng lễ vật gồm hoa, nến và những sản vật địa phương do các giới trong giáo xứ chuẩn bị.",
+)
+_HOMILIES = (
+    "Trong bài giảng, {priest} mời gọi cộng đoàn noi gương thánh {saint} sống đức tin khiêm nhường, "
+    "hiệp nhất và phục vụ tha nhân.",
+    "Ngài nhắc nhở mỗi người hãy trở nên chứng nhân của Tin Mừng giữa đời thường, nhất là trong gia đình "
+    "và nơi làm việc.",
+)
+_ACTIVITIES = (
+    "Sau Thánh lễ, {group} cùng quý Cha và cộng đoàn tham dự bữa tiệc mừng trong bầu khí thân tình.",
+    "Buổi chiều cùng ngày, chương trình văn nghệ và sinh hoạt vòng tròn đã diễn ra tại hội trường giáo xứ.",
+    "Dịp này, {group} đã trao tặng {gifts} phần quà cho các gia đình khó khăn trong giáo xứ.",
+)
+_ENDINGS = (
+    "Thánh lễ khép lại trong niềm vui tạ ơn và phép lành bình an của {priest}.",
+    "Nguyện xin thánh {saint} luôn chuyển cầu cho {group} và toàn thể giáo xứ {parish}.",
+)
+_WEEKDAYS = ("thứ Hai", "thứ Ba", "thứ Tư", "thứ Năm", "thứ Sáu", "thứ Bảy", "Chúa nhật")
+_SEASONS = ("Thường niên", "Vọng", "Giáng sinh", "Chay", "Phục sinh")
+
+
+def make_bulletin(n_paragraphs: int, seed: int = 0) -> str:
+    """Return a synthetic bulletin with exactly `n_paragraphs` paragraphs."""
+    if n_paragraphs < 1:
+        raise ValueError("n_paragraphs must be >= 1")
+    rng = random.Random(seed * 1_000_003 + n_paragraphs)
+    group = rng.choice(_GROUPS)
+    parish = rng.choice(_PARISHES)
+    fields = {
+        "saint": rng.choice(_SAINTS),
+        "group": group,
+        "group_upper": group.upper(),
+        "parish": parish,
+        "parish_upper": parish.upper(),
+        "priest": rng.choice(_PRIESTS),
+        "years": rng.randint(5, 60),
+        "season": rng.choice(_SEASONS),
+    }
+
+    def fill(template: str) -> str:
+        return template.format(
+            hour=f"{rng.randint(5, 19):02d}",
+            minute=rng.choice(("00", "15", "30", "45")),
+            weekday=rng.choice(_WEEKDAYS),
+            day=f"{rng.randint(1, 28):02d}",
+            month=f"{rng.randint(1, 12):02d}",
+            people=rng.randint(2, 15) * 100,
+            gifts=rng.randint(10, 200),
+            **fields,
+        )
+
+    paragraphs: List[str] = [fill(rng.choice(_TITLES))]
+    if n_paragraphs > 1:
+        paragraphs.append(fill(rng.choice(_LEADS)))
+    body_pool = _REPORTS + _HOMILIES + _ACTIVITIES
+    while len(paragraphs) < n_paragraphs - 1:
+        paragraphs.append(fill(rng.choice(body_pool)))
+    if n_paragraphs > 2:
+        paragraphs.append(fill(rng.choice(_ENDINGS)))
+    return "\n\n".join(paragraphs[:n_paragraphs])
@@ -37,16 +37,19 @@ class DummyLLM:
 
 
 def load_matcher() -> LabelSemanticMatcher:
-    index = LabelSemanticIndex.load(Config.FAISS_INDEX_PATH, Config.FAISS_METADATA_PATH)
-    embedder = SentenceTransformerEmbedder(
-        Config.EMBEDDING_MODEL_NAME,
-        device=getattr(Config, "EMBEDDING_DEVICE", None),
+    index = LabelSemanticIndex.load(
+        Config.FAISS_INDEX_PATH,
+        Config.FAISS_METADATA_PATH,
+        mmap=getattr(Config, "FAISS_INDEX_MMAP", False),
     )
+    embedder = SentenceTransformerEmbedder.from_config(Config)
     return LabelSemanticMatcher(
         index=index,
         embedder=embedder,
         top_k=getattr(Config, "SIMILARITY_TOP_K", 1),
         threshold=getattr(Config, "SIMILARITY_THRESHOLD", None),
+        neighbors=getattr(Config, "SIMILARITY_NEIGHBORS", None),
+        aggregation=getattr(Config, "SIMILARITY_AGGREGATION", "max"),
     )
 
 
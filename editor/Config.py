@@ -16,6 +16,9 @@ config.py — cấu hình dùng lại 'compose'
 # === Document hiện hành (gán ở runtime) ===
 
 DOCUMENT =   r"C:\Users\TRUYENTHONG\Desktop\finetune\editor\data\01-B_n_g_c-M_NG_L__T_NG_L_NH_THI_N_TH_N_MICAE_20251016T034847Z.docx"
+# False: chỉ đọc/biên tập đoạn văn thân bài (doc.paragraphs, như trước);
+# True: đọc thêm đoạn trong bảng, text box, header/footer (editor/docx_locator.py)
+DOCX_INCLUDE_PARTS = False
 
 # === Semantic label index (finetune-v2) ===
 _MODULE_DIR = Path(__file__).resolve().parent
@@ -24,11 +27,73 @@ SEMANTIC_INDEX_DIR = _PROJECT_ROOT / "semantic_index"
 FAISS_INDEX_PATH = SEMANTIC_INDEX_DIR / "label_index.faiss"
 FAISS_METADATA_PATH = SEMANTIC_INDEX_DIR / "label_index_meta.json"
 LABEL_DESCRIPTIONS_PATH = SEMANTIC_INDEX_DIR / "label_descriptions.json"
+# Tệp tuỳ chọn: nhiều đoạn mẫu cho mỗi nhãn (mỗi đoạn = một hàng FAISS).
+LABEL_EXEMPLARS_PATH = SEMANTIC_INDEX_DIR / "label_exemplars.json"
 EMBEDDING_MODEL_NAME = "bkai-foundation-models/vietnamese-bi-encoder"
 # Ưu tiên GPU (CUDA); mã sẽ tự fallback về CPU nếu không khả dụng.
 EMBEDDING_DEVICE = "cuda"
+# Backend embedding: "torch" (PyTorch), "onnx" (ONNX Runtime CPU) hoặc "onnx-int8" (ONNX lượng tử int8, nhanh và nhẹ RAM nhất trên CPU).
+# ONNX cần `pip install "sentence-transformers>=3.2" "optimum[onnxruntime]"`; lỗi/lệch vector sẽ tự fallback về PyTorch.
+EMBEDDING_BACKEND = "torch"
+# Thư mục gốc cho bản xuất ONNX; mỗi model nằm trong thư mục con riêng (<EMBEDDING_ONNX_DIR>/<tên model>)
+EMBEDDING_ONNX_DIR = SEMANTIC_INDEX_DIR / "onnx"
+# Cấu hình lượng tử: "avx2" (phổ biến), "avx512", "avx512_vnni" (Xeon mới), "arm64".
+EMBEDDING_ONNX_QUANTIZATION = "avx2"
+# Cosine tối thiểu giữa vector ONNX và PyTorch trên các câu mẫu để chấp nhận bản xuất ONNX.
+EMBEDDING_PARITY_MIN_COSINE = 0.98
 SIMILARITY_TOP_K = 1
 SIMILARITY_THRESHOLD = 0.1
+# Số láng giềng FAISS lấy về trước khi gộp điểm theo nhãn (None = tự chọn).
+SIMILARITY_NEIGHBORS = None
+# Cách gộp điểm các đoạn mẫu theo nhãn: "max", "mean" hoặc "vote" (tỉ lệ phiếu có trọng số, 0..1).
+SIMILARITY_AGGREGATION = "max"
+# Cách gán nhãn trong SemanticEditorPipeline:
+#   "semantic": chỉ dùng FAISS (mặc định)
+#   "cascade" : dùng FAISS trước, chỉ gọi LLM classifier khi điểm cao nhất < CASCADE_MIN_SCORE
+#               hoặc chênh lệch top-1/top-2 < CASCADE_MIN_MARGIN (tỉ lệ chuyển LLM được log + /metrics)
+#   "head"    : bộ phân loại đã huấn luyện trên embedding (LABEL_HEAD_PATH, xem finetune_v2.train_label_head)
+CLASSIFIER_MODE = "semantic"
+# Ngưỡng theo thang điểm của SIMILARITY_AGGREGATION (cosine với "max"/"mean", 0..1 với "vote")
+CASCADE_MIN_SCORE = 0.5
+CASCADE_MIN_MARGIN = 0.05
+# Tệp trọng số của classifier head (.npz) do `python -m finetune_v2.train_label_head` tạo ra.
+LABEL_HEAD_PATH = SEMANTIC_INDEX_DIR / "label_head.npz"
+# Xác suất tối thiểu cho các nhãn thứ 2..SIMILARITY_TOP_K của head (nhãn top-1 luôn được giữ).
+LABEL_HEAD_THRESHOLD = 0.3
+# Làm mượt nhãn theo vị trí (Viterbi/HMM trên ma trận điểm FAISS của cả tài liệu, chế độ "semantic").
+# Xác suất chuyển nhãn học từ các tài liệu cũ: `python -m finetune_v2.train_label_transitions`.
+SEQUENCE_SMOOTHING = False
+LABEL_TRANSITIONS_PATH = SEMANTIC_INDEX_DIR / "label_transitions.json"
+# Nhiệt độ đổi cosine thành log-xác suất: chênh lệch điểm 0.05 ~ 1 nat. Nhỏ hơn = tin điểm FAISS hơn.
+SEQUENCE_TEMPERATURE = 0.05
+# Trọng số của prior chuyển nhãn (0 = tắt, giữ nguyên top-1 của FAISS).
+SEQUENCE_TRANSITION_WEIGHT = 1.0
+# Laplace smoothing cho số đếm chuyển nhãn (None = giá trị lưu trong tệp).
+SEQUENCE_SMOOTHING_ALPHA = None
+# Kiểu chỉ mục FAISS: "flat" (chính xác), "hnsw" (ANN), "ivf_pq" / "ivf_sq8" / "sq8" (nén lượng tử).
+# Với vài chục mô tả nhãn thì "flat" là đủ; dùng ANN/nén khi có hàng nghìn đoạn mẫu mỗi nhãn.
+FAISS_INDEX_TYPE = "flat"
+# Tham số cho các kiểu ANN/nén (bỏ trống = dùng mặc định trong label_matcher.DEFAULT_INDEX_PARAMS).
+FAISS_INDEX_PARAMS = {
+    # "hnsw_m": 32, "ef_construction": 200, "ef_search": 64,
+    # "nlist": 256, "nprobe": 16, "pq_m": 64, "pq_nbits": 8,
+}
+# Nạp chỉ mục bằng mmap (chỉ đọc): các worker uvicorn dùng chung page cache, khởi động gần như tức thì.
+FAISS_INDEX_MMAP = True
+
+# === Tracing theo từng giai đoạn (editor.tracing) ===
+# None → không ghi file (timing vẫn trả trong audit của API).
+# Ví dụ: SEMANTIC_INDEX_DIR.parent / "outputs" / "traces.jsonl"
+TRACE_EXPORT_PATH = None
+# "jsonl" (mỗi span một dòng) hoặc "otlp" (OTLP/JSON, mỗi trace một dòng)
+TRACE_EXPORT_FORMAT = "jsonl"
+
+# === Profiling tài nguyên (editor.profiling, opt-in cho API) ===
+# True → một thread nền lấy mẫu CPU/RSS/GPU; mỗi span trong trace được gắn res.* (cpu, rss, gpu)
+RESOURCE_PROFILING = False
+# Chu kỳ lấy mẫu (giây) và số mẫu giữ trong ring buffer (7200 × 0.5s ≈ 1 giờ)
+RESOURCE_SAMPLE_INTERVAL = 0.5
+RESOURCE_SAMPLE_CAPACITY = 7200
 
 # === Danh sách nhãn hợp lệ (whitelist cho classifier) ===
 
@@ -50,6 +115,118 @@ OPENAI_API_KEY = ""  # Ví dụ: "sk-xxx"
 # ====== (2) Cấu hình LLM Providers ======
 USE_OLLAMA = True  # "OPENAI"  hoặc  "OLLAMA"
 
+# --- Log của LLM adapters (logger "editor.llm") ---
+# INFO: mỗi lần gọi một dòng (ttft_ms, tokens, tok/s); DEBUG: thêm log chunk stream; WARNING: chỉ lỗi/retry
+LLM_LOG_LEVEL = "INFO"
+# Ở mức DEBUG, log 1 trên N chunk stream của Ollama (0 = không log chunk)
+LLM_STREAM_DEBUG_SAMPLE = 0
+
+# --- Định tuyến model theo nhãn cho bước biên tập (editor/routing.py) ---
+# Các backend có tên, được REGISTRY_DICT["routes"] tham chiếu. "default" luôn là model chính ở trên
+# (OLLAMA_MODEL / OPENAI_MODEL) và là fallback cuối cùng. Trường thiếu lấy theo cấu hình provider ở trên.
+# Để trống → mọi đoạn dùng model chính (bảng routes không có tác dụng).
+LLM_ROUTING = True
+LLM_BACKENDS = {
+    # "small": {"provider": "ollama", "model": "qwen2.5:7b-instruct", "api_url": "http://localhost:11434/api/generate"},
+}
+
+# --- Pool nhiều backend cho model chính (editor/llm_pool.py) ---
+# Khai báo ≥1 backend → model chính (classifier + biên tập) là một LLMPool dùng chung cho cả process:
+# mỗi lời gọi vào backend đang ít request nhất, lỗi thì chuyển backend khác, backend lỗi liên tiếp
+# LLM_POOL_FAILURE_THRESHOLD lần bị tạm ngưng LLM_POOL_COOLDOWN giây. Backend Ollama trong pool mặc định
+# chỉ thử kết nối 1 lần ("max_retries"). Một backend trong LLM_BACKENDS cũng có thể là {"pool": [...]}.
+# Để trống → dùng một backend theo USE_OLLAMA như cũ.
+LLM_POOL = [
+    # {"name": "gpu1", "provider": "ollama", "api_url": "http://10.0.0.11:11434/api/generate"},
+    # {"name": "gpu2", "provider": "ollama", "api_url": "http://10.0.0.12:11434/api/generate"},
+]
+LLM_POOL_FAILURE_THRESHOLD = 3
+LLM_POOL_COOLDOWN = 30.0
+# Chu kỳ health check nền (giây; 0 = tắt) và timeout mỗi lần kiểm tra
+LLM_POOL_HEALTH_INTERVAL = 15.0
+LLM_POOL_HEALTH_TIMEOUT = 2.0
+
+# --- Classifier LLM: đầu ra JSON ràng buộc ---
+# True: Ollama `format: "json"` / OpenAI JSON schema, đầu ra {"labels": [...]}; False: prompt JSON array cũ
+CLASSIFIER_JSON_MODE = True
+# Trần token đầu ra cho lời gọi classifier (Ollama num_predict / OpenAI max_tokens; None = không giới hạn).
+# Mặc định None: model suy luận (gpt-oss) tính cả token "thinking" vào trần, trần nhỏ cho ra đầu ra rỗng/bị cắt.
+# Đầu ra bị cắt ở trần → lần gọi lại (CLASSIFIER_JSON_RETRIES) dùng trần gấp đôi
+CLASSIFIER_MAX_TOKENS = None
+# Số lần gọi lại khi đầu ra không parse được nhãn hợp lệ
+CLASSIFIER_JSON_RETRIES = 1
+
+# --- Trần token đầu ra cho bước biên tập (editor/budget.py) ---
+# budget = ceil(len(đoạn)/EDIT_BUDGET_CHARS_PER_TOKEN × hệ số nhãn) + EDIT_BUDGET_OVERHEAD_TOKENS,
+# kẹp trong [EDIT_BUDGET_MIN_TOKENS, EDIT_BUDGET_MAX_TOKENS]. Chạm trần → thử lại 1 lần với trần gấp đôi
+# (tối đa EDIT_BUDGET_MAX_TOKENS), vẫn bị cắt → đoạn lỗi "truncated", giữ nguyên văn gốc.
+# Mặc định tắt: bật sau khi đã đo độ dài đầu ra thực tế của model (model suy luận tốn thêm token "thinking").
+EDIT_TOKEN_BUDGET = False
+EDIT_BUDGET_CHARS_PER_TOKEN = 3.0
+EDIT_BUDGET_RATIO = 1.5
+# Hệ số theo key nhãn (đoạn nhiều nhãn dùng hệ số lớn nhất): tiêu đề ngắn, tường thuật bài giảng dài hơn
+EDIT_BUDGET_RATIO_BY_LABEL = {
+    "tittle": 1.2,
+    "tuong_thuat_su_kien_bai_giang": 2.0,
+}
+# Phần cộng thêm cố định; model suy luận (gpt-oss) tính cả token "thinking" vào num_predict nên cần dư hơn
+EDIT_BUDGET_OVERHEAD_TOKENS = 256
+EDIT_BUDGET_MIN_TOKENS = 128
+EDIT_BUDGET_MAX_TOKENS = 4096
+
+# --- Kiểm tra bản biên tập & chạy lại từng đoạn lỗi (editor/validation.py) ---
+# Một đoạn lỗi (LLM lỗi, không có nhãn, đầu ra không hợp lệ) không làm hỏng cả tài liệu: đoạn đó giữ
+# nguyên văn bản gốc, ChunkResult.status = "failed", và chỉ các đoạn lỗi được gọi lại sau lượt đầu.
+# False: chỉ loại đầu ra rỗng
+EDIT_VALIDATION = True
+# Loại bản biên tập dài hơn EDIT_MAX_LENGTH_RATIO × đoạn gốc + EDIT_LENGTH_SLACK_CHARS ký tự
+EDIT_MAX_LENGTH_RATIO = 2.0
+EDIT_LENGTH_SLACK_CHARS = 200
+# Loại khi tỉ lệ chữ có dấu tiếng Việt < EDIT_MIN_VIETNAMESE_RATIO × tỉ lệ của đoạn gốc (0 = tắt)
+EDIT_MIN_VIETNAMESE_RATIO = 0.3
+# Regex (không phân biệt hoa thường, theo dòng) nhận diện lời giải thích của model; None = mặc định
+# trong editor/validation.py. Cụm đã có sẵn trong đoạn gốc không bị tính.
+EDIT_EXPLANATION_PATTERNS = None
+# Số lượt gọi lại các đoạn lỗi sau lượt đầu (0 = không gọi lại)
+EDIT_RETRY_ROUNDS = 2
+
+# --- Checkpoint theo đoạn để chạy tiếp sau khi tiến trình khởi động lại (editor/checkpoint.py) ---
+# Dùng cho job nền của api_v2 (/process/default_async) và run_local.py. Mỗi đoạn biên tập xong được ghi
+# thêm một dòng vào CHECKPOINT_DIR/<hash tài liệu>-<fingerprint registry/model>.jsonl.
+CHECKPOINTS = True
+CHECKPOINT_DIR = _PROJECT_ROOT / "outputs" / "checkpoints"
+# True: chạy lại cùng tài liệu (cùng registry/model) sẽ bỏ qua các đoạn đã có trong checkpoint;
+# False: luôn biên tập lại từ đầu (xoá checkpoint cũ)
+CHECKPOINT_RESUME = True
+# Giữ checkpoint sau khi tài liệu hoàn tất không lỗi (mặc định xoá)
+CHECKPOINT_KEEP_COMPLETED = False
+
+# --- Bỏ qua LLM cho đoạn không cần sửa (editor/noop.py) ---
+# Trước khi phân loại/biên tập, đoạn ngắn chỉ gồm trích dẫn Kinh Thánh, ngày tháng, chữ ký, danh sách tên,
+# link... hoặc đoạn mà LLM đã từng trả về nguyên văn (cùng registry/model) được giữ nguyên, không gọi LLM.
+# Audit ghi lý do ở trường "skipped".
+NOOP_FILTER = True
+# Regex theo dòng {tên: pattern}; None = mặc định trong editor/noop.py, {} = tắt
+NOOP_PATTERNS = None
+# Nhận diện chữ ký ("Lm. Giuse ...", "TM. Ban Mục vụ")
+NOOP_NAME_CHECKS = True
+# Danh sách >= 3 tên viết hoa cách nhau bởi dấu phẩy. Mặc định tắt: tiêu đề viết hoa từng chữ
+# ("Thánh Lễ, Chầu Thánh Thể, Giải Tội") trông giống hệt và vẫn cần biên tập
+NOOP_NAME_LISTS = False
+# Chỉ áp dụng nhận diện theo mẫu cho đoạn không dài quá số ký tự này
+NOOP_MAX_CHARS = 300
+# Ghi nhớ hash các đoạn LLM trả về không đổi; xoá file để quên lịch sử (None = chỉ giữ trong bộ nhớ)
+NOOP_HISTORY = True
+NOOP_HISTORY_PATH = _PROJECT_ROOT / "outputs" / "noop_history.txt"
+NOOP_HISTORY_MAX = 100_000
+
+# === Registry nạp từ file JSON (hot reload) ===
+# None → dùng REGISTRY_DICT bên dưới. Đặt đường dẫn .json (xuất bằng
+# `python -m editor.registry_loader --export <path>`) để sửa quy tắc mà không cần restart:
+# file được kiểm tra mỗi REGISTRY_RELOAD_INTERVAL giây, bản hợp lệ mới thay thế bản cũ.
+REGISTRY_JSON_PATH = None
+REGISTRY_RELOAD_INTERVAL = 2.0
+
 # === Registry chính ===
 REGISTRY_DICT = {
     # 1) Danh mục nhãn
@@ -534,7 +711,7 @@ REGISTRY_DICT = {
             "EP_REPORT_THANH_LE_TONE", 
             "EP_END_THANH_LE_TONE",
             "EP_PROFILE_HOI_DOAN_TONE",
-            "EP_WORD_LEAD"
+            "EP_WORD_LEAD",
             "EP_LEAD_HOI_DOAN_WORD",
             "EP_BAI_GIANG_WORD",
             "EP_REPORT_THANH_LE_WORD",
@@ -543,14 +720,25 @@ REGISTRY_DICT = {
             "EP_LEAD_HOI_DOAN_AIM", 
             "EP_BAI_GIANG_AIM",
             "EP_REPORT_THANH_LE_AIM",
-            "EP_END_THANH_LE_AIM"
+            "EP_END_THANH_LE_AIM",
             "EP_PROFILE_ALL_AIM",
             "EP_CHUAN_HOA",
             "EP_BAI_GIANG_CHECK",
             "EP_REPORT_THANH_LE_CHECK",
             "EP_END_THANH_LE_CHECK",
         ]
-    }
+    },
+
+    # 5) routes: định tuyến model theo nhãn (dòng đầu tiên chứa MỌI nhãn của đoạn được chọn; có thể dùng
+    #    "edit_prompt_ids" thay cho "label_keys"). "backend" là tên trong Config.LLM_BACKENDS; đoạn đa nhãn
+    #    có nhãn nằm ngoài danh sách (vd. tiêu đề + tường thuật) vẫn dùng model chính.
+    "routes": [
+        {
+            "label_keys": ["tittle", "ket_tu_tuong_thuat_thanh_le"],
+            "backend": "small",
+            "fallbacks": ["default"]
+        },
+    ],
 }
 # === Derived label configuration ===
 def _normalize_label_name(value):
@@ -571,4 +759,7 @@ for item in REGISTRY_DICT.get("labels", []):
 LABEL_NAME_TO_KEY = _LABEL_NAME_TO_KEY
 LABEL_KEY_TO_NAME = _LABEL_KEY_TO_NAME
 ALLOWED_LABELS_DEFAULT = list(LABEL_NAME_TO_KEY.keys())
-print(f"[Config] Nhãn hợp lệ: {ALLOWED_LABELS_DEFAULT}")
+
+if __name__ == "__main__":
+    # Chỉ in khi chạy trực tiếp (python -m editor.Config), không in mỗi lần import.
+    print(f"[Config] Nhãn hợp lệ: {ALLOWED_LABELS_DEFAULT}")
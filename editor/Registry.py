@@ -15,12 +15,120 @@ API công khai:
 - base_system_prompt() -> str
 - combine_edit_prompts(label_keys: List[str]) -> (selected_labels: List[str], edit_prompts: List[EditPrompt])
 - build_system_prompt(label_keys: List[str]) -> (system_prompt: str, selected_labels: List[str], edit_prompt_ids: List[str])
+- label_mask(label_keys: List[str]) -> int  (bitmask các edit_prompt, thứ tự bit = global_prompt_order)
+- route(label_keys, edit_prompt_ids) -> List[str]  (chuỗi backend LLM theo bảng "routes", [] = model mặc định)
+- validate_registry_dict(dict) -> (errors, warnings)  (errors rỗng = hợp lệ)
+- from_dict(..., strict=True) / from_json(..., strict=True) → raise RegistryValidationError nếu có lỗi
 """
 
+import hashlib  # dấu vân tay registry (checkpoint)
 import json  # nạp file JSON nếu cần from_json
 from dataclasses import dataclass  # tạo kiểu dữ liệu nhẹ cho EditPrompt
 from typing import Dict, List, Tuple, Any  # gợi ý kiểu cho hàm/lớp
 
+_MASK_CACHE_SIZE = 4096  # số tổ hợp nhãn (bitmask) giữ system prompt đã lắp sẵn
+
+
+class RegistryValidationError(ValueError):
+    """Raised by strict registry loading; `errors` lists every problem found."""
+
+    def __init__(self, errors: List[str]):
+        self.errors = list(errors)
+        super().__init__("Invalid registry:\n- " + "\n- ".join(self.errors))
+
+
+def _split_concatenated_id(value: str, known: Dict[str, Any]) -> Tuple[str, str]:
+    # Python nối 2 chuỗi liền nhau khi thiếu dấu phẩy: "EP_A" "EP_B" → "EP_AEP_B"
+    for i in range(1, len(value)):
+        if value[:i] in known and value[i:] in known:
+            return value[:i], value[i:]
+    return "", ""
+
+
+def validate_registry_dict(d: Dict[str, Any]) -> Tuple[List[str], List[str]]:
+    """
+    Check a registry dict (same shape as Config.REGISTRY_DICT).
+
+    Returns (errors, warnings). Errors: missing label keys or edit-prompt IDs,
+    map rows that reference unknown labels or edit prompts, and
+    compose.global_prompt_order entries that are unknown or missing (including
+    two IDs glued together by a missing comma). Warnings: duplicate definitions,
+    where the registry keeps the last one.
+    """
+    errors: List[str] = []
+    warnings: List[str] = []
+    if not isinstance(d, dict):
+        return ["registry must be a JSON object"], warnings
+
+    label_keys: Dict[str, Any] = {}
+    for i, item in enumerate(d.get("labels") or []):
+        key = str((item or {}).get("key", "")).strip()
+        if not key:
+            errors.append(f"labels[{i}]: missing 'key'")
+        elif key in label_keys:
+            warnings.append(f"labels[{i}]: duplicate label key '{key}'")
+        label_keys.setdefault(key, item)
+
+    ep_ids: Dict[str, Any] = {}
+    for i, item in enumerate(d.get("edit_prompts") or []):
+        ep_id = str((item or {}).get("id", "")).strip()
+        if not ep_id:
+            errors.append(f"edit_prompts[{i}]: missing 'id'")
+            continue
+        if not str(item.get("text", "")).strip():
+            errors.append(f"edit_prompts[{i}] '{ep_id}': empty 'text'")
+        if ep_id in ep_ids:
+            warnings.append(f"edit_prompts[{i}]: duplicate id '{ep_id}' (last definition wins)")
+        ep_ids.setdefault(ep_id, item)
+
+    mapped: List[str] = []
+    for i, row in enumerate(d.get("map") or []):
+        label_key = str((row or {}).get("label_key", "")).strip()
+        if label_key not in label_keys:
+            errors.append(f"map[{i}]: unknown label_key '{label_key}'")
+        for eid in row.get("edit_prompt_ids") or []:
+            if eid not in ep_ids:
+                errors.append(f"map[{i}] '{label_key}': unknown edit_prompt id '{eid}'")
+            elif eid not in mapped:
+                mapped.append(eid)
+
+    order = list(((d.get("compose") or {}).get("global_prompt_order")) or [])
+    if not order:
+        errors.append("compose.global_prompt_order is missing or empty")
+    seen = set()
+    for eid in order:
+        if eid in seen:
+            warnings.append(f"compose.global_prompt_order: duplicate id '{eid}'")
+        seen.add(eid)
+        if eid in ep_ids:
+            continue
+        left, right = _split_concatenated_id(str(eid), ep_ids)
+        if left:
+            errors.append(
+                f"compose.global_prompt_order: '{eid}' looks like '{left}' and '{right}' "
+                "joined by a missing comma"
+            )
+            seen.update((left, right))
+        else:
+            errors.append(f"compose.global_prompt_order: unknown id '{eid}'")
+    for eid in mapped:
+        if eid not in seen:
+            errors.append(f"compose.global_prompt_order: mapped id '{eid}' is not listed")
+
+    for i, row in enumerate(d.get("routes") or []):
+        row = row or {}
+        if not str(row.get("backend", "")).strip():
+            errors.append(f"routes[{i}]: missing 'backend'")
+        if not (row.get("label_keys") or row.get("edit_prompt_ids")):
+            errors.append(f"routes[{i}]: needs 'label_keys' or 'edit_prompt_ids'")
+        for key in row.get("label_keys") or []:
+            if key not in label_keys:
+                errors.append(f"routes[{i}]: unknown label_key '{key}'")
+        for eid in row.get("edit_prompt_ids") or []:
+            if eid not in ep_ids:
+                errors.append(f"routes[{i}]: unknown edit_prompt id '{eid}'")
+    return errors, warnings
+
 
 # -----------------------------
 # Kiểu dữ liệu quy tắc biên tập
@@ -41,6 +149,7 @@ class PromptRegistry:
         edit_prompts: List[Dict[str, Any]],  # danh sách quy tắc biên tập
         mapping: List[Dict[str, Any]],       # ánh xạ N-N: label_key -> [edit_prompt_id]
         compose: Dict[str, Any],             # cấu hình compose (union + dedupe + order + base_system)
+        routes: List[Dict[str, Any]] = None, # định tuyến model theo nhãn/quy tắc (tuỳ chọn, editor/routing.py)
     ):
         # Lưu toàn bộ compose để dùng ở các bước kết hợp/sắp xếp/sinh system
         self.compose: Dict[str, Any] = compose or {}
@@ -70,25 +179,87 @@ class PromptRegistry:
         gpo_list = list(self.compose.get("global_prompt_order") or [])  # lấy danh sách ưu tiên toàn cục
         self._global_rank: Dict[str, int] = {eid: i for i, eid in enumerate(gpo_list)}  # map id → thứ hạng
 
+        # Bảng định tuyến: (tập nhãn, tập quy tắc, [backend, fallback...]); dòng đầu tiên khớp được chọn
+        self._routes: List[Tuple[frozenset, frozenset, List[str]]] = []
+        for row in (routes or []):
+            backend = str(row.get("backend", "")).strip()
+            if not backend:                                   # thiếu backend → bỏ qua dòng
+                continue
+            chain = [backend] + [str(b).strip() for b in (row.get("fallbacks") or []) if str(b).strip()]
+            self._routes.append((
+                frozenset(str(k).strip() for k in (row.get("label_keys") or [])),
+                frozenset(str(e).strip() for e in (row.get("edit_prompt_ids") or [])),
+                list(dict.fromkeys(chain)),
+            ))
+
+        self._compile()
+
+    # -----------------------------
+    # Nội bộ: biên dịch registry thành bitmask
+    # -----------------------------
+    def _compile(self) -> None:
+        """
+        Precompute the compiled form used by `combine_edit_prompts`.
+
+        Every edit prompt reachable from the map gets one bit; bit positions
+        follow `global_prompt_order` (IDs missing from it come after, in the
+        order they first appear in the map). Each label becomes the OR of its
+        bits, so union + dedupe + ordering of any label set is a bitwise OR
+        followed by a walk over the set bits from low to high.
+        """
+        reachable: List[str] = []                                 # mọi EP ID được map tới, theo thứ tự gặp
+        seen = set()
+        for ep_ids in self._map_label_to_epids.values():
+            for eid in ep_ids:
+                if eid not in seen:
+                    seen.add(eid)
+                    reachable.append(eid)
+
+        # ID có trong global_prompt_order xếp theo thứ hạng; ID thiếu nối tiếp phía sau
+        ranked = sorted((eid for eid in reachable if eid in self._global_rank), key=self._global_rank.__getitem__)
+        unranked = [eid for eid in reachable if eid not in self._global_rank]
+        self._ordered_eids: List[str] = ranked + unranked        # vị trí bit i ↔ EP ID
+        self._ordered_prompts: List[EditPrompt] = [self._edit_prompts_by_id[eid] for eid in self._ordered_eids]
+        self._unranked_eids: List[str] = unranked                 # phục vụ kiểm tra cấu hình
+
+        bit_of = {eid: i for i, eid in enumerate(self._ordered_eids)}
+        self._label_masks: Dict[str, int] = {}                    # label_key → bitmask các EP
+        for label_key, ep_ids in self._map_label_to_epids.items():
+            mask = 0
+            for eid in ep_ids:
+                mask |= 1 << bit_of[eid]
+            self._label_masks[label_key] = mask
+
+        # Cache theo bitmask: mask → (edit_prompts, system_prompt, ep_ids)
+        self._mask_cache: Dict[int, Tuple[List[EditPrompt], str, List[str]]] = {}
+        # Đếm hit/miss của cache (xuất ra /metrics của api_v2)
+        self.mask_cache_hits = 0
+        self.mask_cache_misses = 0
+
     # -----------------------------
     # Factory helpers
     # -----------------------------
     @staticmethod
-    def from_dict(d: Dict[str, Any]) -> "PromptRegistry":
+    def from_dict(d: Dict[str, Any], *, strict: bool = False) -> "PromptRegistry":
         # Hàm dựng nhanh từ dict cấu hình (thường là REGISTRY_DICT trong config.py)
+        if strict:                                  # strict: kiểm tra cấu hình, lỗi → RegistryValidationError
+            errors, _ = validate_registry_dict(d)
+            if errors:
+                raise RegistryValidationError(errors)
         return PromptRegistry(
             labels=d.get("labels", []),             # truyền danh sách labels
             edit_prompts=d.get("edit_prompts", []), # truyền danh sách edit_prompts
             mapping=d.get("map", []),               # truyền danh sách map
             compose=d.get("compose", {}),           # truyền compose (union + dedupe + order + base_system)
+            routes=d.get("routes", []),             # truyền bảng định tuyến model (nếu có)
         )
 
     @staticmethod
-    def from_json(path: str) -> "PromptRegistry":
+    def from_json(path: str, *, strict: bool = False) -> "PromptRegistry":
         # Hàm dựng từ file JSON ngoài (nếu bạn tách cấu hình ra file .json)
         with open(path, "r", encoding="utf-8") as f:  # mở file cấu hình dạng JSON
             data = json.load(f)                       # nạp nội dung JSON thành dict
-        return PromptRegistry.from_dict(data)         # gọi lại from_dict để khởi tạo
+        return PromptRegistry.from_dict(data, strict=strict)  # gọi lại from_dict để khởi tạo
 
     # -----------------------------
     # Truy xuất system chung
@@ -101,95 +272,118 @@ class PromptRegistry:
                "Giữ trung thực dữ kiện; không thêm thông tin mới; tôn trọng bối cảnh mục vụ."
         )
 
+    def fingerprint(self) -> str:
+        """
+        SHA-1 of everything that shapes an edit prompt (rules, label map,
+        compose). Two registries with the same fingerprint build the same
+        system prompts; used to key on-disk checkpoints (editor/checkpoint.py).
+        """
+        if getattr(self, "_fingerprint", None) is None:
+            payload = {
+                "edit_prompts": {eid: ep.text for eid, ep in self._edit_prompts_by_id.items()},
+                "map": self._map_label_to_epids,
+                "compose": self.compose,
+                "routes": [[sorted(labels), sorted(eps), chain] for labels, eps, chain in self._routes],
+            }
+            raw = json.dumps(payload, ensure_ascii=False, sort_keys=True, default=str)
+            self._fingerprint = hashlib.sha1(raw.encode("utf-8")).hexdigest()
+        return self._fingerprint
+
+    def route(self, label_keys: List[str], edit_prompt_ids: List[str] = ()) -> List[str]:
+        """
+        Backend chain (preferred first, then fallbacks) of the first route whose
+        `label_keys` contain every label of the chunk, or whose
+        `edit_prompt_ids` contain every edit prompt of the chunk. [] means the
+        pipeline's default editor model.
+        """
+        labels, eps = set(label_keys or []), set(edit_prompt_ids or [])
+        for route_labels, route_eps, chain in self._routes:
+            if (labels and route_labels and labels <= route_labels) or (eps and route_eps and eps <= route_eps):
+                return list(chain)
+        return []
+
     # -----------------------------
     # Nội bộ: lọc nhãn hợp lệ theo map
     # -----------------------------
     def _valid_input_labels(self, label_keys: List[str]) -> List[str]:
         # Giữ nguyên thứ tự input; chỉ nhận nhãn có xuất hiện trong bảng map
-        return [k for k in (label_keys or []) if k in self._map_label_to_epids]
+        return [k for k in (label_keys or []) if k in self._label_masks]
 
     # -----------------------------
-    # Nội bộ: hợp + khử trùng lặp theo thứ tự input
+    # API: bitmask của tập nhãn
     # -----------------------------
-    def _union_eids_by_input_order(self, valid_labels: List[str]) -> List[str]:
-        seen = set()       # tập hợp để kiểm tra trùng lặp nhanh
-        out: List[str] = []# danh sách kết quả eids theo thứ tự đã gặp
-        for lbl in valid_labels:                                        # duyệt từng nhãn theo thứ tự input
-            for eid in self._map_label_to_epids.get(lbl, []):           # duyệt từng edit_prompt_id của nhãn đó
-                if eid not in seen:                                     # nếu id chưa xuất hiện trước đó
-                    seen.add(eid)                                       # đánh dấu đã thấy
-                    out.append(eid)                                     # thêm vào kết quả
-        return out                                                      # trả danh sách eids sau union+dedupe
+    def label_mask(self, label_keys: List[str]) -> int:
+        # Hợp (OR) bitmask của các nhãn; nhãn không có trong map bị bỏ qua
+        mask = 0
+        for key in (label_keys or []):
+            mask |= self._label_masks.get(key, 0)
+        return mask
+
+    def _compose_mask(self, mask: int) -> Tuple[List[EditPrompt], str, List[str]]:
+        # Tra cache trước; lần đầu gặp mask thì duyệt các bit bật từ thấp đến cao
+        cached = self._mask_cache.get(mask)
+        if cached is not None:
+            self.mask_cache_hits += 1
+            return cached
+        self.mask_cache_misses += 1
 
-    # -----------------------------
-    # Nội bộ: sắp xếp theo global_prompt_order (bắt buộc đủ)
-    # -----------------------------
-    def _order_by_global(self, eids: List[str]) -> List[str]:
-        # Lấy bảng thứ hạng toàn cục đã khởi tạo trong __init__
-        rank = dict(self._global_rank)
         # Nếu compose không có global_prompt_order → báo lỗi cấu hình để bạn bổ sung
-        if not rank:
+        if not self._global_rank:
             raise ValueError("compose.global_prompt_order is missing or empty in config.")
 
-        # Bổ sung các ID chưa có bằng cách nối tiếp theo thứ tự xuất hiện để pipeline không lỗi
-        next_index = max(rank.values(), default=-1) + 1
-        for eid in eids:
-            if eid not in rank:
-                rank[eid] = next_index
-                self._global_rank[eid] = next_index  # lưu lại cho những lần sau
-                next_index += 1
+        edit_prompts: List[EditPrompt] = []
+        remaining = mask
+        while remaining:
+            low = remaining & -remaining                          # bit bật thấp nhất
+            edit_prompts.append(self._ordered_prompts[low.bit_length() - 1])
+            remaining ^= low
 
-        # Sắp xếp eids theo thứ hạng rank[eid] (nhỏ → đứng trước)
-        return sorted(eids, key=lambda x: rank[x])
+        base = self.base_system_prompt().rstrip()                 # system base từ compose (hoặc mặc định)
+        bullets = "\n".join(f"- {ep.text}" for ep in edit_prompts)
+        system_prompt = (
+            f"{base}\n\n"
+            f"Yêu cầu chỉnh sửa (thực hiện theo thứ tự):\n{bullets}\n"
+            f"Chỉ trả về văn bản đã chỉnh sửa (bằng UTF-8/tiếng Việt đúng dấu), không kèm giải thích."
+        )
+        composed = (edit_prompts, system_prompt, [ep.id for ep in edit_prompts])
 
-    # -----------------------------
-    # API: kết hợp quy tắc theo danh sách nhãn
-    # -----------------------------
-    def combine_edit_prompts(self, label_keys: List[str]) -> Tuple[List[str], List[EditPrompt]]:
+        if len(self._mask_cache) >= _MASK_CACHE_SIZE:             # giới hạn bộ nhớ cache
+            self._mask_cache.clear()
+        self._mask_cache[mask] = composed
+        return composed
+
+    def _require_labels(self, label_keys: List[str], caller: str) -> List[str]:
         # Bảo vệ đầu vào rỗng (không nên xảy ra trong pipeline bình thường)
         if not label_keys:
-            raise ValueError("combine_edit_prompts(): label_keys is empty")
+            raise ValueError(f"{caller}(): label_keys is empty")
 
         # Lọc nhận các nhãn có trong map; giữ thứ tự input
         valid_labels = self._valid_input_labels(label_keys)
         # Nếu không còn nhãn hợp lệ sau lọc → cấu hình map thiếu; báo lỗi để sửa config
         if not valid_labels:
             raise ValueError(f"No mapped labels for input: {label_keys}")
+        return valid_labels
 
-        # Chiến lược duy nhất: UNION (theo yêu cầu) + DEDUPE (đã thực hiện trong union)
-        eids = self._union_eids_by_input_order(valid_labels)
-
-        # Sắp xếp theo compose.global_prompt_order (bắt buộc đủ)
-        eids = self._order_by_global(eids)
+    # -----------------------------
+    # API: kết hợp quy tắc theo danh sách nhãn
+    # -----------------------------
+    def combine_edit_prompts(self, label_keys: List[str]) -> Tuple[List[str], List[EditPrompt]]:
+        valid_labels = self._require_labels(label_keys, "combine_edit_prompts")
 
-        # Chuyển danh sách id sang danh sách EditPrompt đối tượng
-        edit_prompts = [self._edit_prompts_by_id[eid] for eid in eids]
+        # UNION + DEDUPE = OR bitmask; thứ tự global đã nằm sẵn trong vị trí bit
+        edit_prompts, _, _ = self._compose_mask(self.label_mask(valid_labels))
 
         # Trả lại cặp (các nhãn hợp lệ theo thứ tự input, danh sách quy tắc theo thứ tự cuối)
-        return valid_labels, edit_prompts
+        return valid_labels, list(edit_prompts)
 
     # -----------------------------
     # API: sinh system prompt hoàn chỉnh cho LLM
     # -----------------------------
     def build_system_prompt(self, label_keys: List[str]) -> Tuple[str, List[str], List[str]]:
-        # Gọi combine_edit_prompts để lấy danh sách quy tắc đã hợp + sắp xếp
-        selected_labels, edit_prompts = self.combine_edit_prompts(label_keys)
-
-        # Lấy system base từ compose (hoặc mặc định)
-        base = self.base_system_prompt().rstrip()
-
-        # Kết hợp nội dung text của từng quy tắc thành bullet theo thứ tự đã quyết định
-        bullets = "\n".join(f"- {ep.text}" for ep in edit_prompts)
-
-        # Lắp ghép thành system prompt cuối cùng (yêu cầu chỉ trả về văn bản đã chỉnh sửa)
-        system_prompt = (
-            f"{base}\n\n"
-            f"Yêu cầu chỉnh sửa (thực hiện theo thứ tự):\n{bullets}\n"
-            f"Chỉ trả về văn bản đã chỉnh sửa (bằng UTF-8/tiếng Việt đúng dấu), không kèm giải thích."
-        )
+        selected_labels = self._require_labels(label_keys, "build_system_prompt")
 
-        # Trả thêm danh sách id quy tắc (phục vụ audit/lưu vết)
-        ep_ids = [ep.id for ep in edit_prompts]
+        # System prompt đã lắp sẵn theo bitmask (base + bullet theo thứ tự + câu chốt)
+        _, system_prompt, ep_ids = self._compose_mask(self.label_mask(selected_labels))
 
         # Trả về bộ 3: (system_prompt, selected_labels, edit_prompt_ids)
-        return system_prompt, selected_labels, ep_ids
+        return system_prompt, selected_labels, list(ep_ids)
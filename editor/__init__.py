@@ -3,43 +3,70 @@
 
 """editor package: exposes pipeline components."""
 
-__version__ = "0.1.0"
-
-# Re-export cáº¥u hÃ¬nh
-from . import Config  # noqa: F401
+import importlib
 
-# Registry (label -> edit_prompts -> system_prompt)
-from .Registry import PromptRegistry  # noqa: F401
+__version__ = "0.1.0"
 
-# Äá»c .docx -> paragraphs -> big_text
-from .docx_load import (  # noqa: F401
-    read_paragraphs_from_config,
-    paragraphs_to_big_text,
-    document_to_big_text,
-)
+# PEP 562 lazy exports: `import editor` stays cheap (no python-docx, requests or
+# Config side effects) and each submodule is imported on first attribute access.
+_LAZY_EXPORTS = {
+    # Re-export cáº¥u hÃ¬nh
+    "Config": ".Config",
+    # Registry (label -> edit_prompts -> system_prompt)
+    "PromptRegistry": ".Registry",
+    "get_registry": ".registry_loader",
+    # Äá»c .docx -> paragraphs -> big_text
+    "read_paragraphs_from_config": ".docx_load",
+    "paragraphs_to_big_text": ".docx_load",
+    "document_to_big_text": ".docx_load",
+    # Paragraph locator (body / table / text box / header / footer addresses)
+    "iter_document_paragraphs": ".docx_locator",
+    "locate_paragraphs": ".docx_locator",
+    # Cáº¯t big_text theo Ä‘oáº¡n (má»—i paragraph -> 1 Chunk)
+    "Chunk": ".chunking",
+    "split_text": ".chunking",
+    # classifier cho bÆ°á»›c gÃ¡n nhÃ£n (prompt & parser)
+    "build_classifier_prompt": ".classifier",
+    "parse_labels_json": ".classifier",
+    # LLM adapters (OpenAI / Ollama) + interface
+    "BaseLLM": ".llm",
+    "OpenAIChatLLM": ".llm",
+    "OllamaChatLLM": ".llm",
+    # Pipeline tuáº§n tá»± end-to-end
+    "EditorPipeline": ".pipeline",
+    "ChunkResult": ".pipeline",
+    # Export tiá»‡n Ã­ch (chá»‰ lÆ°u final_text ra .txt)
+    "save_final_text_txt": ".export_local",
+    # Per-stage tracing (spans, traces, JSONL / OTLP export)
+    "span": ".tracing",
+    "start_trace": ".tracing",
+}
 
-# Cáº¯t big_text theo Ä‘oáº¡n (má»—i paragraph -> 1 Chunk)
-from .chunking import Chunk, split_text  # noqa: F401
 
-# classifier cho bÆ°á»›c gÃ¡n nhÃ£n (prompt & parser)
-from .classifier import build_classifier_prompt, parse_labels_json  # noqa: F401
+def __getattr__(name):
+    module_name = _LAZY_EXPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    module = importlib.import_module(module_name, __name__)
+    value = module if module_name == f".{name}" else getattr(module, name)
+    globals()[name] = value
+    return value
 
-# LLM adapters (OpenAI / Ollama) + interface
-from .llm import BaseLLM, OpenAIChatLLM, OllamaChatLLM  # noqa: F401
 
-# Pipeline tuáº§n tá»± end-to-end
-from .pipeline import EditorPipeline, ChunkResult  # noqa: F401
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_EXPORTS))
 
-# Export tiá»‡n Ã­ch (chá»‰ lÆ°u final_text ra .txt)
-from .export_local import save_final_text_txt  # noqa: F401
 
 __all__ = [
     "__version__",
     "Config",
     "PromptRegistry",
+    "get_registry",
     "read_paragraphs_from_config",
     "paragraphs_to_big_text",
     "document_to_big_text",
+    "iter_document_paragraphs",
+    "locate_paragraphs",
     "Chunk",
     "split_text",
     "build_classifier_prompt",
@@ -50,4 +77,6 @@ __all__ = [
     "EditorPipeline",
     "ChunkResult",
     "save_final_text_txt",
+    "span",
+    "start_trace",
 ]
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""
+Output-token budgets for the editing LLM call.
+
+An edit rewrites one paragraph, so its answer should be about as long as the
+input. The budget is derived from the input length and the paragraph's labels:
+
+    ceil(estimated input tokens * ratio) + overhead, clamped to [min, max]
+
+where the input token count is `len(text) / EDIT_BUDGET_CHARS_PER_TOKEN` and
+`ratio` is the largest `EDIT_BUDGET_RATIO_BY_LABEL` entry among the labels
+(default `EDIT_BUDGET_RATIO`), so titles stay short and homily reports get
+more room. The adapters pass it as Ollama `num_predict` / OpenAI `max_tokens`.
+A call that hits it reports finish_reason "length". `edit_chunk` then
+retries once with `truncation_retry_budget` (twice the budget, at most
+`EDIT_BUDGET_MAX_TOKENS`) and fails the chunk with error "truncated" when the
+answer is still cut, so a half paragraph is never exported.
+"""
+
+from __future__ import annotations
+
+import math
+from typing import Any, Optional, Sequence
+
+
+def edit_token_budget(text: str, label_keys: Sequence[str], config: Any = None) -> Optional[int]:
+    """Max output tokens for editing `text` with `label_keys`; None when budgets are off."""
+    if config is None:
+        from . import Config as config  # noqa: N813 - module used as config object
+    if not getattr(config, "EDIT_TOKEN_BUDGET", False):
+        return None
+
+    chars_per_token = float(getattr(config, "EDIT_BUDGET_CHARS_PER_TOKEN", 3.0)) or 3.0
+    ratios = getattr(config, "EDIT_BUDGET_RATIO_BY_LABEL", {}) or {}
+    default_ratio = float(getattr(config, "EDIT_BUDGET_RATIO", 1.5))
+    ratio = max((float(ratios.get(key, default_ratio)) for key in label_keys), default=default_ratio)
+
+    input_tokens = len(text or "") / chars_per_token
+    budget = math.ceil(input_tokens * ratio) + int(getattr(config, "EDIT_BUDGET_OVERHEAD_TOKENS", 0))
+    lower = int(getattr(config, "EDIT_BUDGET_MIN_TOKENS", 1))
+    upper = getattr(config, "EDIT_BUDGET_MAX_TOKENS", None)
+    budget = max(budget, lower)
+    if upper:
+        budget = min(budget, int(upper))
+    return budget
+
+
+def truncation_retry_budget(max_tokens: Optional[int], config: Any = None) -> Optional[int]:
+    """Budget for the one retry of a truncated edit, or None when it cannot grow."""
+    if config is None:
+        from . import Config as config  # noqa: N813 - module used as config object
+    if max_tokens is None:
+        return None
+    retry = 2 * int(max_tokens)
+    upper = getattr(config, "EDIT_BUDGET_MAX_TOKENS", None)
+    if upper:
+        retry = min(retry, int(upper))
+    return retry if retry > max_tokens else None
@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+"""
+Resumable document runs: an append-only, per-document log of finished chunks.
+
+Every chunk that a pipeline edits successfully is appended as one JSON line
+to `CHECKPOINT_DIR/<document hash>-<fingerprint>.jsonl` and flushed to disk
+before the next chunk starts. The fingerprint covers what decides the edit
+output:
+
+- the pipeline kind
+- the registry rules (`PromptRegistry.fingerprint()`)
+- the editing model
+
+A run that restarts with the same input finds the same log. With resume
+enabled it reuses every recorded chunk whose key still matches, i.e. the same
+chunk text and, for the semantic pipeline, the same labels. Only the rest is
+sent to the LLM. A changed registry or model gives a new file, so stale edits
+are never reused.
+
+A torn last line (the process died mid-write) is skipped on load. The log is
+removed once a document finishes without failed chunks, unless
+`CHECKPOINT_KEEP_COMPLETED` is set.
+
+Two jobs on the same document share the log. The first one takes
+`<log>.lock` (created exclusively, holding its pid and a run token) and owns
+the log: only the owner deletes it, for `resume=False` or in `finish()`. The
+other jobs still read and append to it. The lock is released by `finish()`,
+`close()` or when the CheckpointLog is garbage-collected; a lock left by a
+process that no longer runs is taken over (POSIX only).
+"""
+
+from __future__ import annotations
+
+import dataclasses
+import hashlib
+import json
+import os
+import threading
+import uuid
+import weakref
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from .pipeline import ChunkResult
+
+FORMAT_VERSION = 1
+
+
+def _sha1(*parts: Any) -> str:
+    digest = hashlib.sha1()
+    for part in parts:
+        digest.update(json.dumps(part, ensure_ascii=False, sort_keys=True, default=str).encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+def document_hash(text: str) -> str:
+    """SHA-256 of the (stripped) input document."""
+    return hashlib.sha256((text or "").strip().encode("utf-8")).hexdigest()
+
+
+def pipeline_fingerprint(pipeline: str, registry: Any, llm: Any) -> str:
+    """Fingerprint of the pipeline kind, registry rules and editing model."""
+    model = f"{type(llm).__name__}:{getattr(llm, 'model', '')}"
+    return _sha1(FORMAT_VERSION, pipeline, registry.fingerprint(), model)
+
+
+def _pid_alive(pid: int) -> bool:
+    if os.name != "posix":
+        return True  # no cheap probe: never take over another process's lock
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _acquire_lock(lock_path: Path, token: str) -> bool:
+    """Create `lock_path` holding `token`; False when a live run already holds it."""
+    lock_path.parent.mkdir(parents=True, exist_ok=True)
+    for _ in range(2):
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            try:
+                holder = lock_path.read_text(encoding="utf-8")
+                pid = int(holder.split()[0])
+            except (OSError, ValueError, IndexError):
+                return False  # just created and not written yet, or unreadable: treat as held
+            if pid == os.getpid() or _pid_alive(pid):
+                return False
+            try:
+                if lock_path.read_text(encoding="utf-8") == holder:
+                    lock_path.unlink()  # stale lock of a process that died
+            except OSError:
+                pass
+            continue
+        with os.fdopen(fd, "w", encoding="utf-8") as handle:
+            handle.write(token)
+        return True
+    return False
+
+
+def _release_lock(lock_path: Path, token: str) -> None:
+    try:
+        if lock_path.read_text(encoding="utf-8") == token:
+            lock_path.unlink()
+    except OSError:
+        pass
+
+
+class CheckpointLog:
+    """Append-only JSONL of finished ChunkResults for one document + fingerprint."""
+
+    def __init__(self, path: Path, *, resume: bool = True, keep_completed: bool = False):
+        self.path = Path(path)
+        self.keep_completed = keep_completed
+        self._lock = threading.Lock()
+        self._entries: Dict[str, ChunkResult] = {}
+        self.lock_path = self.path.with_name(self.path.name + ".lock")
+        token = f"{os.getpid()} {uuid.uuid4().hex}"
+        self.owner = _acquire_lock(self.lock_path, token)
+        self._release = weakref.finalize(self, _release_lock, self.lock_path, token) if self.owner else None
+        if resume:
+            self._entries = self._load()
+        elif self.path.exists():
+            if self.owner:
+                self.path.unlink()
+            else:
+                print(f"[checkpoint] {self.path.name} đang được lần chạy khác dùng, không xoá.")
+
+    def _load(self) -> Dict[str, ChunkResult]:
+        entries: Dict[str, ChunkResult] = {}
+        if not self.path.is_file():
+            return entries
+        fields = {item.name for item in dataclasses.fields(ChunkResult)}
+        with self.path.open("r", encoding="utf-8") as handle:
+            for line in handle:
+                try:
+                    record = json.loads(line)
+                    result = ChunkResult(**{k: v for k, v in record["result"].items() if k in fields})
+                    entries[record["key"]] = result
+                except (ValueError, KeyError, TypeError, AttributeError):
+                    continue  # torn or foreign line
+        return entries
+
+    @staticmethod
+    def key(*parts: Any) -> str:
+        """Key of one chunk inside the log, e.g. key(chunk_id, text, label_keys)."""
+        return _sha1(*parts)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[ChunkResult]:
+        """Recorded result for `key` (marked resumed), or None."""
+        result = self._entries.get(key)
+        if result is None:
+            return None
+        return dataclasses.replace(result, resumed=True)
+
+    def record(self, key: str, result: ChunkResult) -> None:
+        """Append a successful result and flush it to disk; failed results are not kept."""
+        if result.status != "ok":
+            return
+        line = json.dumps({"key": key, "result": dataclasses.asdict(result)}, ensure_ascii=False)
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with self.path.open("a", encoding="utf-8") as handle:
+                handle.write(line + "\n")
+                handle.flush()
+                os.fsync(handle.fileno())
+            self._entries[key] = result
+
+    def finish(self, results: Any) -> None:
+        """Drop the log when every chunk succeeded (owner only, unless keep_completed), then release the lock."""
+        try:
+            if not self.owner or self.keep_completed or any(item.status != "ok" for item in results):
+                return
+            with self._lock:
+                if self.path.exists():
+                    self.path.unlink()
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        """Release the lock if this run owns it (idempotent); the log itself is kept."""
+        if self._release is not None:
+            self._release()
+
+
+def open_checkpoint(
+    text: str,
+    *,
+    pipeline: str,
+    registry: Any,
+    llm: Any,
+    config: Any = None,
+    resume: Optional[bool] = None,
+) -> Optional[CheckpointLog]:
+    """Checkpoint log for `text` per Config (None when CHECKPOINTS is off)."""
+    if config is None:
+        from . import Config as config  # noqa: N813 - module used as config object
+    if not getattr(config, "CHECKPOINTS", False):
+        return None
+    if resume is None:
+        resume = getattr(config, "CHECKPOINT_RESUME", True)
+    directory = Path(getattr(config, "CHECKPOINT_DIR", "outputs/checkpoints"))
+    name = f"{document_hash(text)[:16]}-{pipeline_fingerprint(pipeline, registry, llm)[:12]}.jsonl"
+    log = CheckpointLog(
+        directory / name,
+        resume=resume,
+        keep_completed=getattr(config, "CHECKPOINT_KEEP_COMPLETED", False),
+    )
+    if len(log):
+        print(f"[checkpoint] Tiếp tục từ {log.path.name}: {len(log)} đoạn đã xong.")
+    return log
@@ -13,7 +13,7 @@ Yêu cầu: KHÔNG nhận allowed_labels từ bên ngoài.
 
 import json
 import unicodedata
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 
 from . import Config  # danh sách nhãn hợp lệ duy nhất
 
@@ -24,18 +24,20 @@ def _normalize_label(value: str) -> str:
     return unicodedata.normalize("NFC", value).strip()
 
 
-def build_classifier_prompt() -> Tuple[str, str]:
+def build_classifier_prompt(json_mode: bool = False) -> Tuple[str, str]:
     """
     Tạo (system, user) prompt cho LLM phân loại nhãn.
     - Dùng Config.ALLOWED_LABELS_DEFAULT 
     - Yêu cầu LLM CHỈ trả về JSON array: ["label1","label2",...]
+    - json_mode=True: trả về JSON object {"labels": [...]} (dùng với đầu ra JSON ràng buộc của backend)
     """
     labels = Config.ALLOWED_LABELS_DEFAULT
     labels_list_str = "\n".join(f"- {k}" for k in labels)
+    output_shape = 'một JSON object dạng {"labels": [...]}' if json_mode else "một JSON array"
 
     system = (
         "Bạn là bộ phân loại nhãn văn bản. "
-        "Đọc đoạn văn TIẾNG VIỆT và CHỈ trả về một JSON array các khóa nhãn nằm trong danh sách cho phép."
+        f"Đọc đoạn văn TIẾNG VIỆT và CHỈ trả về {output_shape} các khóa nhãn nằm trong danh sách cho phép."
         "Chỉ trả về các nhãn trong danh sách"
         "KHÔNG giải thích, Không thêm bất kỳ nhãn nào ngoài danh sách."
     )
@@ -44,7 +46,7 @@ def build_classifier_prompt() -> Tuple[str, str]:
         "Danh sách nhãn cho phép (chọn 1 hoặc nhiều):\n"
         f"{labels_list_str}\n\n"
         "Yêu cầu đầu ra: \n"
-        "Chỉ một JSON array\n" 
+        f"Chỉ {output_shape}\n"
         "KHÔNG kèm lời giải thích.\n\n"
         "Đoạn văn cần phân loại:\n"
         "{{TEXT}}"
@@ -52,11 +54,26 @@ def build_classifier_prompt() -> Tuple[str, str]:
     return system, user
 
 
+def build_labels_schema() -> dict:
+    """JSON schema {"labels": [nhãn hợp lệ, ...]} cho đầu ra ràng buộc (OpenAI Structured Outputs)."""
+    return {
+        "type": "object",
+        "properties": {
+            "labels": {
+                "type": "array",
+                "items": {"type": "string", "enum": list(Config.ALLOWED_LABELS_DEFAULT)},
+            }
+        },
+        "required": ["labels"],
+        "additionalProperties": False,
+    }
+
+
 def parse_labels_json(model_output: str) -> List[str]:
     """
     Parse chuỗi output của LLM thành List[str] nhãn hợp lệ.
     - Chỉ dùng whitelist = Config.ALLOWED_LABELS_DEFAULT.
-    - Ưu tiên json.loads trực tiếp; fallback cắt giữa '[' ... ']'.
+    - Ưu tiên json.loads trực tiếp (array hoặc object {"labels": [...]}); fallback cắt giữa '[' ... ']'.
     - Khử trùng lặp, giữ thứ tự xuất hiện.
     """
     whitelist_raw = getattr(Config, "ALLOWED_LABELS_DEFAULT", [])
@@ -78,6 +95,8 @@ def parse_labels_json(model_output: str) -> List[str]:
     # 1) Parse trực tiếp toàn chuỗi
     try:
         data = json.loads(model_output)
+        if isinstance(data, dict):
+            data = data.get("labels")
         if isinstance(data, list):
             return _filter_dedupe(data)
     except Exception:
@@ -111,3 +130,51 @@ def map_labels_to_registry_keys(labels: List[str]) -> List[str]:
             seen.add(key)
             out.append(key)
     return out
+
+
+def classify_with_llm(
+    llm,
+    text: str,
+    *,
+    json_mode: Optional[bool] = None,
+    max_tokens: Optional[int] = None,
+    retries: Optional[int] = None,
+) -> List[str]:
+    """
+    Gọi LLM phân loại một đoạn văn.
+    - Trả về danh sách registry keys (rỗng nếu LLM không trả nhãn hợp lệ).
+    - json_mode (mặc định Config.CLASSIFIER_JSON_MODE): dùng llm.chat_json (Ollama `format: json`,
+      OpenAI JSON schema) với trần Config.CLASSIFIER_MAX_TOKENS token; đầu ra không hợp lệ
+      được gọi lại tối đa Config.CLASSIFIER_JSON_RETRIES lần. Đầu ra bị cắt ở trần
+      (finish_reason "length") thì lần gọi lại dùng trần gấp đôi thay vì lặp lại cùng trần.
+    """
+    json_mode = getattr(Config, "CLASSIFIER_JSON_MODE", True) if json_mode is None else json_mode
+    sys_prompt, user_template = build_classifier_prompt(json_mode=json_mode)
+    user_message = user_template.replace("{{TEXT}}", text)
+    if not json_mode:
+        raw = llm.chat(sys_prompt, user_message)
+        return map_labels_to_registry_keys(parse_labels_json(raw))
+
+    if max_tokens is None:
+        max_tokens = getattr(Config, "CLASSIFIER_MAX_TOKENS", None)
+    if retries is None:
+        retries = getattr(Config, "CLASSIFIER_JSON_RETRIES", 1)
+    schema = build_labels_schema()
+    attempts = 1 + max(0, int(retries))
+    hinted = False
+    for attempt in range(1, attempts + 1):
+        reply = llm.chat_json(sys_prompt, user_message, schema=schema, max_tokens=max_tokens)
+        raw = reply.text or ""
+        labels = map_labels_to_registry_keys(parse_labels_json(raw))
+        if labels:
+            return labels
+        if reply.truncated and max_tokens:
+            # Hết trần (model suy luận tiêu token "thinking" vào trần): nới trần, không gửi lại y nguyên
+            print(f"[classifier] Đầu ra bị cắt ở trần {max_tokens} token (lần {attempt}/{attempts}).")
+            max_tokens = 2 * int(max_tokens)
+            continue
+        print(f"[classifier] Đầu ra không hợp lệ (lần {attempt}/{attempts}): {raw[:120]!r}")
+        if not hinted:
+            hinted = True
+            user_message += '\n\nLưu ý: chỉ trả về {"labels": [...]} với nhãn đúng nguyên văn trong danh sách.'
+    return []
@@ -7,6 +7,10 @@ sys.stderr.reconfigure(encoding="utf-8")
 """
 Utilities for reading DOCX files referenced by Config.DOCUMENT.
 Preserves paragraph ordering so we can later map edited text back.
+By default only top-level body paragraphs (`doc.paragraphs`) are read. With
+`include_parts=True` (or Config.DOCX_INCLUDE_PARTS) table-cell, text-box and
+header/footer paragraphs are collected too, in one pass through
+`editor.docx_locator`; every record carries a stable address for write-back.
 """
 
 from dataclasses import dataclass
@@ -16,14 +20,18 @@ import os
 from docx import Document
 
 from . import Config
+from .docx_locator import body_address, iter_document_paragraphs
+from .tracing import span
 
 
 @dataclass
 class ParagraphRecord:
-    """Paragraph content paired with its original index inside the DOCX."""
+    """Paragraph content paired with its original location inside the DOCX."""
 
-    docx_index: int
+    docx_index: int  # index in doc.paragraphs for top-level body paragraphs, -1 elsewhere
     text: str
+    address: str = ""  # stable locator address, e.g. "body/p3" or "body/t0/r1/c0/p0"
+    kind: str = "body"
 
 
 def get_document_path() -> str:
@@ -37,11 +45,23 @@ def get_document_path() -> str:
     return path
 
 
-def read_paragraphs_from_config() -> List[str]:
-    """Return raw paragraph texts from the configured DOCX."""
+def _include_parts(include_parts: Optional[bool]) -> bool:
+    if include_parts is None:
+        return bool(getattr(Config, "DOCX_INCLUDE_PARTS", False))
+    return include_parts
+
+
+def read_paragraphs_from_config(*, include_parts: Optional[bool] = None) -> List[str]:
+    """
+    Return raw paragraph texts from the configured DOCX.
+
+    Args:
+        include_parts: Also return table, text-box and header/footer paragraphs.
+            None uses Config.DOCX_INCLUDE_PARTS (default: body paragraphs only).
+    """
     path = get_document_path()
     doc = Document(path)
-    return [(p.text or "").strip() for p in doc.paragraphs]
+    return [record.text for record in extract_textual_paragraphs(doc, keep_empty=True, include_parts=include_parts)]
 
 
 def paragraphs_to_big_text(paragraphs: List[str]) -> str:
@@ -50,53 +70,94 @@ def paragraphs_to_big_text(paragraphs: List[str]) -> str:
     return "\n\n".join(cleaned)
 
 
-def document_to_big_text() -> str:
+def document_to_big_text(*, include_parts: Optional[bool] = None) -> str:
     """Read the configured DOCX and return a concatenated text string."""
-    return paragraphs_to_big_text(read_paragraphs_from_config())
+    return paragraphs_to_big_text(read_paragraphs_from_config(include_parts=include_parts))
 
 
-def extract_textual_paragraphs(doc: Document, *, keep_empty: bool = False) -> List[ParagraphRecord]:
+def extract_textual_paragraphs(
+    doc: Document,
+    *,
+    keep_empty: bool = False,
+    include_parts: Optional[bool] = None,
+) -> List[ParagraphRecord]:
     """
-    Return a list of ParagraphRecord, preserving the original paragraph order.
+    Return a list of ParagraphRecord, preserving the original reading order.
+
+    Without `include_parts` only top-level body paragraphs are returned. With it,
+    body paragraphs, table cells and text boxes come in document order, followed
+    by header/footer paragraphs; everything is collected in one pass.
 
     Args:
         doc: The python-docx Document.
         keep_empty: When True, include empty paragraphs as placeholders.
+        include_parts: None uses Config.DOCX_INCLUDE_PARTS.
     """
     records: List[ParagraphRecord] = []
-    for idx, paragraph in enumerate(doc.paragraphs):
-        text = (paragraph.text or "").strip()
+    if not _include_parts(include_parts):
+        for idx, paragraph in enumerate(doc.paragraphs):
+            text = (paragraph.text or "").strip()
+            if not text and not keep_empty:
+                continue
+            records.append(ParagraphRecord(docx_index=idx, text=text, address=body_address(idx)))
+        return records
+
+    body_idx = 0
+    for located in iter_document_paragraphs(doc):
+        docx_index = -1
+        if located.kind == "body" and located.address == body_address(body_idx):
+            docx_index = body_idx
+            body_idx += 1
+        text = (located.paragraph.text or "").strip()
         if not text and not keep_empty:
             continue
-        records.append(ParagraphRecord(docx_index=idx, text=text))
+        records.append(
+            ParagraphRecord(
+                docx_index=docx_index,
+                text=text,
+                address=located.address,
+                kind=located.kind,
+            )
+        )
     return records
 
 
-def load_document_with_text(path: Optional[str] = None) -> Tuple[Document, List[ParagraphRecord]]:
+def load_document_with_text(
+    path: Optional[str] = None,
+    *,
+    include_parts: Optional[bool] = None,
+) -> Tuple[Document, List[ParagraphRecord]]:
     """
     Load a DOCX file and return the Document plus textual paragraphs with indices.
 
     Args:
         path: Optional override path. Defaults to Config.DOCUMENT.
+        include_parts: See extract_textual_paragraphs.
     """
     target_path = path or get_document_path()
     if not os.path.isfile(target_path):
         raise RuntimeError(f"DOCX file not found: {target_path}")
     doc = Document(target_path)
-    paragraphs = extract_textual_paragraphs(doc)
+    paragraphs = extract_textual_paragraphs(doc, include_parts=include_parts)
     return doc, paragraphs
 
 
-def document_to_big_text_with_mapping() -> Tuple[str, Document, List[ParagraphRecord]]:
+def document_to_big_text_with_mapping(
+    *,
+    include_parts: Optional[bool] = None,
+) -> Tuple[str, Document, List[ParagraphRecord]]:
     """
     Read Config.DOCUMENT and return big_text together with Document and paragraph map.
+    `include_parts` as in extract_textual_paragraphs (None = Config.DOCX_INCLUDE_PARTS).
 
     Returns:
         big_text: Concatenated textual paragraphs.
         document: Loaded python-docx Document object.
         paragraphs: ParagraphRecord list preserving DOCX ordering.
     """
-    document, paragraphs = load_document_with_text()
+    with span("docx.load") as load_span:
+        document, paragraphs = load_document_with_text(include_parts=include_parts)
+        load_span.set(paragraphs=len(paragraphs))
     lines: Sequence[str] = [item.text for item in paragraphs]
     big_text = paragraphs_to_big_text(list(lines))
     return big_text, document, paragraphs
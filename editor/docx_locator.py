@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+"""
+Unified paragraph locator for DOCX documents.
+
+python-docx only exposes top-level body paragraphs through `Document.paragraphs`,
+so captions inside tables, headers/footers and text boxes are invisible to the
+ingest path. This module walks every story of the document once and yields each
+paragraph together with a stable, human-readable address:
+
+- body/p3                      -> 4th top-level body paragraph (== doc.paragraphs[3])
+- body/t0/r1/c2/p0             -> first paragraph of cell (row 1, col 2) of the first body table
+- body/sdt0/p1                 -> paragraph inside a block-level content control
+- body/p5/x0/p2                -> 3rd paragraph of the first text box anchored in body/p5
+- s0/header/p0, s1/footer/p2   -> header/footer paragraphs of a section (first_page_header, ...)
+
+Addresses only depend on document structure, so the same file always yields the
+same addresses, which lets edits computed from one load be written back into
+another load of the same DOCX.
+"""
+
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional
+
+from docx.document import Document as DocumentObject
+from docx.oxml.ns import qn
+from docx.text.paragraph import Paragraph
+
+# Markup-compatibility namespace (python-docx does not register the "mc" prefix).
+_MC_NS = "http://schemas.openxmlformats.org/markup-compatibility/2006"
+_MC_FALLBACK = f"{{{_MC_NS}}}Fallback"
+
+_W_P = qn("w:p")
+_W_TBL = qn("w:tbl")
+_W_TR = qn("w:tr")
+_W_TC = qn("w:tc")
+_W_SDT = qn("w:sdt")
+_W_SDT_CONTENT = qn("w:sdtContent")
+_W_TXBX_CONTENT = qn("w:txbxContent")
+
+# Header/footer attributes of docx.section.Section, in reading order.
+_HEADER_FOOTER_ATTRS = (
+    "first_page_header",
+    "header",
+    "even_page_header",
+    "first_page_footer",
+    "footer",
+    "even_page_footer",
+)
+
+
+@dataclass
+class LocatedParagraph:
+    """A paragraph found anywhere in the document plus its stable address."""
+
+    address: str
+    kind: str  # "body" | "table" | "textbox" | "header" | "footer"
+    paragraph: Paragraph
+
+
+def body_address(index: int) -> str:
+    """Address of the top-level body paragraph `doc.paragraphs[index]`."""
+    return f"body/p{index}"
+
+
+def _textbox_contents(p_element) -> List[object]:
+    """
+    Return the `w:txbxContent` elements anchored directly in this paragraph.
+
+    Text boxes are duplicated inside `mc:AlternateContent` (DrawingML choice +
+    VML fallback); only the choice is returned because that is what Word renders.
+    Text boxes nested inside another text box are reached when that inner
+    paragraph is walked, so they are skipped here.
+    """
+    found = []
+    for txbx in p_element.iter(_W_TXBX_CONTENT):
+        ancestor = txbx.getparent()
+        skip = False
+        while ancestor is not None and ancestor is not p_element:
+            if ancestor.tag in (_MC_FALLBACK, _W_TXBX_CONTENT):
+                skip = True
+                break
+            ancestor = ancestor.getparent()
+        if not skip:
+            found.append(txbx)
+    return found
+
+
+def _walk_paragraph(p_element, address: str, kind: str, parent) -> Iterator[LocatedParagraph]:
+    yield LocatedParagraph(address=address, kind=kind, paragraph=Paragraph(p_element, parent))
+    for x_idx, txbx in enumerate(_textbox_contents(p_element)):
+        yield from _walk_blocks(txbx, f"{address}/x{x_idx}", "textbox", parent)
+
+
+def _walk_table(tbl_element, address: str, parent) -> Iterator[LocatedParagraph]:
+    # Iterate raw w:tr/w:tc so horizontally merged cells are visited once.
+    for r_idx, tr in enumerate(tbl_element.iterchildren(_W_TR)):
+        for c_idx, tc in enumerate(tr.iterchildren(_W_TC)):
+            yield from _walk_blocks(tc, f"{address}/r{r_idx}/c{c_idx}", "table", parent)
+
+
+def _walk_blocks(container, prefix: str, kind: str, parent) -> Iterator[LocatedParagraph]:
+    """Walk block-level content (paragraphs, tables, content controls) in reading order."""
+    p_idx = t_idx = sdt_idx = 0
+    for child in container.iterchildren():
+        if child.tag == _W_P:
+            yield from _walk_paragraph(child, f"{prefix}/p{p_idx}", kind, parent)
+            p_idx += 1
+        elif child.tag == _W_TBL:
+            yield from _walk_table(child, f"{prefix}/t{t_idx}", parent)
+            t_idx += 1
+        elif child.tag == _W_SDT:
+            content = child.find(_W_SDT_CONTENT)
+            if content is not None:
+                yield from _walk_blocks(content, f"{prefix}/sdt{sdt_idx}", kind, parent)
+            sdt_idx += 1
+
+
+def iter_document_paragraphs(
+    doc: DocumentObject,
+    *,
+    include_headers_footers: bool = True,
+) -> Iterator[LocatedParagraph]:
+    """
+    Yield every paragraph of the document in a single pass.
+
+    Order: body content in reading order (tables and text boxes inline where they
+    are anchored), then header/footer stories section by section. Header/footer
+    definitions shared between sections are only visited once.
+    """
+    body = doc._body
+    yield from _walk_blocks(body._element, "body", "body", body)
+
+    if not include_headers_footers:
+        return
+
+    seen = set()
+    for s_idx, section in enumerate(doc.sections):
+        for attr in _HEADER_FOOTER_ATTRS:
+            story = getattr(section, attr)
+            # Linked stories have no definition of their own; touching `_element`
+            # would create an empty one, so skip them before any access.
+            if story.is_linked_to_previous:
+                continue
+            element = story._element
+            if id(element) in seen:
+                continue
+            seen.add(id(element))
+            kind = "header" if attr.endswith("header") else "footer"
+            yield from _walk_blocks(element, f"s{s_idx}/{attr}", kind, story)
+
+
+def locate_paragraphs(doc: DocumentObject) -> Dict[str, Paragraph]:
+    """Return a mapping address -> Paragraph for the whole document."""
+    return {item.address: item.paragraph for item in iter_document_paragraphs(doc)}
+
+
+def _has_embedded_objects(paragraph: Paragraph) -> bool:
+    element = paragraph._p
+    for tag in (qn("w:drawing"), qn("w:pict"), qn("w:object"), f"{{{_MC_NS}}}AlternateContent"):
+        if next(element.iter(tag), None) is not None:
+            return True
+    return False
+
+
+def set_paragraph_text(paragraph: Paragraph, new_text: Optional[str]) -> None:
+    """
+    Replace the visible text of a paragraph.
+
+    Plain paragraphs use python-docx's `paragraph.text` setter. Paragraphs that
+    anchor drawings or text boxes keep those runs: the new text goes into the
+    first text node and the remaining text nodes are dropped, so the anchored
+    objects (and any text box content edited separately) survive the write.
+    """
+    text = (new_text or "").strip()
+    if not _has_embedded_objects(paragraph):
+        paragraph.text = text
+        return
+
+    t_elements = [t for run in paragraph.runs for t in run._r.iterchildren(qn("w:t"))]
+    if not t_elements:
+        paragraph.add_run(text)
+        return
+    # Edit w:t nodes in place: run.text would also clear the drawing children.
+    t_elements[0].text = text
+    t_elements[0].set(qn("xml:space"), "preserve")
+    for t in t_elements[1:]:
+        t.getparent().remove(t)
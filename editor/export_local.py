@@ -4,10 +4,13 @@ Helper functions to persist pipeline outputs (text or DOCX).
 """
 
 import os
-from typing import Mapping
+from typing import Mapping, Union
 
 from docx import Document
 
+from .docx_locator import body_address, locate_paragraphs, set_paragraph_text
+from .tracing import span
+
 
 def _ensure_parent_dir(path: str) -> None:
     directory = os.path.dirname(path)
@@ -36,7 +39,7 @@ def save_final_text_txt(
 
 def save_document_with_edits(
     document: Document,
-    paragraph_updates: Mapping[int, str],
+    paragraph_updates: Mapping[Union[int, str], str],
     out_path: str,
 ) -> str:
     """
@@ -44,20 +47,28 @@ def save_document_with_edits(
 
     Args:
         document: python-docx Document already loaded (images/styles are intact).
-        paragraph_updates: mapping docx paragraph index -> new text.
+        paragraph_updates: mapping paragraph address -> new text. Keys are locator
+            addresses (see editor.docx_locator, e.g. "body/t0/r1/c0/p0"); integer
+            keys are still accepted as indices into document.paragraphs.
         out_path: destination DOCX path.
     """
     if not isinstance(paragraph_updates, Mapping):
-        raise TypeError("paragraph_updates must be a mapping from paragraph index to text.")
+        raise TypeError("paragraph_updates must be a mapping from paragraph address to text.")
 
-    for idx, new_text in paragraph_updates.items():
-        if not isinstance(idx, int):
-            raise TypeError("Paragraph index must be an integer.")
-        if idx < 0 or idx >= len(document.paragraphs):
-            raise ValueError(f"Paragraph index out of range: {idx}")
-        paragraph = document.paragraphs[idx]
-        paragraph.text = (new_text or "").strip()
+    located = locate_paragraphs(document) if paragraph_updates else {}
+    for key, new_text in paragraph_updates.items():
+        if isinstance(key, bool) or not isinstance(key, (int, str)):
+            raise TypeError("Paragraph key must be an address string or an integer index.")
+        if isinstance(key, int):
+            if key < 0 or key >= len(document.paragraphs):
+                raise ValueError(f"Paragraph index out of range: {key}")
+            key = body_address(key)
+        paragraph = located.get(key)
+        if paragraph is None:
+            raise ValueError(f"Paragraph address not found in document: {key}")
+        set_paragraph_text(paragraph, new_text)
 
     _ensure_parent_dir(out_path)
-    document.save(out_path)
+    with span("docx.save", paragraphs_updated=len(paragraph_updates)):
+        document.save(out_path)
     return out_path
@@ -7,12 +7,58 @@ sys.stderr.reconfigure(encoding="utf-8")
 LLM adapters dùng API URL đầy đủ (KHÔNG base_url, KHÔNG default URL).
 - OpenAIChatLLM  : gọi trực tiếp endpoint /chat/completions
 - OllamaChatLLM  : gọi trực tiếp endpoint /api/generate
+- complete(system, user, max_tokens=N) giới hạn số token đầu ra và báo bị cắt (finish_reason "length")
 """
 
 import json
+import logging
 import time
 import requests
 from abc import ABC, abstractmethod
+from dataclasses import dataclass
+
+from .tracing import span
+
+LOGGER_NAME = "editor.llm"
+_LOGGER = logging.getLogger(LOGGER_NAME)
+
+
+def configure_logging(level: str | int = "INFO") -> logging.Logger:
+    """
+    Đặt mức log cho các adapter (logger "editor.llm") và gắn handler stderr nếu chưa có.
+    - INFO : một dòng thống kê cho mỗi lần gọi (TTFT, số token, tok/s)
+    - DEBUG: thêm log từng chunk stream (lấy mẫu theo `debug_sample_every`)
+    Không gọi hàm này thì chỉ WARNING trở lên được in ra (mặc định của logging).
+    """
+    if isinstance(level, str):
+        level = logging.getLevelName(level.strip().upper())
+        if not isinstance(level, int):
+            raise ValueError(f"Unknown log level: {level}")
+    _LOGGER.setLevel(level)
+    if not _LOGGER.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s [%(name)s] %(message)s"))
+        _LOGGER.addHandler(handler)
+        _LOGGER.propagate = False
+    return _LOGGER
+
+
+def _log_call_stats(adapter: str, stats: dict) -> None:
+    # Một dòng key=value cho mỗi lần gọi; dict đầy đủ nằm ở record.llm_call cho handler có cấu trúc (JSON)
+    if _LOGGER.isEnabledFor(logging.INFO):
+        fields = " ".join(f"{key}={value}" for key, value in stats.items() if value is not None)
+        _LOGGER.info("[%s] %s", adapter, fields, extra={"llm_call": stats})
+
+
+@dataclass
+class ChatResult:
+    text: str
+    finish_reason: str | None = None  # "stop" | "length" (chạm max_tokens) | None (backend không báo)
+    completion_tokens: int | None = None
+
+    @property
+    def truncated(self) -> bool:
+        return self.finish_reason == "length"
 
 
 class BaseLLM(ABC):
@@ -22,6 +68,32 @@ class BaseLLM(ABC):
     def chat(self, system: str, user: str) -> str:
         raise NotImplementedError
 
+    def complete(self, system: str, user: str, *, max_tokens: int | None = None) -> ChatResult:
+        """
+        Như chat() nhưng có trần token đầu ra (`max_tokens`, None = không giới hạn) và
+        trả về ChatResult kèm finish_reason. Mặc định: gọi chat(), không giới hạn.
+        """
+        return ChatResult(self.chat(system, user))
+
+    def chat_json(
+        self, system: str, user: str, *, schema: dict | None = None, max_tokens: int | None = None
+    ) -> ChatResult:
+        """
+        Gọi LLM với đầu ra JSON ràng buộc (constrained decoding) và giới hạn số token sinh ra.
+        - schema    : JSON schema của đối tượng trả về (backend nào hỗ trợ thì dùng)
+        - max_tokens: trần số token đầu ra (None = không giới hạn)
+        Trả về ChatResult như complete(), để bên gọi biết đầu ra có bị cắt ở trần không (truncated).
+        Mặc định: adapter không hỗ trợ thì gọi chat() thường.
+        """
+        return ChatResult(self.chat(system, user))
+
+    def health_check(self, timeout: float = 2.0) -> bool:
+        """
+        Kiểm tra nhanh backend còn sống (dùng cho LLMPool, editor/llm_pool.py).
+        Mặc định: adapter không có endpoint kiểm tra thì coi như luôn sống.
+        """
+        return True
+
 
 class OpenAIChatLLM(BaseLLM):
     """
@@ -54,6 +126,34 @@ class OpenAIChatLLM(BaseLLM):
         self.timeout = int(timeout)
 
     def chat(self, system: str, user: str) -> str:
+        return self._request(system, user).text
+
+    def health_check(self, timeout: float = 2.0) -> bool:
+        # GET /v1/models cạnh endpoint chat completions
+        models_url = self.api_url.rsplit("/chat/completions", 1)[0] + "/models"
+        try:
+            resp = requests.get(models_url, headers={"Authorization": f"Bearer {self.api_key}"}, timeout=timeout)
+        except requests.exceptions.RequestException:
+            return False
+        return resp.status_code < 500
+
+    def complete(self, system: str, user: str, *, max_tokens: int | None = None) -> ChatResult:
+        return self._request(system, user, **({"max_tokens": int(max_tokens)} if max_tokens else {}))
+
+    def chat_json(
+        self, system: str, user: str, *, schema: dict | None = None, max_tokens: int | None = None
+    ) -> ChatResult:
+        # Structured Outputs: schema "strict" nếu có, không thì JSON mode thường
+        if schema is not None:
+            response_format = {"type": "json_schema", "json_schema": {"name": "output", "strict": True, "schema": schema}}
+        else:
+            response_format = {"type": "json_object"}
+        extra: dict = {"response_format": response_format}
+        if max_tokens:
+            extra["max_tokens"] = int(max_tokens)
+        return self._request(system, user, **extra)
+
+    def _request(self, system: str, user: str, **extra) -> ChatResult:
         headers = {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json",
@@ -65,11 +165,34 @@ class OpenAIChatLLM(BaseLLM):
                 {"role": "user",   "content": user},
             ],
             "temperature": self.temperature,
+            **extra,
         }
-        resp = requests.post(self.api_url, headers=headers, data=json.dumps(payload), timeout=self.timeout)
-        resp.raise_for_status()
-        data = resp.json()
-        return (data["choices"][0]["message"]["content"] or "").strip()
+        with span("llm.chat", backend="openai", model=self.model, max_tokens=extra.get("max_tokens")) as llm_span:
+            resp = requests.post(self.api_url, headers=headers, data=json.dumps(payload), timeout=self.timeout)
+            resp.raise_for_status()
+            data = resp.json()
+            usage = data.get("usage") or {}
+            choice = data["choices"][0]
+            llm_span.set(
+                prompt_tokens=usage.get("prompt_tokens"),
+                completion_tokens=usage.get("completion_tokens"),
+                finish_reason=choice.get("finish_reason"),
+            )
+        _log_call_stats(
+            "OpenAIChatLLM",
+            {
+                "model": self.model,
+                "total_ms": round(llm_span.duration_ms),
+                "prompt_tokens": usage.get("prompt_tokens"),
+                "completion_tokens": usage.get("completion_tokens"),
+                "finish_reason": choice.get("finish_reason"),
+            },
+        )
+        return ChatResult(
+            (choice["message"]["content"] or "").strip(),
+            finish_reason=choice.get("finish_reason"),
+            completion_tokens=usage.get("completion_tokens"),
+        )
 
 
 class OllamaChatLLM(BaseLLM):
@@ -77,6 +200,8 @@ class OllamaChatLLM(BaseLLM):
     Ollama Local (API URL đầy đủ).
     - api_url: ví dụ "http://localhost:11434/api/generate" (BẮT BUỘC truyền vào)
     - model : ví dụ "llama3.1:8b-instruct-q6_K"
+    - debug_sample_every: ở mức DEBUG, log 1 trên N chunk stream (0 = không log chunk)
+    Mỗi lần gọi log đúng một dòng INFO: ttft_ms, chunks, tokens, tok_s, total_ms.
     """
 
     def __init__(
@@ -87,6 +212,7 @@ class OllamaChatLLM(BaseLLM):
         timeout: int = 300,
         max_retries: int = 3,
         retry_delay: float = 1.5,
+        debug_sample_every: int = 0,
     ):
         if not api_url:
             raise ValueError("OllamaChatLLM: 'api_url' is required.")
@@ -98,14 +224,48 @@ class OllamaChatLLM(BaseLLM):
         self.timeout = int(timeout)
         self.max_retries = max(1, int(max_retries))
         self.retry_delay = float(retry_delay)
+        self.debug_sample_every = max(0, int(debug_sample_every))
 
     def chat(self, system: str, user: str) -> str:
+        return self._generate(self._payload(system, user)).text
+
+    def health_check(self, timeout: float = 2.0) -> bool:
+        # GET /api/tags trên cùng host Ollama
+        tags_url = self.api_url.rsplit("/api/", 1)[0] + "/api/tags"
+        try:
+            resp = requests.get(tags_url, timeout=timeout)
+        except requests.exceptions.RequestException:
+            return False
+        return resp.status_code == 200
+
+    def complete(self, system: str, user: str, *, max_tokens: int | None = None) -> ChatResult:
+        return self._generate(self._payload(system, user, max_tokens))
+
+    def chat_json(
+        self, system: str, user: str, *, schema: dict | None = None, max_tokens: int | None = None
+    ) -> ChatResult:
+        # `format: "json"` ép Ollama sinh JSON hợp lệ (grammar); cấu trúc cụ thể do prompt quy định.
+        payload = self._payload(system, user, max_tokens)
+        payload["format"] = "json"
+        return self._generate(payload)
+
+    def _payload(self, system: str, user: str, max_tokens: int | None = None) -> dict:
         # Ghép prompt theo format đơn giản [SYSTEM]...[USER]...
         prompt = f"[SYSTEM]\n{system}\n\n[USER]\n{user}"
         payload = {"model": self.model, "prompt": prompt, "stream": True}
+        if max_tokens:
+            payload["options"] = {"num_predict": int(max_tokens)}
+        return payload
+
+    def _generate(self, payload: dict) -> ChatResult:
+        max_tokens = (payload.get("options") or {}).get("num_predict")
+        with span("llm.chat", backend="ollama", model=self.model, max_tokens=max_tokens) as llm_span:
+            return self._stream_with_retries(payload, llm_span)
 
+    def _stream_with_retries(self, payload: dict, llm_span) -> ChatResult:
         last_error: Exception | None = None
         for attempt in range(1, self.max_retries + 1):
+            llm_span.set(attempts=attempt)
             try:
                 with requests.post(
                     self.api_url,
@@ -116,9 +276,13 @@ class OllamaChatLLM(BaseLLM):
                     resp.raise_for_status()
 
                     chunks: list[str] = []
-                    start_time = time.time()
+                    start_time = time.perf_counter()
+                    first_token_at: float | None = None
                     last_tick = start_time
                     chunk_idx = 0
+                    done_event: dict = {}
+                    # Quyết định một lần cho cả lần gọi, không kiểm tra mức log trên từng chunk
+                    sample_every = self.debug_sample_every if _LOGGER.isEnabledFor(logging.DEBUG) else 0
 
                     for raw_line in resp.iter_lines(decode_unicode=True):
                         if not raw_line:
@@ -126,7 +290,7 @@ class OllamaChatLLM(BaseLLM):
                         try:
                             event = json.loads(raw_line)
                         except json.JSONDecodeError as exc:
-                            print(f"[OllamaChatLLM] Bỏ qua chunk không hợp lệ: {exc}", file=sys.stderr, flush=True)
+                            _LOGGER.warning("[OllamaChatLLM] Bỏ qua chunk không hợp lệ: %s", exc)
                             continue
 
                         if event.get("error"):
@@ -135,31 +299,43 @@ class OllamaChatLLM(BaseLLM):
                         piece = event.get("response") or ""
                         if piece:
                             chunk_idx += 1
-                            now = time.time()
-                            delta_ms = int((now - last_tick) * 1000)
-                            total_ms = int((now - start_time) * 1000)
-                            # Log chunk-level latency to track streaming speed.
-                            print(
-                                f"[OllamaChatLLM] chunk#{chunk_idx} dt={delta_ms}ms total={total_ms}ms len={len(piece)}",
-                                file=sys.stderr,
-                                flush=True,
-                            )
+                            if first_token_at is None:
+                                first_token_at = time.perf_counter()
+                            if sample_every and chunk_idx % sample_every == 0:
+                                now = time.perf_counter()
+                                _LOGGER.debug(
+                                    "[OllamaChatLLM] chunk#%d dt=%dms total=%dms len=%d",
+                                    chunk_idx,
+                                    (now - last_tick) * 1000,
+                                    (now - start_time) * 1000,
+                                    len(piece),
+                                )
+                                last_tick = now
                             chunks.append(piece)
-                            last_tick = now
 
                         if event.get("done"):
+                            done_event = event
                             break
 
-                    return "".join(chunks).strip()
+                    stats = self._call_stats(start_time, first_token_at, chunk_idx, done_event, attempt)
+                    llm_span.set(**{k: v for k, v in stats.items() if k not in ("model", "total_ms")})
+                    _log_call_stats("OllamaChatLLM", stats)
+                    return ChatResult(
+                        "".join(chunks).strip(),
+                        finish_reason=stats["finish_reason"],
+                        completion_tokens=stats["completion_tokens"],
+                    )
             except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as exc:
                 last_error = exc
                 if attempt >= self.max_retries:
                     break
                 wait_seconds = self.retry_delay * (2 ** (attempt - 1))
-                print(
-                    f"[OllamaChatLLM] Lỗi kết nối ({exc}). Thử lại {attempt + 1}/{self.max_retries} sau {wait_seconds:.1f}s.",
-                    file=sys.stderr,
-                    flush=True,
+                _LOGGER.warning(
+                    "[OllamaChatLLM] Lỗi kết nối (%s). Thử lại %d/%d sau %.1fs.",
+                    exc,
+                    attempt + 1,
+                    self.max_retries,
+                    wait_seconds,
                 )
                 time.sleep(wait_seconds)
             except requests.exceptions.RequestException as exc:
@@ -168,3 +344,33 @@ class OllamaChatLLM(BaseLLM):
         if last_error is not None:
             raise RuntimeError(f"Ollama connection failed after {self.max_retries} attempts: {last_error}") from last_error
         raise RuntimeError("OllamaChatLLM: Failed to generate response.")
+
+    def _call_stats(
+        self,
+        start_time: float,
+        first_token_at: float | None,
+        chunk_count: int,
+        done_event: dict,
+        attempt: int,
+    ) -> dict:
+        # Ưu tiên số token Ollama báo trong event cuối; thiếu thì dùng số chunk (~1 token/chunk)
+        end_time = time.perf_counter()
+        completion_tokens = done_event.get("eval_count") or chunk_count
+        eval_ns = done_event.get("eval_duration")
+        if eval_ns:
+            tokens_per_s = completion_tokens / (eval_ns / 1e9)
+        elif first_token_at is not None and end_time > first_token_at:
+            tokens_per_s = completion_tokens / (end_time - first_token_at)
+        else:
+            tokens_per_s = None
+        return {
+            "model": self.model,
+            "ttft_ms": round((first_token_at - start_time) * 1000, 3) if first_token_at is not None else None,
+            "chunks": chunk_count,
+            "prompt_tokens": done_event.get("prompt_eval_count"),
+            "completion_tokens": completion_tokens,
+            "tokens_per_s": round(tokens_per_s, 1) if tokens_per_s is not None else None,
+            "total_ms": round((end_time - start_time) * 1000),
+            "attempts": attempt,
+            "finish_reason": done_event.get("done_reason"),
+        }
@@ -0,0 +1,294 @@
+# -*- coding: utf-8 -*-
+"""
+A pool of interchangeable LLM backends (several Ollama hosts, OpenAI, ...).
+
+`LLMPool` is itself a `BaseLLM`, so the pipelines, the classifier and the
+router (editor.routing) use it like a single adapter:
+
+- Balancing: every call goes to the member with the fewest requests in
+  flight (ties go to the member with fewer calls so far). One shared pool
+  per process (`get_shared_pool`) sees the load of all concurrent documents.
+- Failover: a call that fails because of the backend (connection error,
+  timeout, HTTP 5xx or 429) is retried on the next-best member that has not
+  been tried yet. The last error is raised only when every member failed.
+  Any other error (HTTP 400/401/404/422, a bad payload or schema) is about
+  the request itself; it is raised at once and not counted against the member.
+- Circuit breaking: after `failure_threshold` consecutive failures a member is
+  skipped for `cooldown` seconds. Then one probe call is let through. Success
+  closes the circuit, and another failure opens it for a new cooldown. If
+  every circuit is open, the member that reopens first is tried anyway.
+- Health checks: with `health_interval > 0` a daemon thread calls each
+  member's `health_check()` (Ollama `/api/tags`, OpenAI `/models`). It opens
+  the circuit of members that are down and closes it once they answer again.
+
+Members should fail fast: `build_llm_pool` gives Ollama members a single
+connection attempt by default (`max_retries: 1`), because the pool retries
+on another host instead of waiting on a dead one.
+
+Configure with `Config.LLM_POOL` (list of backend specs, see
+`editor.routing.build_backend`); a routed backend in `Config.LLM_BACKENDS`
+can also be a pool: `{"pool": [spec, spec, ...]}`.
+"""
+
+from __future__ import annotations
+
+import json
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence, Set
+
+import requests
+
+from .llm import BaseLLM, ChatResult
+from .routing import build_backend
+
+_BACKEND_ERRORS = (
+    requests.exceptions.ConnectionError,
+    requests.exceptions.Timeout,
+    requests.exceptions.ChunkedEncodingError,  # connection dropped mid-response
+)
+
+
+def _is_backend_failure(exc: BaseException) -> bool:
+    """True when `exc` (or an error it wraps) means the backend is unavailable, not that the request is bad."""
+    seen: Set[int] = set()
+    while exc is not None and id(exc) not in seen:
+        seen.add(id(exc))
+        if isinstance(exc, _BACKEND_ERRORS):
+            return True
+        if isinstance(exc, requests.exceptions.HTTPError):
+            status = getattr(exc.response, "status_code", None)
+            return status is None or status >= 500 or status == 429
+        # The adapters wrap transport errors (e.g. "Ollama connection failed ...") with `raise ... from exc`.
+        exc = exc.__cause__
+    return False
+
+
+class _Member:
+    __slots__ = ("name", "llm", "inflight", "calls", "errors", "failures", "open_until", "healthy")
+
+    def __init__(self, name: str, llm: BaseLLM):
+        self.name = name
+        self.llm = llm
+        self.inflight = 0
+        self.calls = 0
+        self.errors = 0
+        self.failures = 0  # consecutive
+        self.open_until = 0.0  # monotonic deadline of an open circuit; 0 = closed
+        self.healthy = True
+
+
+class LLMPool(BaseLLM):
+    """Least-outstanding-requests pool with failover, circuit breaking and health checks."""
+
+    def __init__(
+        self,
+        members: Dict[str, BaseLLM],
+        *,
+        failure_threshold: int = 3,
+        cooldown: float = 30.0,
+        health_interval: float = 0.0,
+        health_timeout: float = 2.0,
+    ):
+        if not members:
+            raise ValueError("LLMPool needs at least one backend.")
+        self._members = [_Member(name, llm) for name, llm in members.items()]
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.cooldown = float(cooldown)
+        self.health_interval = float(health_interval)
+        self.health_timeout = float(health_timeout)
+        self.model = "pool(" + ",".join(sorted({str(getattr(m.llm, "model", "")) for m in self._members})) + ")"
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # --- BaseLLM ----------------------------------------------------------
+
+    def chat(self, system: str, user: str) -> str:
+        return self._call("chat", system, user)
+
+    def complete(self, system: str, user: str, *, max_tokens: int | None = None) -> ChatResult:
+        return self._call("complete", system, user, max_tokens=max_tokens)
+
+    def chat_json(
+        self, system: str, user: str, *, schema: dict | None = None, max_tokens: int | None = None
+    ) -> ChatResult:
+        return self._call("chat_json", system, user, schema=schema, max_tokens=max_tokens)
+
+    def health_check(self, timeout: float = 2.0) -> bool:
+        return any(member.llm.health_check(timeout) for member in self._members)
+
+    # --- balancing / circuit breaking ------------------------------------
+
+    def _acquire(self, tried: Set[str]) -> Optional[_Member]:
+        now = time.monotonic()
+        with self._lock:
+            untried = [m for m in self._members if m.name not in tried]
+            candidates = [m for m in untried if m.open_until <= now]
+            if not candidates:
+                if tried or not untried:
+                    return None
+                # Every circuit is open: try the one closest to reopening rather than failing outright.
+                candidates = [min(untried, key=lambda m: m.open_until)]
+            member = min(candidates, key=lambda m: (m.inflight, m.calls))
+            if member.failures >= self.failure_threshold:
+                # Half-open: this call is the probe; keep others away until it returns.
+                member.open_until = now + self.cooldown
+            member.inflight += 1
+            member.calls += 1
+            return member
+
+    def _release(self, member: _Member, error: Optional[BaseException], *, backend_failure: bool = True) -> None:
+        with self._lock:
+            member.inflight -= 1
+            if error is not None and not backend_failure:
+                member.errors += 1  # the request was rejected; the member itself is fine
+                return
+            if error is None:
+                if member.failures >= self.failure_threshold:
+                    print(f"[llm_pool] '{member.name}' hoạt động trở lại, đóng circuit.")
+                member.failures = 0
+                member.open_until = 0.0
+                return
+            member.errors += 1
+            member.failures += 1
+            if member.failures >= self.failure_threshold:
+                member.open_until = time.monotonic() + self.cooldown
+                if member.failures == self.failure_threshold:
+                    print(
+                        f"[llm_pool] '{member.name}' lỗi {member.failures} lần liên tiếp, "
+                        f"tạm ngưng {self.cooldown:g}s."
+                    )
+
+    def _call(self, method: str, *args: Any, **kwargs: Any) -> Any:
+        tried: Set[str] = set()
+        last_error: Optional[Exception] = None
+        while True:
+            member = self._acquire(tried)
+            if member is None:
+                break
+            tried.add(member.name)
+            try:
+                result = getattr(member.llm, method)(*args, **kwargs)
+            except Exception as exc:  # noqa: BLE001 - fail over to the next member
+                if not _is_backend_failure(exc):
+                    # Every member would reject the same request: no failover, no strike on the circuit.
+                    self._release(member, exc, backend_failure=False)
+                    raise
+                self._release(member, exc)
+                last_error = exc
+                print(f"[llm_pool] '{member.name}' lỗi ({type(exc).__name__}: {exc}), chuyển backend khác.")
+                continue
+            self._release(member, None)
+            return result
+        if last_error is not None:
+            raise last_error
+        raise RuntimeError("LLMPool: no backend available.")
+
+    # --- health checks ----------------------------------------------------
+
+    def check_health(self) -> None:
+        """Probe every member once and open/close circuits accordingly."""
+        for member in self._members:
+            healthy = member.llm.health_check(self.health_timeout)
+            with self._lock:
+                if not healthy:
+                    member.failures = max(member.failures, self.failure_threshold)
+                    member.open_until = time.monotonic() + max(self.cooldown, self.health_interval)
+                elif not member.healthy and member.inflight == 0:
+                    member.failures = 0
+                    member.open_until = 0.0
+                changed, member.healthy = member.healthy != healthy, healthy
+            if changed:
+                state = "sống lại" if healthy else "không phản hồi health check"
+                print(f"[llm_pool] '{member.name}' {state}.")
+
+    def _run_health_checks(self) -> None:
+        # First round right away, so a host that is already down never sees traffic.
+        while True:
+            self.check_health()
+            if self._stop.wait(self.health_interval):
+                return
+
+    def start(self) -> "LLMPool":
+        """Start the background health checks (no-op when health_interval <= 0; idempotent)."""
+        if self.health_interval > 0 and (self._thread is None or not self._thread.is_alive()):
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run_health_checks, name="llm-pool-health", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.health_interval + self.health_timeout + 1.0)
+            self._thread = None
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """Per-member counters (for /metrics)."""
+        now = time.monotonic()
+        with self._lock:
+            return [
+                {
+                    "member": m.name,
+                    "inflight": m.inflight,
+                    "calls": m.calls,
+                    "errors": m.errors,
+                    "circuit_open": m.open_until > now,
+                    "healthy": m.healthy,
+                }
+                for m in self._members
+            ]
+
+
+def _member_name(spec: Dict[str, Any], index: int) -> str:
+    if spec.get("name"):
+        return str(spec["name"])
+    url = str(spec.get("api_url") or "")
+    host = url.split("://", 1)[-1].split("/", 1)[0]
+    return f"{spec.get('provider', 'ollama')}@{host or index}"
+
+
+def build_llm_pool(specs: Sequence[Dict[str, Any]], config: Any) -> LLMPool:
+    """Pool over backend specs (`editor.routing.build_backend` format, plus optional "name")."""
+    members: Dict[str, BaseLLM] = {}
+    for index, spec in enumerate(specs):
+        spec = dict(spec)
+        spec.setdefault("max_retries", 1)
+        name = _member_name(spec, index)
+        if name in members:
+            name = f"{name}#{index}"
+        members[name] = build_backend(spec, config)
+    return LLMPool(
+        members,
+        failure_threshold=getattr(config, "LLM_POOL_FAILURE_THRESHOLD", 3),
+        cooldown=getattr(config, "LLM_POOL_COOLDOWN", 30.0),
+        health_interval=getattr(config, "LLM_POOL_HEALTH_INTERVAL", 0.0),
+        health_timeout=getattr(config, "LLM_POOL_HEALTH_TIMEOUT", 2.0),
+    ).start()
+
+
+_SHARED_LOCK = threading.Lock()
+_SHARED_POOLS: Dict[str, LLMPool] = {}
+
+
+def get_shared_pool(config: Any, specs: Optional[Sequence[Dict[str, Any]]] = None) -> Optional[LLMPool]:
+    """
+    Process-wide pool for `specs` (default `config.LLM_POOL`), or None when it
+    is empty. The same specs always return the same pool, so in-flight counts
+    and circuits are shared by every request.
+    """
+    specs = list(specs if specs is not None else (getattr(config, "LLM_POOL", None) or []))
+    if not specs:
+        return None
+    key = json.dumps(specs, sort_keys=True, default=str)
+    with _SHARED_LOCK:
+        pool = _SHARED_POOLS.get(key)
+        if pool is None:
+            pool = _SHARED_POOLS[key] = build_llm_pool(specs, config)
+        return pool
+
+
+def shared_pools() -> List[LLMPool]:
+    with _SHARED_LOCK:
+        return list(_SHARED_POOLS.values())
@@ -0,0 +1,385 @@
+# -*- coding: utf-8 -*-
+"""
+Prometheus-style metrics for the APIs.
+
+A small, dependency-free registry of counters, gauges and histograms with
+labels, rendered in the Prometheus text exposition format (0.0.4) by
+`render()`; the API serves it on `GET /metrics`.
+
+Most pipeline metrics are derived from the finished document trace
+(`observe_document`), so the pipelines only need their `editor.tracing`
+spans: documents, chunks, per-stage durations, LLM latency by backend and
+label set, token counts, embedding batch sizes and errors. Values that live
+elsewhere (e.g. the registry mask cache counters) are read at scrape time by
+collectors registered with `register_collector`.
+"""
+
+from __future__ import annotations
+
+import math
+import threading
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LabelValues = Tuple[str, ...]
+Sample = Tuple[str, Dict[str, str], float]  # (name suffix, labels, value)
+
+# Seconds; an edit call on a local 8B model commonly takes tens of seconds.
+LLM_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0, 300.0)
+STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+DOCUMENT_BUCKETS = (0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1200.0, 1800.0, 3600.0)
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _escape_help(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n")
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(str(value))}"' for key, value in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric(ABC):
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> LabelValues:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name}: expected labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    @abstractmethod
+    def samples(self) -> List[Sample]:
+        """(name suffix, labels, value) rows for the exposition."""
+
+
+class Counter(_Metric):
+    """Monotonic counter; name it with a `_total` suffix."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        if amount < 0:
+            raise ValueError("Counter can only increase")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: Any) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> List[Sample]:
+        with self._lock:
+            items = list(self._values.items())
+        return [("", dict(zip(self.labelnames, key)), value) for key, value in items]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def set(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: Any) -> None:
+        self.inc(-amount, **labels)
+
+    def value(self, **labels: Any) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> List[Sample]:
+        with self._lock:
+            items = list(self._values.items())
+        return [("", dict(zip(self.labelnames, key)), value) for key, value in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = STAGE_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(float(b) for b in buckets))
+        # per label set: [bucket counts..., +Inf count], sum
+        self._values: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.setdefault(key, ([0] * (len(self.buckets) + 1), [0.0]))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[-1] += 1
+            total[0] += value
+
+    def count(self, **labels: Any) -> int:
+        entry = self._values.get(self._key(labels))
+        return sum(entry[0]) if entry else 0
+
+    def samples(self) -> List[Sample]:
+        out: List[Sample] = []
+        with self._lock:
+            items = [(key, list(counts), total[0]) for key, (counts, total) in self._values.items()]
+        for key, counts, total in items:
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                out.append(("_bucket", {**labels, "le": _format_value(bound)}, cumulative))
+            out.append(("_sum", labels, total))
+            out.append(("_count", labels, cumulative))
+        return out
+
+
+Collector = Callable[[], Iterable[Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]]]
+
+
+class MetricsRegistry:
+    """Named metrics plus scrape-time collectors, rendered together."""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Collector] = []
+        self._lock = threading.Lock()
+
+    def _add(self, metric: _Metric) -> Any:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric already registered: {metric.name}")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._add(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._add(Gauge(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = STAGE_BUCKETS,
+    ) -> Histogram:
+        return self._add(Histogram(name, documentation, labelnames, buckets))
+
+    def register_collector(self, collector: Collector) -> None:
+        """`collector()` yields (name, type, help, [(labels, value), ...]) at scrape time."""
+        with self._lock:
+            self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines: List[str] = []
+
+        def emit(name: str, kind: str, documentation: str, samples: Iterable[Sample]) -> None:
+            lines.append(f"# HELP {name} {_escape_help(documentation)}")
+            lines.append(f"# TYPE {name} {kind}")
+            for suffix, labels, value in samples:
+                lines.append(f"{name}{suffix}{_format_labels(labels)} {_format_value(value)}")
+
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors)
+        for metric in metrics:
+            emit(metric.name, metric.kind, metric.documentation, metric.samples())
+        for collector in collectors:
+            try:
+                families = list(collector())
+            except Exception as exc:  # noqa: BLE001 - a broken collector must not break the scrape
+                print(f"[metrics] Collector lỗi: {exc}")
+                continue
+            for name, kind, documentation, values in families:
+                emit(name, kind, documentation, [("", labels, value) for labels, value in values])
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+DOCUMENTS = REGISTRY.counter("mucvu_documents_total", "Documents processed, by API and outcome.", ("api", "status"))
+DOCUMENT_SECONDS = REGISTRY.histogram(
+    "mucvu_document_duration_seconds", "End-to-end document processing time.", ("api",), DOCUMENT_BUCKETS
+)
+CHUNKS = REGISTRY.counter("mucvu_chunks_total", "Chunks (paragraph segments) edited.", ("api",))
+CHUNKS_FAILED = REGISTRY.counter(
+    "mucvu_chunks_failed_total", "Chunks left unedited after all retries (original text kept).", ("api",)
+)
+EDIT_ROUTES = REGISTRY.counter(
+    "mucvu_edit_routes_total", "Edit calls by routed backend (editor.routing).", ("api", "backend")
+)
+CHUNKS_SKIPPED = REGISTRY.counter(
+    "mucvu_chunks_skipped_total",
+    "Chunks passed through without an LLM call (editor.noop), by reason.",
+    ("api", "reason"),
+)
+EDIT_REJECTIONS = REGISTRY.counter(
+    "mucvu_edit_rejections_total", "Edit outputs rejected by validation, by reason.", ("api", "reason")
+)
+STAGE_SECONDS = REGISTRY.histogram(
+    "mucvu_stage_duration_seconds", "Duration of each pipeline stage span.", ("api", "stage"), STAGE_BUCKETS
+)
+LLM_SECONDS = REGISTRY.histogram(
+    "mucvu_llm_request_duration_seconds",
+    "LLM call latency by backend and label set (classify calls use label_set=\"classify\").",
+    ("backend", "label_set"),
+    LLM_BUCKETS,
+)
+LLM_TTFT_SECONDS = REGISTRY.histogram(
+    "mucvu_llm_time_to_first_token_seconds", "Time to first streamed token.", ("backend",), LLM_BUCKETS
+)
+LLM_TOKENS = REGISTRY.counter("mucvu_llm_tokens_total", "Tokens reported by the LLM backend.", ("backend", "kind"))
+LLM_ERRORS = REGISTRY.counter("mucvu_llm_errors_total", "Failed LLM calls.", ("backend",))
+LLM_TRUNCATED = REGISTRY.counter(
+    "mucvu_llm_truncated_total", "LLM calls stopped by their max_tokens budget.", ("backend", "label_set")
+)
+EMBED_BATCH = REGISTRY.histogram(
+    "mucvu_embedding_batch_size", "Texts per embedding encode call.", ("backend",), BATCH_BUCKETS
+)
+ERRORS = REGISTRY.counter("mucvu_errors_total", "Errors by API and pipeline stage.", ("api", "stage"))
+INFLIGHT = REGISTRY.gauge("mucvu_documents_in_progress", "Documents currently being processed.", ("api",))
+QUEUED = REGISTRY.gauge("mucvu_jobs_queued", "Async jobs accepted but not started yet.", ("api",))
+
+
+def _label_set(labels: Any) -> str:
+    if not labels:
+        return "none"
+    return "+".join(sorted(str(label) for label in labels))
+
+
+def observe_document(trace: Any, *, api: str, status: str, chunks: int = 0, failed: int = 0) -> None:
+    """Record one finished document run from its `editor.tracing.Trace`."""
+    DOCUMENTS.inc(api=api, status=status)
+    DOCUMENT_SECONDS.observe(trace.duration_ms / 1000.0, api=api)
+    if chunks:
+        CHUNKS.inc(chunks, api=api)
+    if failed:
+        CHUNKS_FAILED.inc(failed, api=api)
+
+    spans = trace.all_spans()
+    by_id = {item.span_id: item for item in spans}
+    for item in spans[1:]:
+        seconds = item.duration_ms / 1000.0
+        attrs = item.attributes
+        STAGE_SECONDS.observe(seconds, api=api, stage=item.name)
+        if item.status == "error":
+            ERRORS.inc(api=api, stage=item.name)
+
+        if item.name == "llm.chat":
+            backend = str(attrs.get("backend", "unknown"))
+            parent = by_id.get(item.parent_id or "")
+            if parent is not None and parent.name == "edit":
+                label_set = _label_set(parent.attributes.get("labels"))
+            else:
+                label_set = parent.name if parent is not None else "none"
+            LLM_SECONDS.observe(seconds, backend=backend, label_set=label_set)
+            if attrs.get("ttft_ms") is not None:
+                LLM_TTFT_SECONDS.observe(float(attrs["ttft_ms"]) / 1000.0, backend=backend)
+            for kind in ("prompt", "completion"):
+                tokens = attrs.get(f"{kind}_tokens")
+                if tokens:
+                    LLM_TOKENS.inc(float(tokens), backend=backend, kind=kind)
+            if item.status == "error":
+                LLM_ERRORS.inc(backend=backend)
+            if attrs.get("finish_reason") == "length":
+                LLM_TRUNCATED.inc(backend=backend, label_set=label_set)
+        elif item.name == "edit":
+            if attrs.get("backend"):
+                EDIT_ROUTES.inc(api=api, backend=str(attrs["backend"]))
+            if attrs.get("rejected"):
+                EDIT_REJECTIONS.inc(api=api, reason=str(attrs["rejected"]))
+        elif item.name == "noop" and attrs.get("reason"):
+            CHUNKS_SKIPPED.inc(api=api, reason=str(attrs["reason"]))
+        elif item.name == "embed" and attrs.get("batch"):
+            EMBED_BATCH.observe(float(attrs["batch"]), backend=str(attrs.get("backend", "torch")))
+
+
+def registry_cache_collector(get_registry: Callable[[], Any]) -> Collector:
+    """Collector exposing the PromptRegistry mask-cache hit/miss counters."""
+
+    def collect():
+        registry = get_registry()
+        hits = float(getattr(registry, "mask_cache_hits", 0))
+        misses = float(getattr(registry, "mask_cache_misses", 0))
+        return [
+            (
+                "mucvu_registry_cache_requests_total",
+                "counter",
+                "System prompt lookups in the registry mask cache (resets when the registry is reloaded).",
+                [({"result": "hit"}, hits), ({"result": "miss"}, misses)],
+            )
+        ]
+
+    return collect
+
+
+def llm_pool_collector(get_pools: Callable[[], Sequence[Any]]) -> Collector:
+    """Collector exposing per-backend load and circuit state of the LLM pools (editor.llm_pool)."""
+
+    def collect():
+        rows = [row for pool in get_pools() for row in pool.stats()]
+        if not rows:
+            return []
+
+        def samples(field):
+            return [({"member": row["member"]}, float(row[field])) for row in rows]
+
+        return [
+            ("mucvu_llm_pool_inflight", "gauge", "LLM requests in flight per pool backend.", samples("inflight")),
+            (
+                "mucvu_llm_pool_circuit_open",
+                "gauge",
+                "1 while the backend's circuit is open (skipped after failures or a failed health check).",
+                samples("circuit_open"),
+            ),
+            ("mucvu_llm_pool_calls_total", "counter", "LLM calls sent to each pool backend.", samples("calls")),
+            ("mucvu_llm_pool_errors_total", "counter", "Failed LLM calls per pool backend.", samples("errors")),
+        ]
+
+    return collect
+
+
+def render(registry: Optional[MetricsRegistry] = None) -> str:
+    return (registry or REGISTRY).render()
@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+"""
+Speculative no-op detection: pass through paragraphs that the editor would
+return unchanged, without an LLM call.
+
+Two signals, checked before a chunk is classified/edited:
+
+- Heuristics for short chunks (at most `NOOP_MAX_CHARS`): every non-empty
+  line must be a scripture reference ("Ga 3,16-18"), a date ("Chúa nhật,
+  ngày 19/10/2025"), a bare link/e-mail, a line with no words (numbers,
+  dividers) or a signature ("Lm. Giuse Nguyễn Văn An", "TM. Ban Mục vụ").
+  The regexes are `DEFAULT_PATTERNS`, and `Config.NOOP_PATTERNS` replaces
+  them. The signature check is code (`NOOP_NAME_CHECKS`). Lists of
+  capitalised names are opt-in (`NOOP_NAME_LISTS`): Title-Case headings such
+  as "Thánh Lễ, Chầu Thánh Thể, Giải Tội" look the same and do get edited.
+- History: a set of hashes of chunks that the LLM already returned unchanged
+  (whitespace aside). The hash covers the text and a scope, i.e. the registry
+  fingerprint and the editing model. A new prompt or model therefore starts
+  from an empty history. The set is appended to `NOOP_HISTORY_PATH` (one hash
+  per line) and shared by every pipeline in the process.
+
+A skipped chunk is a normal "ok" ChunkResult with `skipped` set to the reason
+("history", "scripture", ...). The pipelines also open a "noop" span, which
+feeds `mucvu_chunks_skipped_total`.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Optional, Pattern
+
+DEFAULT_PATTERNS: Dict[str, str] = {
+    # "Ga 3,16", "(1 Cr 13,4-7)", "Mt 5,1-12a; 6,3"
+    "scripture": (
+        r"^\(?\s*(?:[1-3]\s*)?[A-ZĐ][a-zđ]{0,3}\.?\s*\d{1,3}\s*[,:]\s*\d{1,3}[a-d]?(?:\s*[-–]\s*\d{1,3}[a-d]?)?"
+        r"(?:\s*[.;,]\s*\d{1,3}(?:\s*[,:]\s*\d{1,3})?[a-d]?(?:\s*[-–]\s*\d{1,3}[a-d]?)?)*\s*\)?\.?$"
+    ),
+    # "19/10/2025", "Chúa nhật, ngày 19 tháng 10 năm 2025", "Thứ Bảy 18.10"
+    "date": (
+        r"(?i)^(?:(?:thứ\s+\w+|chúa\s+nhật|chủ\s+nhật)\s*,?\s*)?(?:ngày\s+)?"
+        r"\d{1,2}\s*(?:[/.-]|\s+tháng\s+)\s*\d{1,2}"
+        r"(?:\s*(?:[/.-]|\s+năm\s+)\s*\d{2,4})?\s*\.?$"
+    ),
+    "link": r"^(?:https?://\S+|www\.\S+|[\w.+-]+@[\w-]+\.[\w.]+)$",
+    "no_words": r"^[\W\d_]+$",
+}
+
+_WHITESPACE = re.compile(r"\s+")
+_SIGNATURE_TITLE = re.compile(
+    r"^(?:TM|T\.M|TL|Thay mặt|Lm|Linh mục|Gm|Giám mục|TGM|Tgm|Phó tế|Pt|Sr|Nt)\.?\s+(.+)$"
+)
+_LIST_SEPARATORS = re.compile(r"\s*[,;]\s*")
+
+
+def normalize(text: str) -> str:
+    """Text with whitespace collapsed, the form compared for "unchanged"."""
+    return _WHITESPACE.sub(" ", text or "").strip()
+
+
+def is_signature(line: str) -> bool:
+    """Title + name: "Lm. Giuse Nguyễn Văn An", "TM. Ban Mục vụ Giáo xứ" (not "Linh mục chủ tế ...")."""
+    found = _SIGNATURE_TITLE.match(line.strip())
+    if not found:
+        return False
+    words = found.group(1).rstrip(".").split()
+    if not 1 <= len(words) <= 8 or not words[0][0].isupper():
+        return False
+    if any(ch in found.group(1) for ch in "!?:;"):
+        return False
+    return 2 * sum(word[0].isupper() for word in words) >= len(words)
+
+
+def is_name_list(line: str, min_items: int = 3) -> bool:
+    """`min_items`+ comma/semicolon-separated items of 1-7 capitalised words ("Ông Giuse An, Bà Maria Bình, ...")."""
+    line = line.strip().rstrip(".")
+    if not any(ch.islower() for ch in line):
+        return False  # all caps: a title, which the title prompt does edit
+    items = [item for item in _LIST_SEPARATORS.split(line) if item]
+    if len(items) < min_items:
+        return False  # "Thông Báo, Lịch Lễ" is a heading, not a list
+    for item in items:
+        words = item.split()
+        if not 1 <= len(words) <= 7 or not all(word[0].isupper() for word in words):
+            return False
+    return True
+
+
+class NoopDetector:
+    """Heuristic patterns plus the (optionally persisted) history of unchanged edits."""
+
+    def __init__(
+        self,
+        *,
+        patterns: Optional[Dict[str, str]] = None,
+        name_checks: bool = True,
+        name_lists: bool = False,
+        max_chars: int = 300,
+        history: bool = True,
+        history_path: Optional[Path] = None,
+        history_max: int = 100_000,
+    ):
+        source = DEFAULT_PATTERNS if patterns is None else patterns
+        self.patterns: Dict[str, Pattern[str]] = {name: re.compile(rx) for name, rx in source.items()}
+        self.name_checks = name_checks
+        self.name_lists = name_lists
+        self.max_chars = int(max_chars)
+        self.history_enabled = history
+        self.history_path = Path(history_path) if history_path else None
+        self.history_max = max(1, int(history_max))
+        self._history: "OrderedDict[str, None]" = OrderedDict()
+        self._lock = threading.Lock()
+        if history and self.history_path is not None:
+            self._load()
+
+    def _load(self) -> None:
+        if not self.history_path.is_file():
+            return
+        lines = self.history_path.read_text(encoding="utf-8").split()
+        for key in lines[-self.history_max:]:
+            self._history[key] = None
+        if len(lines) > 2 * self.history_max:
+            # Compact: keep only the retained tail on disk.
+            self.history_path.write_text("\n".join(self._history) + "\n", encoding="utf-8")
+
+    def __len__(self) -> int:
+        return len(self._history)
+
+    @staticmethod
+    def key(text: str, scope: str = "") -> str:
+        return hashlib.sha1(f"{scope}\x00{normalize(text)}".encode("utf-8")).hexdigest()
+
+    def match_line(self, line: str) -> Optional[str]:
+        for name, pattern in self.patterns.items():
+            if pattern.match(line):
+                return name
+        if self.name_checks and is_signature(line):
+            return "signature"
+        if self.name_lists and is_name_list(line):
+            return "name_list"
+        return None
+
+    def heuristic(self, text: str) -> Optional[str]:
+        """Pattern name when every non-empty line of `text` matches one, else None."""
+        text = (text or "").strip()
+        if not text or len(text) > self.max_chars:
+            return None
+        reasons = []
+        for line in text.splitlines():
+            if not line.strip():
+                continue
+            reason = self.match_line(line.strip())
+            if reason is None:
+                return None
+            reasons.append(reason)
+        return reasons[0] if len(set(reasons)) == 1 else "mixed"
+
+    def check(self, text: str, scope: str = "") -> Optional[str]:
+        """Skip reason ("history" or a pattern name) for `text`, or None when it must be edited."""
+        if self.history_enabled and self._history:
+            key = self.key(text, scope)
+            with self._lock:
+                if key in self._history:
+                    self._history.move_to_end(key)
+                    return "history"
+        return self.heuristic(text)
+
+    def observe(self, text: str, edited: str, scope: str = "") -> bool:
+        """Remember `text` when the editor returned it unchanged; returns True if newly recorded."""
+        if not self.history_enabled or normalize(edited) != normalize(text) or not normalize(text):
+            return False
+        key = self.key(text, scope)
+        with self._lock:
+            if key in self._history:
+                return False
+            self._history[key] = None
+            while len(self._history) > self.history_max:
+                self._history.popitem(last=False)
+            if self.history_path is not None:
+                self.history_path.parent.mkdir(parents=True, exist_ok=True)
+                with self.history_path.open("a", encoding="utf-8") as handle:
+                    handle.write(key + "\n")
+        return True
+
+
+@dataclass
+class NoopFilter:
+    """A detector bound to one pipeline's scope (registry rules + editing model)."""
+
+    detector: NoopDetector
+    scope: str = ""
+
+    def check(self, text: str) -> Optional[str]:
+        return self.detector.check(text, self.scope)
+
+    def observe(self, text: str, edited: str) -> bool:
+        return self.detector.observe(text, edited, self.scope)
+
+
+def noop_scope(registry: Any, llm: Any) -> str:
+    """History scope: registry fingerprint + editing model (a router lists all of its backends)."""
+    model = f"{type(llm).__name__}:{getattr(llm, 'model', '')}"
+    return hashlib.sha1(f"{registry.fingerprint()}\x00{model}".encode("utf-8")).hexdigest()
+
+
+_SHARED_LOCK = threading.Lock()
+_SHARED_DETECTORS: Dict[str, NoopDetector] = {}
+
+
+def get_noop_detector(config: Any) -> NoopDetector:
+    """Process-wide detector per history file, so every request feeds the same history."""
+    path = getattr(config, "NOOP_HISTORY_PATH", None)
+    cache_key = str(path or "")
+    with _SHARED_LOCK:
+        detector = _SHARED_DETECTORS.get(cache_key)
+        if detector is None:
+            detector = _SHARED_DETECTORS[cache_key] = NoopDetector(
+                patterns=getattr(config, "NOOP_PATTERNS", None),
+                name_checks=getattr(config, "NOOP_NAME_CHECKS", True),
+                name_lists=getattr(config, "NOOP_NAME_LISTS", False),
+                max_chars=getattr(config, "NOOP_MAX_CHARS", 300),
+                history=getattr(config, "NOOP_HISTORY", True),
+                history_path=path,
+                history_max=getattr(config, "NOOP_HISTORY_MAX", 100_000),
+            )
+            if len(detector):
+                print(f"[noop] Nạp {len(detector)} đoạn không đổi từ {path}.")
+        return detector
+
+
+def build_noop_filter(config: Any, registry: Any, llm: Any) -> Optional[NoopFilter]:
+    """No-op filter for a pipeline editing with `llm` (or a router), or None when NOOP_FILTER is off."""
+    if not getattr(config, "NOOP_FILTER", False):
+        return None
+    return NoopFilter(get_noop_detector(config), noop_scope(registry, llm))
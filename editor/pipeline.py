@@ -2,7 +2,7 @@
 import sys
 import time
 from dataclasses import dataclass, field
-from typing import List, Tuple
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Sequence, Tuple, TypeVar
 
 sys.stdout.reconfigure(encoding="utf-8")
 sys.stderr.reconfigure(encoding="utf-8")
@@ -11,10 +11,21 @@ sys.stderr.reconfigure(encoding="utf-8")
 Baseline editor pipeline: classify + edit each paragraph sequentially.
 """
 
-from editor.llm import BaseLLM
+from editor.llm import BaseLLM, ChatResult
 from editor.chunking import Chunk, split_text
 from editor.Registry import PromptRegistry
-from editor.classifier import build_classifier_prompt, parse_labels_json, map_labels_to_registry_keys
+from editor.budget import edit_token_budget, truncation_retry_budget
+from editor.classifier import classify_with_llm
+from editor.tracing import span
+from editor.validation import validate_edit
+
+if TYPE_CHECKING:
+    from editor.checkpoint import CheckpointLog
+    from editor.noop import NoopFilter
+    from editor.routing import LLMRouter
+
+# Chunk failures that a second call cannot fix.
+NON_RETRYABLE_ERRORS = frozenset({"no_label"})
 
 
 @dataclass
@@ -26,49 +37,371 @@ class ChunkResult:
     edited_text: str
     latency_ms: int
     paragraph_indices: List[int] = field(default_factory=list)
+    timings_ms: Dict[str, float] = field(default_factory=dict)  # stage -> ms (classify, compose, edit, ...)
+    max_tokens: Optional[int] = None  # output budget of the edit call (editor.budget)
+    truncated: bool = False  # edit call stopped at max_tokens; edited_text may be cut short
+    status: str = "ok"  # "ok" | "failed" (edited_text is then the original text)
+    error: Optional[str] = None  # validation reason (editor.validation), "no_label" or "<Exception>: message"
+    attempts: int = 1
+    resumed: bool = False  # restored from an on-disk checkpoint (editor.checkpoint), not edited in this run
+    backend: Optional[str] = None  # routed editor backend (editor.routing); None = the pipeline's editor LLM
+    skipped: Optional[str] = None  # no-op reason (editor.noop): passed through without an LLM call
+
+
+T = TypeVar("T")
+ResultCallback = Callable[[ChunkResult], None]
+
+
+def failed_chunk(
+    *,
+    chunk_id: str,
+    order: int,
+    text: str,
+    error: str,
+    labels: Sequence[str] = (),
+    edit_prompt_ids: Sequence[str] = (),
+    latency_ms: int = 0,
+    paragraph_indices: Sequence[int] = (),
+    timings_ms: Optional[Dict[str, float]] = None,
+    max_tokens: Optional[int] = None,
+    truncated: bool = False,
+    attempts: int = 1,
+    backend: Optional[str] = None,
+) -> ChunkResult:
+    """Result for a chunk that could not be edited: keeps the original text."""
+    return ChunkResult(
+        chunk_id=chunk_id,
+        order=order,
+        labels=list(labels),
+        edit_prompt_ids=list(edit_prompt_ids),
+        edited_text=(text or "").strip(),
+        latency_ms=latency_ms,
+        paragraph_indices=list(paragraph_indices),
+        timings_ms=dict(timings_ms or {}),
+        max_tokens=max_tokens,
+        truncated=truncated,
+        status="failed",
+        error=error,
+        attempts=attempts,
+        backend=backend,
+    )
+
+
+def skip_noop_chunk(
+    noop: Optional["NoopFilter"],
+    *,
+    chunk_id: str,
+    order: int,
+    text: str,
+    labels: Sequence[str] = (),
+    paragraph_indices: Sequence[int] = (),
+    timings_ms: Optional[Dict[str, float]] = None,
+    attempts: int = 1,
+    log_prefix: str = "pipeline",
+) -> Optional[ChunkResult]:
+    """Pass-through result when `noop` (editor.noop) predicts the chunk needs no edit, else None."""
+    if noop is None:
+        return None
+    with span("noop", chunk_id=chunk_id) as noop_span:
+        reason = noop.check(text)
+        noop_span.set(reason=reason)
+    if reason is None:
+        return None
+    print(f"[{log_prefix}] Đoạn {chunk_id} giữ nguyên, không gọi LLM ({reason}).")
+    return ChunkResult(
+        chunk_id=chunk_id,
+        order=order,
+        labels=list(labels),
+        edit_prompt_ids=[],
+        edited_text=(text or "").strip(),
+        latency_ms=0,
+        paragraph_indices=list(paragraph_indices),
+        timings_ms={**(timings_ms or {}), "noop": round(noop_span.duration_ms, 3)},
+        attempts=attempts,
+        skipped=reason,
+    )
+
+
+def edit_chunk(
+    editor_llm: BaseLLM,
+    registry: PromptRegistry,
+    *,
+    chunk_id: str,
+    order: int,
+    text: str,
+    label_keys: Sequence[str],
+    paragraph_indices: Sequence[int] = (),
+    timings_ms: Optional[Dict[str, float]] = None,
+    attempts: int = 1,
+    log_prefix: str = "pipeline",
+    router: Optional["LLMRouter"] = None,
+    noop: Optional["NoopFilter"] = None,
+    check_noop: bool = True,
+) -> ChunkResult:
+    """
+    Compose the prompt, edit one chunk and validate the output.
+
+    With a `router` (editor.routing), the edit goes to the backend chain that
+    `registry.route()` picks for the chunk's labels instead of `editor_llm`.
+    With a `noop` filter (editor.noop), a chunk predicted to need no edit is
+    passed through without a call, and an edit that comes back unchanged is
+    remembered for next time. A caller that already ran the pre-check (before
+    classifying) passes `check_noop=False` so only the history update is left.
+
+    Never raises for a chunk-level problem: an LLM/registry error or a rejected
+    edit (editor.validation) gives a failed ChunkResult carrying the original
+    text, so the caller can retry just that chunk.
+    """
+    skipped = skip_noop_chunk(
+        noop if check_noop else None,
+        chunk_id=chunk_id,
+        order=order,
+        text=text,
+        labels=label_keys,
+        paragraph_indices=paragraph_indices,
+        timings_ms=timings_ms,
+        attempts=attempts,
+        log_prefix=log_prefix,
+    )
+    if skipped is not None:
+        return skipped
+    timings = dict(timings_ms or {})
+    selected_labels: List[str] = list(label_keys)
+    ep_ids: List[str] = []
+    max_tokens: Optional[int] = None
+    backend: Optional[str] = None
+    t0 = time.time()
+    try:
+        with span("compose", chunk_id=chunk_id) as compose_span:
+            system_prompt, selected_labels, ep_ids = registry.build_system_prompt(list(label_keys))
+        timings["compose"] = round(compose_span.duration_ms, 3)
+        user_msg = "Ban thuc hien chinh sua doan van sau.\n\nDoan van:\n" + text
+        max_tokens = edit_token_budget(text, selected_labels)
+
+        def complete(budget: Optional[int]) -> Tuple[ChatResult, Optional[str]]:
+            if router is not None:
+                return router.complete(
+                    registry.route(selected_labels, ep_ids), system_prompt, user_msg, max_tokens=budget
+                )
+            return editor_llm.complete(system_prompt, user_msg, max_tokens=budget), None
+
+        t0 = time.time()
+        with span(
+            "edit", chunk_id=chunk_id, labels=selected_labels, max_tokens=max_tokens, attempt=attempts
+        ) as edit_span:
+            reply, backend = complete(max_tokens)
+            retry_budget = truncation_retry_budget(max_tokens) if reply.truncated else None
+            if retry_budget is not None:
+                # Cut at the budget: one more try with twice the room before giving up on the chunk.
+                print(f"[{log_prefix}] Đoạn {chunk_id} bị cắt ở trần {max_tokens} token, thử lại với {retry_budget}.")
+                max_tokens = retry_budget
+                reply, backend = complete(max_tokens)
+                edit_span.set(max_tokens=max_tokens, budget_retry=True)
+            if backend is not None:
+                edit_span.set(backend=backend)
+            edited = (reply.text or "").strip()
+            reason = validate_edit(text, edited, truncated=reply.truncated)
+            edit_span.set(truncated=reply.truncated)
+            if reason:
+                edit_span.set(rejected=reason)
+        timings["edit"] = round(edit_span.duration_ms, 3)
+    except Exception as exc:  # noqa: BLE001 - isolate the chunk, the span already recorded the error
+        print(f"[{log_prefix}] Đoạn {chunk_id} lỗi (lần {attempts}): {type(exc).__name__}: {exc}")
+        return failed_chunk(
+            chunk_id=chunk_id,
+            order=order,
+            text=text,
+            error=f"{type(exc).__name__}: {exc}",
+            labels=selected_labels,
+            paragraph_indices=paragraph_indices,
+            attempts=attempts,
+            edit_prompt_ids=ep_ids,
+            latency_ms=int((time.time() - t0) * 1000),
+            timings_ms=timings,
+            max_tokens=max_tokens,
+            backend=backend,
+        )
+
+    latency_ms = int((time.time() - t0) * 1000)
+    if reason:
+        print(f"[{log_prefix}] Đoạn {chunk_id} bị loại (lần {attempts}): {reason}")
+        return failed_chunk(
+            chunk_id=chunk_id,
+            order=order,
+            text=text,
+            error=reason,
+            labels=selected_labels,
+            paragraph_indices=paragraph_indices,
+            attempts=attempts,
+            edit_prompt_ids=ep_ids,
+            latency_ms=latency_ms,
+            timings_ms=timings,
+            max_tokens=max_tokens,
+            truncated=reply.truncated,
+            backend=backend,
+        )
+    if noop is not None:
+        noop.observe(text, edited)
+    return ChunkResult(
+        chunk_id=chunk_id,
+        order=order,
+        labels=selected_labels,
+        edit_prompt_ids=ep_ids,
+        edited_text=edited,
+        latency_ms=latency_ms,
+        paragraph_indices=list(paragraph_indices),
+        timings_ms=timings,
+        max_tokens=max_tokens,
+        attempts=attempts,
+        backend=backend,
+    )
+
+
+def run_chunks(
+    items: Sequence[T],
+    run: Callable[[T, int], ChunkResult],
+    *,
+    key_parts: Callable[[T], Tuple],
+    checkpoint: Optional["CheckpointLog"] = None,
+    on_result: Optional[ResultCallback] = None,
+    rounds: Optional[int] = None,
+    log_prefix: str = "pipeline",
+) -> List[ChunkResult]:
+    """
+    Edit every item with `run(item, attempts)`, then re-run only the failed,
+    retryable ones for up to `rounds` rounds (default Config.EDIT_RETRY_ROUNDS).
+
+    Items whose key (`checkpoint.key(*key_parts(item))`) is recorded in
+    `checkpoint` are restored instead of edited; every successful result is recorded there as soon as it is done.
+    `on_result` is called with every newly finished result, retries included.
+    """
+    if rounds is None:
+        from editor import Config
+
+        rounds = int(getattr(Config, "EDIT_RETRY_ROUNDS", 0))
+    keys = [checkpoint.key(*key_parts(item)) for item in items] if checkpoint is not None else [""] * len(items)
+
+    def finish(index: int, result: ChunkResult) -> ChunkResult:
+        if checkpoint is not None:
+            checkpoint.record(keys[index], result)
+        if on_result is not None:
+            on_result(result)
+        return result
+
+    results: List[ChunkResult] = []
+    for index, item in enumerate(items):
+        restored = checkpoint.get(keys[index]) if checkpoint is not None else None
+        results.append(restored if restored is not None else finish(index, run(item, 1)))
+    resumed = sum(item.resumed for item in results)
+    if resumed:
+        print(f"[{log_prefix}] Dùng lại {resumed}/{len(results)} đoạn từ checkpoint.")
+
+    for round_no in range(1, max(0, rounds) + 1):
+        pending = [
+            index for index, item in enumerate(results)
+            if item.status == "failed" and item.error not in NON_RETRYABLE_ERRORS
+        ]
+        if not pending:
+            break
+        print(f"[{log_prefix}] Gọi lại {len(pending)}/{len(results)} đoạn lỗi (lượt {round_no}/{rounds}).")
+        for index in pending:
+            results[index] = finish(index, run(items[index], results[index].attempts + 1))
+    return results
+
+
+def assemble(results: List[ChunkResult], *, log_prefix: str = "pipeline") -> Tuple[str, List[ChunkResult]]:
+    """Sort results by order and join their text into the final document."""
+    results = sorted(results, key=lambda item: item.order)
+    failed = [item.chunk_id for item in results if item.status == "failed"]
+    if failed:
+        print(f"[{log_prefix}] {len(failed)} đoạn giữ nguyên bản gốc do lỗi: {', '.join(failed)}")
+    return "\n\n".join(item.edited_text for item in results), results
 
 
 class EditorPipeline:
     """Sequential pipeline that classifies and edits each chunk using the same LLM."""
 
-    def __init__(self, classifier_llm: BaseLLM, editor_llm: BaseLLM, registry: PromptRegistry):
+    def __init__(
+        self,
+        classifier_llm: BaseLLM,
+        editor_llm: BaseLLM,
+        registry: PromptRegistry,
+        router: Optional["LLMRouter"] = None,
+        noop: Optional["NoopFilter"] = None,
+    ):
         self.classifier_llm = classifier_llm
         self.editor_llm = editor_llm
         self.registry = registry
+        # Optional per-label model routing for the edit step (editor.routing); None = editor_llm only.
+        self.router = router
+        # Optional no-op pre-filter (editor.noop); skips classification and editing of pass-through chunks.
+        self.noop = noop
 
     def _classify_labels(self, text: str) -> List[str]:
-        sys_prompt, user_template = build_classifier_prompt()
-        user_message = user_template.replace("{{TEXT}}", text)
-        raw = self.classifier_llm.chat(sys_prompt, user_message)
-        parsed_labels = parse_labels_json(raw)
-        labels = map_labels_to_registry_keys(parsed_labels)
+        labels = classify_with_llm(self.classifier_llm, text)
         if not labels:
             raise ValueError("Classifier returned empty/invalid labels for a chunk.")
         return labels
 
-    def process(self, big_text: str) -> Tuple[str, List[ChunkResult]]:
-        chunks: List[Chunk] = split_text(big_text)
-
-        results: List[ChunkResult] = []
-        for ck in chunks:
-            labels = self._classify_labels(ck.text)
-            system_prompt, selected_labels, ep_ids = self.registry.build_system_prompt(labels)
-            user_msg = "Ban thuc hien chinh sua doan van sau.\n\nDoan van:\n" + ck.text
-            t0 = time.time()
-            edited = self.editor_llm.chat(system_prompt, user_msg)
-            dt = int((time.time() - t0) * 1000)
-            results.append(
-                ChunkResult(
-                    chunk_id=ck.chunk_id,
-                    order=ck.order,
-                    labels=selected_labels,
-                    edit_prompt_ids=ep_ids,
-                    edited_text=(edited or "").strip(),
-                    latency_ms=dt,
-                    paragraph_indices=[ck.order - 1],
-                )
+    def _process_chunk(self, ck: Chunk, attempts: int = 1) -> ChunkResult:
+        skipped = skip_noop_chunk(
+            self.noop,
+            chunk_id=ck.chunk_id,
+            order=ck.order,
+            text=ck.text,
+            paragraph_indices=[ck.order - 1],
+            attempts=attempts,
+        )
+        if skipped is not None:
+            return skipped
+        try:
+            with span("classify", chunk_id=ck.chunk_id) as classify_span:
+                labels = self._classify_labels(ck.text)
+        except Exception as exc:  # noqa: BLE001
+            print(f"[pipeline] Phân loại đoạn {ck.chunk_id} lỗi (lần {attempts}): {exc}")
+            return failed_chunk(
+                chunk_id=ck.chunk_id,
+                order=ck.order,
+                text=ck.text,
+                error=f"{type(exc).__name__}: {exc}",
+                paragraph_indices=[ck.order - 1],
+                attempts=attempts,
             )
+        return edit_chunk(
+            self.editor_llm,
+            self.registry,
+            chunk_id=ck.chunk_id,
+            order=ck.order,
+            text=ck.text,
+            label_keys=labels,
+            paragraph_indices=[ck.order - 1],
+            timings_ms={"classify": round(classify_span.duration_ms, 3)},
+            attempts=attempts,
+            router=self.router,
+            noop=self.noop,
+            check_noop=False,  # checked above, before classification
+        )
 
-        results.sort(key=lambda item: item.order)
-        final_text = "\n\n".join(item.edited_text for item in results)
-        return final_text, results
+    def process(
+        self,
+        big_text: str,
+        on_result: Optional[ResultCallback] = None,
+        checkpoint: Optional["CheckpointLog"] = None,
+    ) -> Tuple[str, List[ChunkResult]]:
+        """
+        Edit every chunk; a failing chunk keeps its original text and is retried
+        (Config.EDIT_RETRY_ROUNDS) instead of aborting the document.
+        `on_result` is called with every finished ChunkResult, retries included.
+        Chunks already in `checkpoint` (editor.checkpoint) are not classified or edited again.
+        """
+        chunks: List[Chunk] = split_text(big_text)
+        results = run_chunks(
+            chunks,
+            lambda ck, attempts: self._process_chunk(ck, attempts),
+            key_parts=lambda ck: (ck.chunk_id, ck.text),
+            checkpoint=checkpoint,
+            on_result=on_result,
+        )
+        if checkpoint is not None:
+            checkpoint.finish(results)
+        return assemble(results)
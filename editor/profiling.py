@@ -0,0 +1,272 @@
+# -*- coding: utf-8 -*-
+"""
+Background resource sampler.
+
+`ResourceSampler` runs a daemon thread that records process CPU, RSS, system
+RAM and (when available) GPU memory every `interval` seconds into a bounded
+ring buffer. Nothing runs on the pipeline's own thread: CPU is read with the
+non-blocking `psutil` counters, and GPU stats come from torch (only if torch
+is already imported) or from `nvidia-smi`, queried every `gpu_every` samples.
+
+Samples are correlated with `editor.tracing` spans after the fact:
+
+    sampler = ResourceSampler(interval=0.2).start()
+    with start_trace("process_document") as trace:
+        ...
+    sampler.annotate(trace)          # adds cpu/rss/gpu summaries to each span
+    sampler.stop()
+
+`get_shared_sampler(Config)` returns one process-wide sampler when
+`Config.RESOURCE_PROFILING` is on (the APIs' opt-in profiling mode), else None.
+"""
+
+from __future__ import annotations
+
+import bisect
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List, Optional
+
+try:
+    import psutil  # type: ignore
+except ImportError:  # pragma: no cover
+    psutil = None
+
+
+def _bytes_to_mb(value: int | float | None) -> float:
+    if value is None:
+        return 0.0
+    return float(value) / (1024 * 1024)
+
+
+def gpu_stats_from_torch() -> List[Dict[str, Any]]:
+    """GPU memory as seen by this process's torch allocator (only if torch is already imported)."""
+    torch = sys.modules.get("torch")
+    if torch is None or not torch.cuda.is_available():
+        return []
+
+    stats: List[Dict[str, Any]] = []
+    for idx in range(torch.cuda.device_count()):
+        props = torch.cuda.get_device_properties(idx)
+        total = props.total_memory
+        reserved = torch.cuda.memory_reserved(idx)
+        allocated = torch.cuda.memory_allocated(idx)
+        stats.append(
+            {
+                "index": idx,
+                "name": props.name,
+                "total_mb": round(_bytes_to_mb(total), 2),
+                "allocated_mb": round(_bytes_to_mb(allocated), 2),
+                "reserved_mb": round(_bytes_to_mb(reserved), 2),
+                "free_estimate_mb": round(_bytes_to_mb(max(total - reserved, 0)), 2),
+                "cuda_capacity": props.multi_processor_count,
+            }
+        )
+    return stats
+
+
+def gpu_stats_from_nvidia_smi(timeout: float = 5.0) -> List[Dict[str, Any]]:
+    """Device-wide GPU statistics from `nvidia-smi` (covers the Ollama server's usage too)."""
+    exe = shutil.which("nvidia-smi")
+    if not exe:
+        return []
+
+    query = [
+        "name",
+        "memory.total",
+        "memory.used",
+        "memory.free",
+        "utilization.gpu",
+        "utilization.memory",
+    ]
+    cmd = [exe, f"--query-gpu={','.join(query)}", "--format=csv,noheader,nounits"]
+    try:
+        output = subprocess.check_output(cmd, encoding="utf-8", stderr=subprocess.STDOUT, timeout=timeout)
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired, FileNotFoundError):
+        return []
+
+    stats: List[Dict[str, Any]] = []
+    for line in output.strip().splitlines():
+        parts = [part.strip() for part in line.split(",")]
+        if len(parts) != len(query):
+            continue
+        try:
+            stats.append(
+                {
+                    "index": len(stats),
+                    "name": parts[0],
+                    "total_mb": float(parts[1]),
+                    "used_mb": float(parts[2]),
+                    "free_mb": float(parts[3]),
+                    "utilization_gpu_percent": float(parts[4]),
+                    "utilization_memory_percent": float(parts[5]),
+                }
+            )
+        except ValueError:  # "[N/A]" on some boards
+            continue
+    return stats
+
+
+def gpu_stats() -> List[Dict[str, Any]]:
+    return gpu_stats_from_torch() or gpu_stats_from_nvidia_smi()
+
+
+def _gpu_used_mb(gpus: List[Dict[str, Any]]) -> Optional[float]:
+    if not gpus:
+        return None
+    return round(sum(float(g.get("used_mb", g.get("reserved_mb", 0.0))) for g in gpus), 2)
+
+
+@dataclass
+class ResourceSample:
+    unix_ns: int
+    cpu_percent: Optional[float] = None  # this process, % of one core (can exceed 100)
+    system_cpu_percent: Optional[float] = None
+    rss_mb: Optional[float] = None
+    ram_used_mb: Optional[float] = None
+    ram_available_mb: Optional[float] = None
+    gpus: List[Dict[str, Any]] = field(default_factory=list)  # only on GPU sampling ticks
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+class ResourceSampler:
+    """Periodic CPU/RSS/GPU sampler with a ring buffer of the last `capacity` samples."""
+
+    def __init__(self, *, interval: float = 0.5, capacity: int = 7200, gpu_every: int = 4, gpu: bool = True):
+        if interval <= 0:
+            raise ValueError("interval must be > 0")
+        self.interval = float(interval)
+        self.gpu_every = max(1, int(gpu_every))
+        self.gpu = gpu
+        self._buffer: deque = deque(maxlen=max(1, int(capacity)))
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._process = psutil.Process() if psutil is not None else None
+        self._ticks = 0
+
+    # --- sampling ---------------------------------------------------------
+
+    def sample_once(self) -> ResourceSample:
+        """Take one sample now (non-blocking CPU counters) and append it to the buffer."""
+        sample = ResourceSample(unix_ns=time.time_ns())
+        if self._process is not None:
+            # interval=None: percentage since the previous call, no sleep
+            sample.cpu_percent = self._process.cpu_percent(interval=None)
+            sample.system_cpu_percent = psutil.cpu_percent(interval=None)
+            sample.rss_mb = round(_bytes_to_mb(self._process.memory_info().rss), 2)
+            vm = psutil.virtual_memory()
+            sample.ram_used_mb = round(_bytes_to_mb(vm.used), 2)
+            sample.ram_available_mb = round(_bytes_to_mb(vm.available), 2)
+        if self.gpu and self._ticks % self.gpu_every == 0:
+            sample.gpus = gpu_stats()
+        self._ticks += 1
+        with self._lock:
+            self._buffer.append(sample)
+        return sample
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.sample_once()
+            except Exception as exc:  # noqa: BLE001 - the profiler must never take the worker down
+                print(f"[profiling] Lỗi khi lấy mẫu tài nguyên: {exc}")
+            self._stop.wait(self.interval)
+
+    def start(self) -> "ResourceSampler":
+        """Start the background thread (idempotent)."""
+        if self._thread is None or not self._thread.is_alive():
+            if self._process is not None:
+                self._process.cpu_percent(interval=None)  # prime the delta counters
+                psutil.cpu_percent(interval=None)
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="resource-sampler", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval + 5.0)
+            self._thread = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def __enter__(self) -> "ResourceSampler":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    # --- queries ----------------------------------------------------------
+
+    def samples(self, start_ns: Optional[int] = None, end_ns: Optional[int] = None) -> List[ResourceSample]:
+        """Buffered samples with start_ns <= unix_ns <= end_ns (both bounds optional)."""
+        with self._lock:
+            items = list(self._buffer)
+        if start_ns is None and end_ns is None:
+            return items
+        stamps = [item.unix_ns for item in items]
+        lo = 0 if start_ns is None else bisect.bisect_left(stamps, start_ns)
+        hi = len(items) if end_ns is None else bisect.bisect_right(stamps, end_ns)
+        return items[lo:hi]
+
+    def summarize(self, start_ns: Optional[int] = None, end_ns: Optional[int] = None) -> Dict[str, Any]:
+        """Mean/max CPU, peak RSS and peak GPU memory over a time window."""
+        window = self.samples(start_ns, end_ns)
+        cpu = [s.cpu_percent for s in window if s.cpu_percent is not None]
+        rss = [s.rss_mb for s in window if s.rss_mb is not None]
+        gpu = [v for v in (_gpu_used_mb(s.gpus) for s in window) if v is not None]
+        return {
+            "samples": len(window),
+            "cpu_mean": round(sum(cpu) / len(cpu), 1) if cpu else None,
+            "cpu_max": round(max(cpu), 1) if cpu else None,
+            "rss_max_mb": max(rss) if rss else None,
+            "gpu_used_max_mb": max(gpu) if gpu else None,
+        }
+
+    def annotate(self, trace: Any) -> Dict[str, Any]:
+        """
+        Attach the resource summary of each span's time window to the span
+        (attributes `res.cpu_mean`, `res.rss_max_mb`, ...) and return the
+        summary for the whole trace. Spans shorter than the sampling interval
+        usually contain no sample and are left untouched.
+        """
+        overall: Dict[str, Any] = {}
+        for item in trace.all_spans():
+            summary = self.summarize(item.start_unix_ns, item.end_unix_ns)
+            if item is trace.root:
+                overall = summary
+            if summary["samples"]:
+                item.set(**{f"res.{key}": value for key, value in summary.items() if value is not None})
+        return overall
+
+
+_SHARED_LOCK = threading.Lock()
+_SHARED_SAMPLER: Optional[ResourceSampler] = None
+
+
+def get_shared_sampler(config: Any = None) -> Optional[ResourceSampler]:
+    """Process-wide sampler when `config.RESOURCE_PROFILING` is on (editor.Config by default)."""
+    global _SHARED_SAMPLER
+    if config is None:
+        from . import Config as config  # noqa: N813 - module used as config object
+    if not getattr(config, "RESOURCE_PROFILING", False):
+        return None
+    if _SHARED_SAMPLER is None:
+        with _SHARED_LOCK:
+            if _SHARED_SAMPLER is None:
+                _SHARED_SAMPLER = ResourceSampler(
+                    interval=getattr(config, "RESOURCE_SAMPLE_INTERVAL", 0.5),
+                    capacity=getattr(config, "RESOURCE_SAMPLE_CAPACITY", 7200),
+                ).start()
+    return _SHARED_SAMPLER
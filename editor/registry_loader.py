@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+"""
+Shared, hot-reloadable PromptRegistry for long-running workers.
+
+`get_registry()` returns the registry the APIs should use for a request:
+
+- With `Config.REGISTRY_JSON_PATH = None` it is compiled once from
+  `Config.REGISTRY_DICT` and reused (no per-request rebuild).
+- With a JSON path, a `RegistryReloader` polls the file every
+  `Config.REGISTRY_RELOAD_INTERVAL` seconds. A changed file is parsed,
+  validated (`validate_registry_dict`) and compiled off to the side; only a
+  valid registry replaces the current one, by a single reference swap. An
+  invalid file is reported and the previous registry stays in service.
+
+Callers should fetch the registry once per document and keep that object for
+the whole document, so a swap never mixes two rule sets inside one output.
+
+CLI:
+    python -m editor.registry_loader --export semantic_index/registry.json
+    python -m editor.registry_loader --check semantic_index/registry.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import sys
+import threading
+from pathlib import Path
+from typing import Any, Optional, Sequence, Tuple
+
+from . import Config
+from .Registry import PromptRegistry, RegistryValidationError, validate_registry_dict
+
+
+def load_registry_file(path: Path) -> Tuple[PromptRegistry, str]:
+    """
+    Parse, validate and compile a registry JSON file.
+
+    Returns (registry, sha1 of the file bytes). Raises RegistryValidationError
+    for an inconsistent registry and ValueError/OSError for unreadable JSON.
+    """
+    raw = Path(path).read_bytes()
+    data = json.loads(raw.decode("utf-8-sig"))
+    errors, warnings = validate_registry_dict(data)
+    if errors:
+        raise RegistryValidationError(errors)
+    if warnings:
+        print(
+            f"[registry_loader] {path}: {len(warnings)} cảnh báo "
+            f"(xem bằng `python -m editor.registry_loader --check {path}`)."
+        )
+    return PromptRegistry.from_dict(data), hashlib.sha1(raw).hexdigest()
+
+
+class RegistryReloader:
+    """Holds the current registry compiled from `path` and swaps in valid updates."""
+
+    def __init__(self, path: Path, *, interval: float = 2.0):
+        self.path = Path(path)
+        self.interval = float(interval)
+        self.version = 0
+        self.last_error: Optional[str] = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._signature: Optional[Tuple[int, int]] = None
+        self._digest = ""
+        # The first load must succeed: there is no previous registry to fall back to.
+        self._registry, self._digest = load_registry_file(self.path)
+        self._signature = self._stat_signature()
+        self.version = 1
+        print(f"[registry_loader] Đã nạp registry từ {self.path} (v{self.version}).")
+
+    @property
+    def registry(self) -> PromptRegistry:
+        return self._registry
+
+    def _stat_signature(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat = self.path.stat()
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def check(self) -> bool:
+        """Reload if the file changed; returns True when a new registry was swapped in."""
+        with self._lock:
+            signature = self._stat_signature()
+            if signature is None or signature == self._signature:
+                return False
+            self._signature = signature
+            try:
+                registry, digest = load_registry_file(self.path)
+            except Exception as exc:  # noqa: BLE001
+                self.last_error = str(exc)
+                print(f"[registry_loader] Bỏ qua registry mới ở {self.path}, giữ bản v{self.version}: {exc}")
+                return False
+            self.last_error = None
+            if digest == self._digest:
+                return False
+            self._registry, self._digest = registry, digest
+            self.version += 1
+            print(f"[registry_loader] Đã thay registry từ {self.path} (v{self.version}).")
+            return True
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.check()
+
+    def start(self) -> "RegistryReloader":
+        """Start the background polling thread (idempotent)."""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="registry-reloader", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval + 1.0)
+            self._thread = None
+
+
+_SHARED_LOCK = threading.Lock()
+_SHARED_RELOADER: Optional[RegistryReloader] = None
+_SHARED_STATIC: Optional[PromptRegistry] = None
+
+
+def get_registry(config: Any = Config) -> PromptRegistry:
+    """Current registry for a new request (see module docstring)."""
+    global _SHARED_RELOADER, _SHARED_STATIC
+    json_path = getattr(config, "REGISTRY_JSON_PATH", None)
+    if json_path:
+        if _SHARED_RELOADER is None:
+            with _SHARED_LOCK:
+                if _SHARED_RELOADER is None:
+                    interval = getattr(config, "REGISTRY_RELOAD_INTERVAL", 2.0)
+                    _SHARED_RELOADER = RegistryReloader(Path(json_path), interval=interval).start()
+        return _SHARED_RELOADER.registry
+
+    if _SHARED_STATIC is None:
+        with _SHARED_LOCK:
+            if _SHARED_STATIC is None:
+                errors, _ = validate_registry_dict(config.REGISTRY_DICT)
+                for error in errors:
+                    print(f"[registry_loader] Lỗi REGISTRY_DICT: {error}")
+                _SHARED_STATIC = PromptRegistry.from_dict(config.REGISTRY_DICT)
+    return _SHARED_STATIC
+
+
+def parse_args(argv: Optional[Sequence[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Validate or export the prompt registry.")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--check", metavar="PATH", help="validate a registry JSON file")
+    group.add_argument("--check-config", action="store_true", help="validate Config.REGISTRY_DICT")
+    group.add_argument("--export", metavar="PATH", help="write Config.REGISTRY_DICT to a JSON file")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    args = parse_args(argv)
+    if args.export:
+        target = Path(args.export)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        with target.open("w", encoding="utf-8") as f:
+            json.dump(Config.REGISTRY_DICT, f, ensure_ascii=False, indent=2)
+        print(f"[registry_loader] Đã xuất REGISTRY_DICT ra {target}")
+        return 0
+
+    if args.check:
+        try:
+            data = json.loads(Path(args.check).read_text(encoding="utf-8-sig"))
+        except (OSError, ValueError) as exc:
+            print(f"[registry_loader] Không đọc được {args.check}: {exc}")
+            return 1
+    else:
+        data = Config.REGISTRY_DICT
+    errors, warnings = validate_registry_dict(data)
+    for warning in warnings:
+        print(f"WARNING {warning}")
+    for error in errors:
+        print(f"ERROR   {error}")
+    print(f"[registry_loader] {len(errors)} lỗi, {len(warnings)} cảnh báo.")
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.stdout.reconfigure(encoding="utf-8")
+    sys.exit(main())
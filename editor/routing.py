@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+Per-label model routing for the edit step.
+
+The registry's optional "routes" table (see `PromptRegistry.route`) maps label
+keys or edit-prompt sets to named backends, with fallbacks:
+
+    "routes": [
+        {"label_keys": ["tittle", "ket_tu_tuong_thuat_thanh_le"], "backend": "small", "fallbacks": ["default"]},
+    ]
+
+Backends are named in `Config.LLM_BACKENDS`:
+
+    LLM_BACKENDS = {"small": {"provider": "ollama", "model": "qwen2.5:7b-instruct"}}
+
+"default" is always the pipeline's own editor LLM, and it is always the last
+fallback. A chunk is sent to the first backend of its chain. When the call
+raises, the next backend in the chain is tried. Validation failures are not
+fallbacks: they go through the normal retry rounds (editor.pipeline.run_chunks).
+Route names without a configured backend are skipped. So a registry can carry
+routes for backends that only some deployments define.
+"""
+
+from __future__ import annotations
+
+import json
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from .llm import BaseLLM, ChatResult, OllamaChatLLM, OpenAIChatLLM
+
+DEFAULT_BACKEND = "default"
+
+_BACKEND_CACHE: Dict[str, BaseLLM] = {}
+_BACKEND_LOCK = threading.Lock()
+_WARNED: set = set()
+
+
+def build_backend(spec: Dict[str, Any], config: Any) -> BaseLLM:
+    """
+    LLM adapter for one `LLM_BACKENDS` entry; missing fields default to the Config values.
+    `{"pool": [spec, ...]}` builds an `editor.llm_pool.LLMPool` over several backends.
+    """
+    if "pool" in spec:
+        from .llm_pool import build_llm_pool
+
+        return build_llm_pool(spec["pool"], config)
+    provider = str(spec.get("provider", "ollama")).lower()
+    if provider == "ollama":
+        return OllamaChatLLM(
+            model=spec.get("model") or config.OLLAMA_MODEL,
+            api_url=spec.get("api_url") or config.OLLAMA_API_URL,
+            timeout=int(spec.get("timeout", 300)),
+            max_retries=int(spec.get("max_retries", 3)),
+            debug_sample_every=getattr(config, "LLM_STREAM_DEBUG_SAMPLE", 0),
+        )
+    if provider == "openai":
+        return OpenAIChatLLM(
+            model=spec.get("model") or config.OPENAI_MODEL,
+            api_key=spec.get("api_key") or getattr(config, "OPENAI_API_KEY", ""),
+            api_url=spec.get("api_url") or config.OPENAI_API_URL,
+            timeout=int(spec.get("timeout", 120)),
+        )
+    raise ValueError(f"Unknown LLM provider '{provider}' (expected 'ollama' or 'openai').")
+
+
+def _cached_backend(name: str, spec: Dict[str, Any], config: Any) -> BaseLLM:
+    # Same name + spec → same adapter instance across documents.
+    cache_key = name + "\x00" + json.dumps(spec, sort_keys=True, default=str)
+    with _BACKEND_LOCK:
+        llm = _BACKEND_CACHE.get(cache_key)
+        if llm is None:
+            llm = _BACKEND_CACHE[cache_key] = build_backend(spec, config)
+        return llm
+
+
+class LLMRouter:
+    """Named editor backends plus the pipeline's default LLM, with ordered fallback."""
+
+    def __init__(self, default: BaseLLM, backends: Optional[Dict[str, BaseLLM]] = None):
+        self.backends: Dict[str, BaseLLM] = dict(backends or {})
+        self.backends[DEFAULT_BACKEND] = default
+
+    @property
+    def model(self) -> str:
+        """All backend models, e.g. for checkpoint fingerprints."""
+        return ";".join(
+            f"{name}={type(llm).__name__}:{getattr(llm, 'model', '')}" for name, llm in sorted(self.backends.items())
+        )
+
+    def chain(self, route: Sequence[str]) -> List[str]:
+        """Configured backends of `route`, with "default" appended as the last resort."""
+        names: List[str] = []
+        for name in list(route) + [DEFAULT_BACKEND]:
+            if name in self.backends:
+                names.append(name)
+            elif name not in _WARNED:
+                _WARNED.add(name)
+                print(f"[routing] Backend '{name}' chưa khai báo trong Config.LLM_BACKENDS, bỏ qua.")
+        return list(dict.fromkeys(names))
+
+    def complete(
+        self,
+        route: Sequence[str],
+        system: str,
+        user: str,
+        *,
+        max_tokens: Optional[int] = None,
+    ) -> Tuple[ChatResult, str]:
+        """Edit with the first backend of the route that answers; returns (result, backend name)."""
+        names = self.chain(route)
+        for position, name in enumerate(names):
+            try:
+                return self.backends[name].complete(system, user, max_tokens=max_tokens), name
+            except Exception as exc:  # noqa: BLE001
+                if position == len(names) - 1:
+                    raise
+                print(f"[routing] Backend '{name}' lỗi ({type(exc).__name__}: {exc}), chuyển sang '{names[position + 1]}'.")
+        raise RuntimeError("No backend available.")  # unreachable: chain always holds "default"
+
+
+def build_llm_router(config: Any, default_llm: BaseLLM) -> Optional[LLMRouter]:
+    """Router over Config.LLM_BACKENDS, or None when routing is off or no backend is configured."""
+    if not getattr(config, "LLM_ROUTING", True):
+        return None
+    specs = getattr(config, "LLM_BACKENDS", None) or {}
+    if not specs:
+        return None
+    backends = {
+        name: _cached_backend(name, dict(spec), config)
+        for name, spec in specs.items()
+        if name != DEFAULT_BACKEND
+    }
+    return LLMRouter(default_llm, backends)
@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+"""
+Lightweight per-document tracing.
+
+A trace covers one document run; spans cover its stages (DOCX load,
+classification, embedding, FAISS search, registry composition, LLM calls,
+DOCX save), per chunk where the stage is per chunk. The active trace lives in
+a ContextVar, so library code only calls `span(...)`:
+
+    with start_trace("process_document", api="v2") as trace:
+        with span("docx.load"):
+            ...
+        with span("edit", chunk_id="C3") as s:
+            ...
+        s.duration_ms                # also available without an active trace
+    trace.stage_totals()             # {"edit": {"count": 12, "total_ms": 5310.2}, ...}
+
+Without an active trace `span` only measures its own duration (two clock
+reads), so instrumentation is safe on hot paths.
+
+Finished traces are appended to Config.TRACE_EXPORT_PATH (if set) as JSON
+lines: one span per line ("jsonl") or one OTLP/JSON `resourceSpans` document
+per trace ("otlp", readable by the OpenTelemetry collector file receiver).
+"""
+
+from __future__ import annotations
+
+import contextvars
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+EXPORT_FORMATS = ("jsonl", "otlp")
+
+_CURRENT_TRACE: contextvars.ContextVar[Optional["Trace"]] = contextvars.ContextVar("editor_trace", default=None)
+_CURRENT_SPAN: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("editor_span", default=None)
+_EXPORT_LOCK = threading.Lock()
+
+
+def _new_id(n_bytes: int) -> str:
+    return os.urandom(n_bytes).hex()
+
+
+@dataclass
+class Span:
+    name: str
+    trace_id: str = ""
+    span_id: str = ""
+    parent_id: Optional[str] = None
+    start_unix_ns: int = 0
+    end_unix_ns: int = 0
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    status: str = "ok"  # "ok" | "error"
+    _start_perf: float = field(default=0.0, repr=False)
+    _duration_ms: float = field(default=0.0, repr=False)
+
+    @property
+    def duration_ms(self) -> float:
+        return self._duration_ms
+
+    def set(self, **attributes: Any) -> None:
+        """Add attributes (e.g. token counts known only at the end of the stage)."""
+        self.attributes.update(attributes)
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = {k: v for k, v in asdict(self).items() if not k.startswith("_")}
+        data["duration_ms"] = round(self._duration_ms, 3)
+        return data
+
+
+class Trace:
+    """Spans of one document run."""
+
+    def __init__(self, name: str, **attributes: Any):
+        self.trace_id = _new_id(16)
+        self.root = Span(name=name, trace_id=self.trace_id, span_id=_new_id(8), attributes=dict(attributes))
+        self.spans: List[Span] = []
+        self._lock = threading.Lock()
+
+    def add(self, span_obj: Span) -> None:
+        with self._lock:
+            self.spans.append(span_obj)
+
+    @property
+    def duration_ms(self) -> float:
+        return self.root.duration_ms
+
+    def all_spans(self) -> List[Span]:
+        with self._lock:
+            return [self.root] + list(self.spans)
+
+    def stage_totals(self) -> Dict[str, Dict[str, float]]:
+        """Per span name: number of spans and summed duration (ms)."""
+        totals: Dict[str, Dict[str, float]] = {}
+        for item in self.all_spans()[1:]:
+            entry = totals.setdefault(item.name, {"count": 0, "total_ms": 0.0})
+            entry["count"] += 1
+            entry["total_ms"] = round(entry["total_ms"] + item.duration_ms, 3)
+        return totals
+
+    def chunk_timings(self, chunk_id: str) -> Dict[str, float]:
+        """Summed duration (ms) per span name for spans tagged with `chunk_id`."""
+        timings: Dict[str, float] = {}
+        for item in self.all_spans()[1:]:
+            if item.attributes.get("chunk_id") == chunk_id:
+                timings[item.name] = round(timings.get(item.name, 0.0) + item.duration_ms, 3)
+        return timings
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "name": self.root.name,
+            "total_ms": round(self.duration_ms, 3),
+            "stages": self.stage_totals(),
+        }
+
+    # --- export -----------------------------------------------------------
+
+    def to_jsonl_records(self) -> List[Dict[str, Any]]:
+        return [item.to_dict() for item in self.all_spans()]
+
+    def to_otlp(self, service_name: str = "mucvu-editor") -> Dict[str, Any]:
+        """OTLP/JSON (ExportTraceServiceRequest) representation of the trace."""
+        return {
+            "resourceSpans": [
+                {
+                    "resource": {"attributes": _otlp_attributes({"service.name": service_name})},
+                    "scopeSpans": [
+                        {
+                            "scope": {"name": "editor.tracing"},
+                            "spans": [_otlp_span(item) for item in self.all_spans()],
+                        }
+                    ],
+                }
+            ]
+        }
+
+    def export(self, path: Path, fmt: str = "jsonl") -> None:
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f"Trace export format must be one of {EXPORT_FORMATS}")
+        if fmt == "otlp":
+            lines = [json.dumps(self.to_otlp(), ensure_ascii=False)]
+        else:
+            lines = [json.dumps(record, ensure_ascii=False) for record in self.to_jsonl_records()]
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with _EXPORT_LOCK, path.open("a", encoding="utf-8") as handle:
+            handle.write("\n".join(lines) + "\n")
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    if isinstance(value, (list, tuple)):
+        return {"arrayValue": {"values": [_otlp_value(v) for v in value]}}
+    return {"stringValue": str(value)}
+
+
+def _otlp_attributes(attributes: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return [{"key": key, "value": _otlp_value(value)} for key, value in attributes.items() if value is not None]
+
+
+def _otlp_span(item: Span) -> Dict[str, Any]:
+    data = {
+        "traceId": item.trace_id,
+        "spanId": item.span_id,
+        "name": item.name,
+        "kind": 1,  # SPAN_KIND_INTERNAL
+        "startTimeUnixNano": str(item.start_unix_ns),
+        "endTimeUnixNano": str(item.end_unix_ns),
+        "attributes": _otlp_attributes(item.attributes),
+        "status": {"code": 2 if item.status == "error" else 1},
+    }
+    if item.parent_id:
+        data["parentSpanId"] = item.parent_id
+    return data
+
+
+def current_trace() -> Optional[Trace]:
+    return _CURRENT_TRACE.get()
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Span]:
+    """Time a stage; recorded in the active trace (if any) as a child of the current span."""
+    trace = _CURRENT_TRACE.get()
+    item = Span(name=name, attributes=attributes)
+    token = None
+    if trace is not None:
+        parent = _CURRENT_SPAN.get() or trace.root
+        item.trace_id, item.span_id, item.parent_id = trace.trace_id, _new_id(8), parent.span_id
+        item.start_unix_ns = time.time_ns()
+        token = _CURRENT_SPAN.set(item)
+    item._start_perf = time.perf_counter()
+    try:
+        yield item
+    except BaseException as exc:
+        item.status = "error"
+        item.attributes.setdefault("error", f"{type(exc).__name__}: {exc}")
+        raise
+    finally:
+        item._duration_ms = (time.perf_counter() - item._start_perf) * 1000.0
+        if trace is not None:
+            item.end_unix_ns = item.start_unix_ns + int(item._duration_ms * 1_000_000)
+            _CURRENT_SPAN.reset(token)
+            trace.add(item)
+
+
+@contextmanager
+def start_trace(
+    name: str,
+    *,
+    config: Any = None,
+    on_end: Optional[Callable[[Trace], Any]] = None,
+    **attributes: Any,
+) -> Iterator[Trace]:
+    """
+    Open a trace for one document run and make it current.
+
+    On exit `on_end(trace)` runs (e.g. to attach resource samples to the spans),
+    then the trace is appended to `config.TRACE_EXPORT_PATH` (editor.Config by
+    default) in `config.TRACE_EXPORT_FORMAT`, when a path is configured.
+    """
+    if config is None:
+        from . import Config as config  # noqa: N813 - module used as config object
+
+    trace = Trace(name, **attributes)
+    root = trace.root
+    trace_token = _CURRENT_TRACE.set(trace)
+    span_token = _CURRENT_SPAN.set(root)
+    root.start_unix_ns = time.time_ns()
+    root._start_perf = time.perf_counter()
+    try:
+        yield trace
+    except BaseException as exc:
+        root.status = "error"
+        root.attributes.setdefault("error", f"{type(exc).__name__}: {exc}")
+        raise
+    finally:
+        root._duration_ms = (time.perf_counter() - root._start_perf) * 1000.0
+        root.end_unix_ns = root.start_unix_ns + int(root._duration_ms * 1_000_000)
+        _CURRENT_SPAN.reset(span_token)
+        _CURRENT_TRACE.reset(trace_token)
+        if on_end is not None:
+            try:
+                on_end(trace)
+            except Exception as exc:  # noqa: BLE001 - post-processing must not fail the run
+                print(f"[tracing] on_end lỗi cho trace {trace.trace_id}: {exc}")
+        export_path = getattr(config, "TRACE_EXPORT_PATH", None)
+        if export_path:
+            try:
+                trace.export(Path(export_path), getattr(config, "TRACE_EXPORT_FORMAT", "jsonl"))
+            except (OSError, ValueError) as exc:
+                print(f"[tracing] Không ghi được trace {trace.trace_id}: {exc}")
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+Sanity checks for an edited paragraph.
+
+`validate_edit(original, edited)` returns None when the edit looks usable,
+otherwise a short reason code:
+
+- "truncated"      the model stopped at its output-token limit, so the paragraph is cut
+- "empty"          nothing came back
+- "too_long"       longer than EDIT_MAX_LENGTH_RATIO x input + EDIT_LENGTH_SLACK_CHARS
+- "not_vietnamese" the input is Vietnamese but the output has (almost) no
+                   Vietnamese diacritics, i.e. the model answered in another language
+- "explanation"    the model wrapped the paragraph in commentary ("Dưới đây là ...",
+                   "Giải thích:", "Here is ...", code fences); see EDIT_EXPLANATION_PATTERNS
+
+The pipelines treat a rejected edit like a failed call: the chunk keeps its
+original text and is retried in the next round (editor.pipeline.edit_chunk).
+"""
+
+from __future__ import annotations
+
+import re
+import unicodedata
+from typing import Any, Optional
+
+# Letters that only occur in Vietnamese (after NFC), lower case.
+_VIETNAMESE_LETTERS = frozenset(
+    "ăâđêôơư"
+    "àáảãạằắẳẵặầấẩẫậ"
+    "èéẻẽẹềếểễệ"
+    "ìíỉĩị"
+    "òóỏõọồốổỗộờớởỡợ"
+    "ùúủũụừứửữự"
+    "ỳýỷỹỵ"
+)
+
+DEFAULT_EXPLANATION_PATTERNS = (
+    r"^\s*(dưới đây là|sau đây là|đây là (bản|đoạn)|đoạn văn (đã|sau khi) (được )?(chỉnh sửa|biên tập))",
+    r"^\s*(here is|here's|sure[,!.]|certainly[,!.])",
+    r"^\s*(giải thích|lưu ý|ghi chú|các (thay đổi|chỉnh sửa)( chính)?)\s*:",
+    r"^\s*(tôi đã|mình đã) (chỉnh sửa|sửa|biên tập)",
+    r"^\s*```",
+)
+
+
+def vietnamese_ratio(text: str) -> float:
+    """Share of letters that are Vietnamese-specific (0 for text without letters)."""
+    letters = [ch for ch in unicodedata.normalize("NFC", text or "").lower() if ch.isalpha()]
+    if not letters:
+        return 0.0
+    return sum(ch in _VIETNAMESE_LETTERS for ch in letters) / len(letters)
+
+
+def _explanation_match(original: str, edited: str, patterns: Any) -> Optional[str]:
+    for pattern in patterns:
+        regex = re.compile(pattern, re.IGNORECASE | re.MULTILINE)
+        # A phrase already present in the source paragraph is content, not commentary.
+        if regex.search(edited) and not regex.search(original):
+            return pattern
+    return None
+
+
+def validate_edit(original: str, edited: str, config: Any = None, *, truncated: bool = False) -> Optional[str]:
+    """
+    Reason code when `edited` is not an acceptable edit of `original`, else None.
+    `truncated` is the reply's flag (ChatResult.truncated); a cut reply is always rejected,
+    even with EDIT_VALIDATION off.
+    """
+    if config is None:
+        from . import Config as config  # noqa: N813 - module used as config object
+
+    if truncated:
+        return "truncated"
+    edited = (edited or "").strip()
+    original = (original or "").strip()
+    if not edited:
+        return "empty"
+    if not getattr(config, "EDIT_VALIDATION", True):
+        return None
+
+    max_ratio = getattr(config, "EDIT_MAX_LENGTH_RATIO", 2.0)
+    if max_ratio and len(edited) > max_ratio * len(original) + getattr(config, "EDIT_LENGTH_SLACK_CHARS", 200):
+        return "too_long"
+
+    min_share = getattr(config, "EDIT_MIN_VIETNAMESE_RATIO", 0.3)
+    if min_share:
+        source_ratio = vietnamese_ratio(original)
+        # Only meaningful for paragraphs that are clearly Vietnamese and long enough to measure.
+        if source_ratio >= 0.05 and sum(ch.isalpha() for ch in edited) >= 20:
+            if vietnamese_ratio(edited) < min_share * source_ratio:
+                return "not_vietnamese"
+
+    patterns = getattr(config, "EDIT_EXPLANATION_PATTERNS", None) or DEFAULT_EXPLANATION_PATTERNS
+    if _explanation_match(original, edited, patterns):
+        return "explanation"
+    return None
@@ -7,8 +7,28 @@ reuses the same registry and editing logic but swaps the classification step
 for a FAISS-powered semantic similarity lookup.
 """
 
-from editor import Config  # re-export configuration for convenience
-from .pipeline import SemanticEditorPipeline
+import importlib
+
+# Lazy exports (PEP 562): the pipeline and editor.Config load on first access.
+_LAZY_EXPORTS = {
+    "Config": "editor.Config",  # re-export configuration for convenience
+    "SemanticEditorPipeline": ".pipeline",
+}
+
+
+def __getattr__(name):
+    module_name = _LAZY_EXPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    module = importlib.import_module(module_name, __name__)
+    value = module if module_name.endswith(f".{name}") else getattr(module, name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_EXPORTS))
+
 
 __all__ = [
     "Config",
@@ -4,21 +4,40 @@ Tiện ích dựng chỉ mục FAISS nhãn ngữ nghĩa cho finetune-v2.
 
 Các bước:
 1. Chỉnh sửa tệp JSON tại Config.LABEL_DESCRIPTIONS_PATH để mỗi tên nhãn
-   trong registry có một đoạn mô tả.
+   trong registry có ít nhất một đoạn mô tả. Có thể thêm nhiều đoạn mẫu cho
+   mỗi nhãn (trường "exemplars" hoặc tệp Config.LABEL_EXEMPLARS_PATH); mỗi
+   đoạn là một hàng trong chỉ mục.
 2. Chạy `python -m finetune_v2.build_label_index`.
 3. Script sẽ embedding các mô tả và lưu chỉ mục FAISS cùng metadata tại
    Config.FAISS_INDEX_PATH / Config.FAISS_METADATA_PATH.
+
+Khi đã có chỉ mục cùng model/kiểu, script chỉ embedding các đoạn mới hoặc đã
+thay đổi (so theo mã băm nội dung trong metadata) và xoá các đoạn không còn;
+dùng `--rebuild` để dựng lại toàn bộ.
+
+Kiểu chỉ mục mặc định lấy từ Config.FAISS_INDEX_TYPE / Config.FAISS_INDEX_PARAMS;
+có thể ghi đè bằng tham số dòng lệnh, ví dụ:
+    python -m finetune_v2.build_label_index --index-type hnsw --param ef_search=128
 """
 
 from __future__ import annotations
 
+import argparse
 import json
 import sys
 from pathlib import Path
-from typing import Dict, Iterable, Tuple
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
 
 from . import Config
-from .label_matcher import SentenceTransformerEmbedder, build_index_from_descriptions, save_index
+from .label_matcher import (
+    DEFAULT_INDEX_PARAMS,
+    INDEX_TYPES,
+    LabelSemanticIndex,
+    SentenceTransformerEmbedder,
+    build_index_from_descriptions,
+    describe_index,
+    save_index,
+)
 
 
 def _label_names_from_config() -> Dict[str, str]:
@@ -40,7 +59,42 @@ def _create_template_file(path: Path) -> None:
         json.dump(payload, f, ensure_ascii=False, indent=2)
 
 
-def _load_descriptions(path: Path) -> Iterable[Tuple[str, str]]:
+def _as_text_list(value: Any) -> List[str]:
+    """Chấp nhận một chuỗi hoặc danh sách chuỗi; bỏ phần tử rỗng."""
+    items = value if isinstance(value, list) else [value]
+    return [str(item or "").strip() for item in items if str(item or "").strip()]
+
+
+def _collect_texts(data: Any, text_fields: Sequence[str]) -> Dict[str, List[str]]:
+    """
+    Gom các đoạn văn theo tên nhãn từ JSON dạng danh sách đối tượng
+    ({"name": ..., "<field>": str | [str, ...]}) hoặc ánh xạ {name: str | [str, ...]}.
+    """
+    texts: Dict[str, List[str]] = {}
+    if isinstance(data, list):
+        for entry in data:
+            name = str(entry.get("name", "")).strip()
+            if not name:
+                continue
+            bucket = texts.setdefault(name, [])
+            for field in text_fields:
+                bucket.extend(_as_text_list(entry.get(field)))
+    elif isinstance(data, dict):
+        for name, value in data.items():
+            texts.setdefault(str(name).strip(), []).extend(_as_text_list(value))
+    else:
+        raise ValueError("Mô tả nhãn phải ở dạng danh sách đối tượng hoặc ánh xạ (dict).")
+    return texts
+
+
+def _load_descriptions(path: Path, exemplars_path: Optional[Path] = None) -> Iterable[Tuple[str, str]]:
+    """
+    Trả về các cặp (label_name, đoạn văn) — mỗi cặp là một hàng trong chỉ mục FAISS.
+
+    Một nhãn có thể có nhiều đoạn: trường "description" (chuỗi hoặc danh sách),
+    trường "exemplars" trong cùng tệp, và các đoạn mẫu ở tệp exemplars riêng
+    (ví dụ các bản tin đã biên tập trước đây).
+    """
     if not path.is_file():
         _create_template_file(path)
         raise FileNotFoundError(
@@ -50,51 +104,134 @@ def _load_descriptions(path: Path) -> Iterable[Tuple[str, str]]:
 
     with path.open("r", encoding="utf-8") as f:
         data = json.load(f)
+    descriptions = _collect_texts(data, ("description", "exemplars"))
 
-    descriptions: Dict[str, str] = {}
-    if isinstance(data, list):
-        for entry in data:
-            name = str(entry.get("name", "")).strip()
-            desc = str(entry.get("description", "")).strip()
-            if name:
-                descriptions[name] = desc
-    elif isinstance(data, dict):
-        for name, desc in data.items():
-            descriptions[str(name).strip()] = str(desc or "").strip()
-    else:
-        raise ValueError("Mô tả nhãn phải ở dạng danh sách đối tượng hoặc ánh xạ (dict).")
+    if exemplars_path is not None and exemplars_path.is_file():
+        with exemplars_path.open("r", encoding="utf-8") as f:
+            extra = _collect_texts(json.load(f), ("text", "exemplars"))
+        for name, items in extra.items():
+            descriptions.setdefault(name, []).extend(items)
 
     expected_names = list(_label_names_from_config().keys())
-    missing = sorted(set(expected_names) - set(descriptions.keys()))
+    missing = sorted(name for name in expected_names if not descriptions.get(name))
     if missing:
         raise ValueError(f"Thiếu mô tả cho các nhãn: {missing}")
 
-    return [(name, descriptions[name]) for name in expected_names]
+    unknown = sorted(set(descriptions) - set(expected_names))
+    if unknown:
+        print(f"[label-index] Bỏ qua nhãn không có trong registry: {unknown}", file=sys.stderr)
+
+    # Khử trùng lặp trong từng nhãn (giữ thứ tự gặp trước).
+    return [(name, text) for name in expected_names for text in dict.fromkeys(descriptions[name])]
+
+
+def _parse_index_params(raw_items: List[str]) -> Dict[str, Any]:
+    """Chuyển các cặp `key=value` từ dòng lệnh thành dict tham số chỉ mục."""
+    params: Dict[str, Any] = dict(getattr(Config, "FAISS_INDEX_PARAMS", {}) or {})
+    for item in raw_items:
+        key, sep, value = item.partition("=")
+        key = key.strip()
+        if not sep or key not in DEFAULT_INDEX_PARAMS:
+            raise ValueError(
+                f"Tham số chỉ mục không hợp lệ: '{item}'. Hợp lệ: {sorted(DEFAULT_INDEX_PARAMS)} (dạng key=value)."
+            )
+        params[key] = int(value)
+    return params
+
+
+def parse_args(argv: Optional[Sequence[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Dựng chỉ mục FAISS cho nhãn ngữ nghĩa.")
+    parser.add_argument(
+        "--index-type",
+        choices=INDEX_TYPES,
+        default=getattr(Config, "FAISS_INDEX_TYPE", "flat"),
+        help="Kiểu chỉ mục FAISS (mặc định: Config.FAISS_INDEX_TYPE).",
+    )
+    parser.add_argument(
+        "--exemplars",
+        type=Path,
+        default=getattr(Config, "LABEL_EXEMPLARS_PATH", None),
+        help="Tệp JSON chứa nhiều đoạn mẫu cho mỗi nhãn (mặc định: Config.LABEL_EXEMPLARS_PATH, bỏ qua nếu không tồn tại).",
+    )
+    parser.add_argument(
+        "--param",
+        action="append",
+        default=[],
+        metavar="KEY=VALUE",
+        help="Ghi đè tham số chỉ mục, ví dụ --param nlist=1024 --param nprobe=32.",
+    )
+    parser.add_argument(
+        "--rebuild",
+        action="store_true",
+        help="Bỏ qua chỉ mục hiện có và embedding lại toàn bộ.",
+    )
+    return parser.parse_args(argv)
 
 
-def main() -> None:
+def _load_reusable_index(index_type: str, index_params: Dict[str, Any]) -> Optional[LabelSemanticIndex]:
+    """Trả về chỉ mục hiện có nếu có thể cập nhật tăng dần (cùng model, kiểu và tham số)."""
+    try:
+        existing = LabelSemanticIndex.load(Config.FAISS_INDEX_PATH, Config.FAISS_METADATA_PATH)
+    except (FileNotFoundError, ValueError, RuntimeError):
+        return None
+    if existing.embedding_model != Config.EMBEDDING_MODEL_NAME or existing.index_type != index_type:
+        return None
+    for key, value in index_params.items():
+        if key in existing.index_params and int(existing.index_params[key]) != int(value):
+            return None
+    return existing
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    args = parse_args(argv)
     try:
-        descriptions = _load_descriptions(Config.LABEL_DESCRIPTIONS_PATH)
+        descriptions = _load_descriptions(Config.LABEL_DESCRIPTIONS_PATH, args.exemplars)
+        index_params = _parse_index_params(args.param)
     except Exception as exc:  # noqa: BLE001
         print(f"[label-index] Lỗi: {exc}", file=sys.stderr)
         sys.exit(1)
 
-    embedder = SentenceTransformerEmbedder(
-        Config.EMBEDDING_MODEL_NAME,
-        device=Config.EMBEDDING_DEVICE,
-    )
-    index, entries = build_index_from_descriptions(descriptions, embedder)
+    embedder = SentenceTransformerEmbedder.from_config(Config)
+    existing = None if args.rebuild else _load_reusable_index(args.index_type, index_params)
+    if existing is not None:
+        try:
+            added, removed = existing.update(descriptions, embedder)
+        except ValueError as exc:
+            print(f"[label-index] Lỗi: {exc}", file=sys.stderr)
+            sys.exit(1)
+        if added or removed:
+            existing.save(Config.FAISS_INDEX_PATH, Config.FAISS_METADATA_PATH)
+        print(
+            "[label-index] Cập nhật tăng dần chỉ mục FAISS "
+            f"(+{len(added)} / -{removed}, rows={len(existing.entries)}) -> {Config.FAISS_INDEX_PATH}"
+        )
+        return
+
+    try:
+        index, entries = build_index_from_descriptions(
+            descriptions,
+            embedder,
+            index_type=args.index_type,
+            index_params=index_params,
+        )
+    except ValueError as exc:
+        print(f"[label-index] Lỗi: {exc}", file=sys.stderr)
+        sys.exit(1)
 
     save_index(
         index,
         list(entries),
         index_path=Config.FAISS_INDEX_PATH,
         metadata_path=Config.FAISS_METADATA_PATH,
+        embedding_model=Config.EMBEDDING_MODEL_NAME,
     )
 
+    index_type, effective_params = describe_index(index)
     print(
         "[label-index] Đã dựng chỉ mục FAISS "
-        f"(d={index.d}, labels={len(entries)}) -> {Config.FAISS_INDEX_PATH}"
+        f"(type={index_type}, params={effective_params}, d={index.d}, "
+        f"labels={len({entry.name for entry in entries})}, rows={len(entries)}) "
+        f"-> {Config.FAISS_INDEX_PATH}"
     )
 
 
@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+"""
+Embedding-first label classification with LLM escalation.
+
+`CascadeLabelClassifier` scores every paragraph with the FAISS label matcher
+(one encode call and one search per batch). A paragraph keeps the semantic
+labels when the matcher is confident:
+
+    top score >= min_score  and  top score - second score >= min_margin
+
+Otherwise (or when the semantic ranking yields no registry label) it is
+escalated to the LLM classifier (`editor.classifier.classify_with_llm`). If
+that call fails or returns nothing usable, the semantic labels are kept.
+
+Decisions are counted per instance (`stats`, `escalation_rate`) and in the
+`mucvu_classifier_decisions_total{source}` metric. A one-line escalation
+summary is printed per batch; the API keeps one classifier per process, so the
+cumulative rate there covers every document served.
+"""
+
+from __future__ import annotations
+
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from editor import metrics
+from editor.classifier import classify_with_llm, map_labels_to_registry_keys
+from editor.llm import BaseLLM
+from editor.tracing import span
+
+from .label_matcher import LabelSemanticMatcher
+
+CLASSIFIER_MODES = ("semantic", "cascade", "head")
+
+DECISIONS = metrics.REGISTRY.counter(
+    "mucvu_classifier_decisions_total",
+    "Paragraph label decisions by source (semantic, head, llm, llm_failed = semantic fallback after an LLM error).",
+    ("source",),
+)
+
+
+@dataclass
+class CascadeDecision:
+    label_keys: List[str]
+    source: str  # "semantic" | "head" | "llm" | "llm_failed"
+    top_score: Optional[float] = None
+    margin: Optional[float] = None
+
+
+@dataclass
+class CascadeStats:
+    total: int = 0
+    escalated: int = 0
+    llm_failed: int = 0
+    by_reason: Dict[str, int] = field(default_factory=dict)
+
+    @property
+    def escalation_rate(self) -> float:
+        return self.escalated / self.total if self.total else 0.0
+
+
+def top2_margin(matrix: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Row-wise best score and gap to the second best (inf when there is no runner-up)."""
+    finite = np.where(np.isfinite(matrix), matrix, -np.inf)
+    if finite.shape[1] == 1:
+        return finite[:, 0], np.full(finite.shape[0], np.inf)
+    part = -np.partition(-finite, 1, axis=1)[:, :2]
+    top, second = part[:, 0], part[:, 1]
+    with np.errstate(invalid="ignore"):
+        margin = np.where(np.isfinite(second), top - second, np.inf)
+    return top, margin
+
+
+class CascadeLabelClassifier:
+    """Semantic classifier that defers low-confidence paragraphs to an LLM."""
+
+    def __init__(
+        self,
+        *,
+        matcher: LabelSemanticMatcher,
+        classifier_llm: BaseLLM,
+        min_score: float = 0.5,
+        min_margin: float = 0.05,
+    ):
+        self.matcher = matcher
+        self.classifier_llm = classifier_llm
+        self.min_score = float(min_score)
+        self.min_margin = float(min_margin)
+        self.stats = CascadeStats()
+        self._stats_lock = threading.Lock()  # one instance may serve concurrent requests
+
+    @classmethod
+    def from_config(cls, config: Any, *, matcher: LabelSemanticMatcher, classifier_llm: BaseLLM) -> "CascadeLabelClassifier":
+        return cls(
+            matcher=matcher,
+            classifier_llm=classifier_llm,
+            min_score=getattr(config, "CASCADE_MIN_SCORE", 0.5),
+            min_margin=getattr(config, "CASCADE_MIN_MARGIN", 0.05),
+        )
+
+    @property
+    def escalation_rate(self) -> float:
+        return self.stats.escalation_rate
+
+    def _record(self, source: str, reason: Optional[str] = None) -> None:
+        with self._stats_lock:
+            self.stats.total += 1
+            if source != "semantic":
+                self.stats.escalated += 1
+                if reason:
+                    self.stats.by_reason[reason] = self.stats.by_reason.get(reason, 0) + 1
+            if source == "llm_failed":
+                self.stats.llm_failed += 1
+        DECISIONS.inc(source=source)
+
+    def _escalate(self, text: str, fallback: List[str], chunk_id: Optional[str]) -> CascadeDecision:
+        try:
+            with span("classify.llm", chunk_id=chunk_id):
+                label_keys = classify_with_llm(self.classifier_llm, text)
+        except Exception as exc:  # noqa: BLE001 - keep the semantic answer rather than failing the document
+            print(f"[cascade] LLM classifier lỗi, giữ nhãn semantic: {exc}")
+            label_keys = []
+        if label_keys:
+            return CascadeDecision(label_keys, "llm")
+        return CascadeDecision(fallback, "llm_failed")
+
+    def classify_batch(
+        self,
+        texts: Sequence[str],
+        chunk_ids: Optional[Sequence[str]] = None,
+    ) -> List[CascadeDecision]:
+        if not texts:
+            return []
+        matrix = self.matcher.score_texts(texts)
+        top, margin = top2_margin(matrix)
+        decisions: List[CascadeDecision] = []
+
+        for i, (text, ranked) in enumerate(zip(texts, self.matcher.rank_scores(matrix))):
+            semantic_keys = map_labels_to_registry_keys([name for name, _ in ranked])
+            score = float(top[i]) if np.isfinite(top[i]) else None
+            gap = float(margin[i]) if np.isfinite(margin[i]) else None
+
+            if not semantic_keys:
+                reason = "no_label"
+            elif score is None or score < self.min_score:
+                reason = "low_score"
+            elif gap is not None and gap < self.min_margin:
+                reason = "low_margin"
+            else:
+                reason = None
+
+            if reason is None:
+                decision = CascadeDecision(semantic_keys, "semantic")
+            else:
+                decision = self._escalate(text, semantic_keys, chunk_ids[i] if chunk_ids else None)
+            decision.top_score, decision.margin = score, gap
+            self._record(decision.source, reason)
+            decisions.append(decision)
+
+        escalated = sum(decision.source != "semantic" for decision in decisions)
+        print(
+            f"[cascade] Chuyển LLM {escalated}/{len(texts)} đoạn "
+            f"(tích luỹ {self.stats.escalated}/{self.stats.total} = {self.escalation_rate:.1%})."
+        )
+        return decisions
+
+
+def classifier_mode(config: Any) -> str:
+    """Normalized `config.CLASSIFIER_MODE` (ValueError for an unknown mode)."""
+    mode = str(getattr(config, "CLASSIFIER_MODE", "semantic") or "semantic").strip().lower()
+    if mode not in CLASSIFIER_MODES:
+        raise ValueError(f"CLASSIFIER_MODE must be one of {CLASSIFIER_MODES}")
+    return mode
+
+
+def build_label_classifier(
+    config: Any,
+    *,
+    matcher: LabelSemanticMatcher,
+    classifier_llm: BaseLLM,
+) -> Optional[Any]:
+    """
+    Classifier for `config.CLASSIFIER_MODE`; None means plain semantic matching.
+
+    "head" loads the trained head at `config.LABEL_HEAD_PATH` and shares the
+    matcher's embedder (see finetune_v2.label_head).
+    """
+    mode = classifier_mode(config)
+    if mode == "semantic":
+        return None
+    if mode == "head":
+        from .label_head import HeadLabelClassifier
+
+        return HeadLabelClassifier.from_config(config, embedder=matcher.embedder)
+    return CascadeLabelClassifier.from_config(config, matcher=matcher, classifier_llm=classifier_llm)
@@ -1,9 +1,12 @@
 # -*- coding: utf-8 -*-
 """
-Diagnostic runner for the semantic editor pipeline that prints CPU/RAM/GPU
-resource usage after label assignment and right before sending a segment to
-the Ollama editor LLM. Use this script when you need to confirm the machine
-still has enough headroom (especially on the GPU) before the editing stage.
+Diagnostic runner for the semantic editor pipeline that reports CPU/RAM/GPU
+resource usage while each segment is edited by the LLM. A background
+`editor.profiling.ResourceSampler` records a time series during the run; the
+samples taken inside each chunk's "edit" span are summarized per chunk, so
+measuring adds no latency to the pipeline itself. Use this script when you
+need to confirm the machine still has enough headroom (especially on the GPU)
+during the editing stage.
 """
 
 from __future__ import annotations
@@ -12,8 +15,6 @@ import argparse
 import datetime as dt
 import json
 import platform
-import shutil
-import subprocess
 import sys
 import time
 from dataclasses import dataclass
@@ -23,23 +24,16 @@ from typing import Any, Dict, Iterable, List, Sequence
 sys.stdout.reconfigure(encoding="utf-8")
 sys.stderr.reconfigure(encoding="utf-8")
 
-try:
-    import psutil  # type: ignore
-except ImportError:  # pragma: no cover
-    psutil = None
-
-try:
-    import torch  # type: ignore
-except ImportError:  # pragma: no cover
-    torch = None
-
 from editor import Config as EditorConfig
 from editor.Registry import PromptRegistry
 from editor.chunking import Chunk, split_text
+from editor.budget import edit_token_budget
 from editor.docx_load import document_to_big_text_with_mapping
 from editor.export_local import save_document_with_edits, save_final_text_txt
-from editor.llm import BaseLLM, OllamaChatLLM, OpenAIChatLLM
+from editor.llm import BaseLLM, OllamaChatLLM, OpenAIChatLLM, configure_logging
 from editor.pipeline import ChunkResult
+from editor.profiling import ResourceSampler
+from editor.tracing import span, start_trace
 
 from finetune_v2.label_matcher import (
     LabelSemanticIndex,
@@ -68,160 +62,40 @@ class Segment:
 # Resource inspection helpers
 
 
-def _bytes_to_mb(value: int | float | None) -> float:
-    if value is None:
-        return 0.0
-    return float(value) / (1024 * 1024)
-
-
-def _gpu_stats_from_torch() -> List[Dict[str, Any]]:
-    """Collect GPU statistics using torch if CUDA is available."""
-    if torch is None or not torch.cuda.is_available():
-        return []
-
-    stats: List[Dict[str, Any]] = []
-    device_count = torch.cuda.device_count()
-    for idx in range(device_count):
-        with torch.cuda.device(idx):
-            props = torch.cuda.get_device_properties(idx)
-            total = props.total_memory
-            reserved = torch.cuda.memory_reserved(idx)
-            allocated = torch.cuda.memory_allocated(idx)
-            free_est = max(total - reserved, 0)
-            stats.append(
-                {
-                    "index": idx,
-                    "name": props.name,
-                    "total_mb": round(_bytes_to_mb(total), 2),
-                    "allocated_mb": round(_bytes_to_mb(allocated), 2),
-                    "reserved_mb": round(_bytes_to_mb(reserved), 2),
-                    "free_estimate_mb": round(_bytes_to_mb(free_est), 2),
-                    "cuda_capacity": props.multi_processor_count,
-                }
-            )
-    return stats
-
-
-def _gpu_stats_from_nvidia_smi() -> List[Dict[str, Any]]:
-    """Fallback GPU statistics using `nvidia-smi` if available."""
-    exe = shutil.which("nvidia-smi")
-    if not exe:
-        return []
-
-    query = [
-        "name",
-        "memory.total",
-        "memory.used",
-        "memory.free",
-        "utilization.gpu",
-        "utilization.memory",
-    ]
-    cmd = [
-        exe,
-        f"--query-gpu={','.join(query)}",
-        "--format=csv,noheader,nounits",
-    ]
-
-    try:
-        output = subprocess.check_output(cmd, encoding="utf-8", stderr=subprocess.STDOUT)
-    except (subprocess.CalledProcessError, FileNotFoundError):
-        return []
-
-    stats: List[Dict[str, Any]] = []
-    for line in output.strip().splitlines():
-        parts = [part.strip() for part in line.split(",")]
-        if len(parts) != len(query):
-            continue
-        stats.append(
-            {
-                "index": len(stats),
-                "name": parts[0],
-                "total_mb": float(parts[1]),
-                "used_mb": float(parts[2]),
-                "free_mb": float(parts[3]),
-                "utilization_gpu_percent": float(parts[4]),
-                "utilization_memory_percent": float(parts[5]),
-            }
-        )
-    return stats
-
-
 def collect_resource_snapshot() -> Dict[str, Any]:
-    """Gather CPU, RAM, and GPU statistics for logging."""
+    """One-off CPU/RAM/GPU snapshot (non-blocking) for the run header."""
+    sample = ResourceSampler(interval=1.0).sample_once()
     snapshot: Dict[str, Any] = {
         "timestamp": dt.datetime.now().isoformat(timespec="seconds"),
         "platform": platform.platform(),
+        **{key: value for key, value in sample.to_dict().items() if key not in ("unix_ns", "gpus")},
+        "gpus": sample.gpus,
     }
-
-    if psutil is not None:
-        snapshot["cpu_percent"] = psutil.cpu_percent(interval=0.1)
-        vm = psutil.virtual_memory()
-        snapshot["ram_total_mb"] = round(_bytes_to_mb(vm.total), 2)
-        snapshot["ram_used_mb"] = round(_bytes_to_mb(vm.used), 2)
-        snapshot["ram_available_mb"] = round(_bytes_to_mb(vm.available), 2)
-        proc = psutil.Process()
-        rss = proc.memory_info().rss
-        snapshot["process_rss_mb"] = round(_bytes_to_mb(rss), 2)
-    else:  # pragma: no cover - best-effort fallback
-        snapshot["cpu_percent"] = None
-        snapshot["ram_total_mb"] = None
-        snapshot["ram_used_mb"] = None
-        snapshot["ram_available_mb"] = None
+    if sample.rss_mb is None:
         snapshot["notes"] = "psutil not installed; limited CPU/RAM metrics."
-
-    gpu_stats = _gpu_stats_from_torch()
-    if not gpu_stats:
-        gpu_stats = _gpu_stats_from_nvidia_smi()
-    snapshot["gpus"] = gpu_stats
-
-    if not gpu_stats:
-        snapshot.setdefault("notes", "No GPU metrics detected.")
-
+    elif not sample.gpus:
+        snapshot["notes"] = "No GPU metrics detected."
     return snapshot
 
 
-def print_resource_snapshot(segment: Segment, selected_labels: Sequence[str], edit_prompt_ids: Sequence[str]) -> Dict[str, Any]:
-    """Collect and print resource metrics for the provided segment."""
-    snapshot = collect_resource_snapshot()
-
-    label_display = ", ".join(selected_labels) if selected_labels else "(no labels)"
+def print_resource_summary(log: Dict[str, Any]) -> None:
+    """Print the sampled resources of one chunk's editing window."""
+    res = log["resources"]
+    label_display = ", ".join(log["labels"]) if log["labels"] else "(no labels)"
     print("\n[ResourceCheck]")
-    print(f"  chunk_id   : {segment.chunk_id}")
-    print(f"  order      : {segment.order}")
+    print(f"  chunk_id   : {log['chunk_id']}")
+    print(f"  order      : {log['order']}")
     print(f"  labels     : {label_display}")
-    print(f"  edit prompts: {', '.join(edit_prompt_ids) if edit_prompt_ids else '(none)'}")
-    if snapshot.get("cpu_percent") is not None:
-        print(
-            "  CPU        : "
-            f"{snapshot.get('cpu_percent', 0):.1f}% | RAM used "
-            f"{snapshot.get('ram_used_mb', 0):.1f} MB / "
-            f"{snapshot.get('ram_total_mb', 0):.1f} MB"
-        )
-    else:
-        print("  CPU/RAM    : unavailable (psutil missing)")
-
-    gpus = snapshot.get("gpus") or []
-    if gpus:
-        for gpu in gpus:
-            if "allocated_mb" in gpu:
-                print(
-                    "  GPU#{index} {name}: alloc={allocated_mb} MB "
-                    "reserved={reserved_mb} MB free~={free_estimate_mb} MB".format(**gpu)
-                )
-            else:
-                print(
-                    "  GPU#{index} {name}: used={used_mb} MB / {total_mb} MB "
-                    "(util {utilization_gpu_percent}% / mem {utilization_memory_percent}%)".format(**gpu)
-                )
-    else:
-        print("  GPU        : not detected or stats unavailable")
-
-    if "process_rss_mb" in snapshot:
-        print(f"  Process RSS: {snapshot['process_rss_mb']:.1f} MB")
-    if snapshot.get("notes"):
-        print(f"  Notes      : {snapshot['notes']}")
-
-    return snapshot
+    print(f"  edit prompts: {', '.join(log['edit_prompt_ids']) if log['edit_prompt_ids'] else '(none)'}")
+    print(f"  edit       : {log['edit_ms']:.0f} ms, {res['samples']} samples")
+    if res.get("cpu_mean") is not None:
+        print(f"  CPU        : mean {res['cpu_mean']:.1f}% | max {res['cpu_max']:.1f}% (process)")
+    if res.get("rss_max_mb") is not None:
+        print(f"  Process RSS: peak {res['rss_max_mb']:.1f} MB")
+    if res.get("gpu_used_max_mb") is not None:
+        print(f"  GPU        : peak {res['gpu_used_max_mb']:.1f} MB used")
+    if not res["samples"]:
+        print("  (window shorter than the sampling interval; no sample)")
 
 
 # ---------------------------------------------------------------------------
@@ -229,11 +103,12 @@ def print_resource_snapshot(segment: Segment, selected_labels: Sequence[str], ed
 
 
 def load_matcher_from_config() -> LabelSemanticMatcher:
-    index = LabelSemanticIndex.load(EditorConfig.FAISS_INDEX_PATH, EditorConfig.FAISS_METADATA_PATH)
-    embedder = SentenceTransformerEmbedder(
-        EditorConfig.EMBEDDING_MODEL_NAME,
-        device=getattr(EditorConfig, "EMBEDDING_DEVICE", None),
+    index = LabelSemanticIndex.load(
+        EditorConfig.FAISS_INDEX_PATH,
+        EditorConfig.FAISS_METADATA_PATH,
+        mmap=getattr(EditorConfig, "FAISS_INDEX_MMAP", False),
     )
+    embedder = SentenceTransformerEmbedder.from_config(EditorConfig)
     probe = embedder.encode(["__dim_check__"])
     embed_dim = probe.shape[1] if probe.ndim == 2 else probe.shape[0]
     if embed_dim != index.dimension:
@@ -248,13 +123,20 @@ def load_matcher_from_config() -> LabelSemanticMatcher:
         embedder=embedder,
         top_k=getattr(EditorConfig, "SIMILARITY_TOP_K", 1),
         threshold=getattr(EditorConfig, "SIMILARITY_THRESHOLD", None),
+        neighbors=getattr(EditorConfig, "SIMILARITY_NEIGHBORS", None),
+        aggregation=getattr(EditorConfig, "SIMILARITY_AGGREGATION", "max"),
     )
 
 
 def choose_editor_llm() -> BaseLLM:
+    configure_logging(getattr(EditorConfig, "LLM_LOG_LEVEL", "INFO"))
     if getattr(EditorConfig, "USE_OLLAMA", True):
         print("[Debug] Provider: Ollama")
-        return OllamaChatLLM(model=EditorConfig.OLLAMA_MODEL, api_url=EditorConfig.OLLAMA_API_URL)
+        return OllamaChatLLM(
+            model=EditorConfig.OLLAMA_MODEL,
+            api_url=EditorConfig.OLLAMA_API_URL,
+            debug_sample_every=getattr(EditorConfig, "LLM_STREAM_DEBUG_SAMPLE", 0),
+        )
 
     print("[Debug] Provider: OpenAI")
     api_key = getattr(EditorConfig, "OPENAI_API_KEY", "")
@@ -311,55 +193,99 @@ def run_pipeline_with_resource_checks(
     big_text: str,
     *,
     skip_edit: bool = False,
+    sampler: ResourceSampler | None = None,
 ) -> Dict[str, Any]:
-    """Execute the semantic pipeline with resource inspection before editing."""
+    """
+    Execute the semantic pipeline while a background sampler records resources.
+
+    Nothing is measured on the pipeline thread; afterwards each chunk's "edit"
+    span is matched with the samples taken during it. Pass a running
+    `sampler` to share one across runs; otherwise one is started and stopped here.
+    """
     chunks = split_text(big_text)
     if not chunks:
         print("[Debug] No chunks found in the document.")
-        return {"final_text": "", "results": [], "resource_logs": []}
+        return {"final_text": "", "results": [], "resource_logs": [], "samples": [], "trace": None}
+
+    own_sampler = sampler is None
+    if sampler is None:
+        sampler = ResourceSampler(interval=getattr(EditorConfig, "RESOURCE_SAMPLE_INTERVAL", 0.5))
+    sampler.start()
 
-    segments = _classify_chunks(pipeline, chunks)
-    resource_logs: List[Dict[str, Any]] = []
     results: List[ChunkResult] = []
+    edit_spans: Dict[str, Any] = {}
+    try:
+        with start_trace("debug_resource_pipeline", on_end=sampler.annotate) as trace:
+            with span("classify"):
+                segments = _classify_chunks(pipeline, chunks)
+            for segment in segments:
+                _edit_segment(pipeline, segment, skip_edit, results, edit_spans)
+    finally:
+        if own_sampler:
+            sampler.stop()
 
-    for segment in segments:
-        system_prompt, selected_labels, edit_prompt_ids = pipeline.registry.build_system_prompt(segment.label_keys)
+    resource_logs: List[Dict[str, Any]] = []
+    for result in results:
+        edit_span = edit_spans[result.chunk_id]
+        log = {
+            "chunk_id": result.chunk_id,
+            "order": result.order,
+            "labels": list(result.labels),
+            "edit_prompt_ids": list(result.edit_prompt_ids),
+            "edit_ms": round(edit_span.duration_ms, 3),
+            "resources": sampler.summarize(edit_span.start_unix_ns, edit_span.end_unix_ns),
+        }
+        print_resource_summary(log)
+        resource_logs.append(log)
 
-        snapshot = print_resource_snapshot(segment, selected_labels, edit_prompt_ids)
-        resource_logs.append(
-            {
-                "chunk_id": segment.chunk_id,
-                "order": segment.order,
-                "labels": list(selected_labels),
-                "edit_prompt_ids": list(edit_prompt_ids),
-                "resources": snapshot,
-            }
-        )
+    final_text = "\n\n".join(item.edited_text for item in sorted(results, key=lambda x: x.order))
+    return {
+        "final_text": final_text,
+        "results": results,
+        "resource_logs": resource_logs,
+        "samples": [sample.to_dict() for sample in sampler.samples(trace.root.start_unix_ns, trace.root.end_unix_ns)],
+        "trace": trace,
+    }
 
-        user_msg = "B?n th?c hi?n ch?nh s?a do?n van sau.\n\nDo?n van:\n" + segment.text
 
+def _edit_segment(
+    pipeline: SemanticEditorPipeline,
+    segment: Segment,
+    skip_edit: bool,
+    results: List[ChunkResult],
+    edit_spans: Dict[str, Any],
+) -> None:
+    system_prompt, selected_labels, edit_prompt_ids = pipeline.registry.build_system_prompt(segment.label_keys)
+    user_msg = "B?n th?c hi?n ch?nh s?a do?n van sau.\n\nDo?n van:\n" + segment.text
+
+    max_tokens = edit_token_budget(segment.text, segment.label_keys)
+    truncated = False
+    with span("edit", chunk_id=segment.chunk_id, labels=list(selected_labels), max_tokens=max_tokens) as edit_span:
         if skip_edit:
             edited_text = segment.text
             latency_ms = 0
         else:
             t0 = time.time()
-            edited_text = pipeline.editor_llm.chat(system_prompt, user_msg)
+            reply = pipeline.editor_llm.complete(system_prompt, user_msg, max_tokens=max_tokens)
+            edited_text, truncated = reply.text, reply.truncated
             latency_ms = int((time.time() - t0) * 1000)
-
-        results.append(
-            ChunkResult(
-                chunk_id=segment.chunk_id,
-                order=segment.order,
-                labels=list(selected_labels),
-                edit_prompt_ids=list(edit_prompt_ids),
-                edited_text=(edited_text or "").strip(),
-                latency_ms=latency_ms,
-                paragraph_indices=list(segment.paragraph_indices),
-            )
+            edit_span.set(truncated=truncated)
+    edit_spans[segment.chunk_id] = edit_span
+
+    results.append(
+        ChunkResult(
+            chunk_id=segment.chunk_id,
+            order=segment.order,
+            labels=list(selected_labels),
+            edit_prompt_ids=list(edit_prompt_ids),
+            edited_text=(edited_text or "").strip(),
+            latency_ms=latency_ms,
+            paragraph_indices=list(segment.paragraph_indices),
+            timings_ms={"edit": round(edit_span.duration_ms, 3)},
+            max_tokens=max_tokens,
+            truncated=truncated,
         )
-
-    final_text = "\n\n".join(item.edited_text for item in sorted(results, key=lambda x: x.order))
-    return {"final_text": final_text, "results": results, "resource_logs": resource_logs}
+    )
 
 
 # ---------------------------------------------------------------------------
@@ -380,7 +306,13 @@ def parse_args(argv: Sequence[str] | None = None) -> argparse.Namespace:
         "--dump-json",
         type=Path,
         default=None,
-        help="Optional path to store resource snapshots in JSON format.",
+        help="Optional path to store per-chunk resources, the sample series and the trace in JSON format.",
+    )
+    parser.add_argument(
+        "--sample-interval",
+        type=float,
+        default=getattr(EditorConfig, "RESOURCE_SAMPLE_INTERVAL", 0.5),
+        help="Seconds between resource samples (default: Config.RESOURCE_SAMPLE_INTERVAL).",
     )
     parser.add_argument(
         "--skip-edit",
@@ -411,7 +343,11 @@ def main(argv: Sequence[str] | None = None) -> None:
     editor_llm = choose_editor_llm()
     pipeline = SemanticEditorPipeline(editor_llm=editor_llm, registry=registry, matcher=matcher)
 
-    outcome = run_pipeline_with_resource_checks(pipeline, big_text, skip_edit=args.skip_edit)
+    header = collect_resource_snapshot()
+    print(f"[Debug] {header['platform']} | RSS {header.get('rss_mb')} MB | GPUs: {len(header['gpus'])}")
+
+    with ResourceSampler(interval=args.sample_interval) as sampler:
+        outcome = run_pipeline_with_resource_checks(pipeline, big_text, skip_edit=args.skip_edit, sampler=sampler)
     final_text: str = outcome["final_text"]
     results: List[ChunkResult] = outcome["results"]
     resource_logs: List[Dict[str, Any]] = outcome["resource_logs"]
@@ -448,6 +384,8 @@ def main(argv: Sequence[str] | None = None) -> None:
             ],
             "final_text": final_text,
             "docx_path": str(docx_output_path),
+            "samples": outcome["samples"],
+            "spans": outcome["trace"].to_jsonl_records() if outcome["trace"] is not None else [],
         }
         args.dump_json.parent.mkdir(parents=True, exist_ok=True)
         args.dump_json.write_text(json.dumps(payload, ensure_ascii=False, indent=2), encoding="utf-8")
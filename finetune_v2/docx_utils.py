@@ -8,6 +8,7 @@ from __future__ import annotations
 from typing import Dict, List
 
 from editor.docx_load import ParagraphRecord
+from editor.docx_locator import body_address
 from editor.pipeline import ChunkResult
 
 
@@ -35,14 +36,15 @@ def _split_edited_text(text: str, count: int) -> List[str]:
 def build_paragraph_updates(
     results: List[ChunkResult],
     paragraphs: List[ParagraphRecord],
-) -> Dict[int, str]:
+) -> Dict[str, str]:
     """
     Convert pipeline results into DOCX paragraph updates.
 
     Returns:
-        Mapping from docx paragraph index to the new text content.
+        Mapping from paragraph address (body, table cell, text box,
+        header/footer) to the new text content.
     """
-    updates: Dict[int, str] = {}
+    updates: Dict[str, str] = {}
     for result in results:
         indices = result.paragraph_indices or []
         if not indices:
@@ -53,6 +55,6 @@ def build_paragraph_updates(
         for local_idx, new_text in zip(indices, split_texts):
             if local_idx < 0 or local_idx >= len(paragraphs):
                 raise IndexError(f"Paragraph index {local_idx} is out of range for the loaded document.")
-            docx_index = paragraphs[local_idx].docx_index
-            updates[docx_index] = new_text
+            record = paragraphs[local_idx]
+            updates[record.address or body_address(record.docx_index)] = new_text
     return updates
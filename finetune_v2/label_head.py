@@ -0,0 +1,320 @@
+# -*- coding: utf-8 -*-
+"""
+Trainable label classifier head over sentence embeddings.
+
+`LabelClassifierHead` is a small NumPy model on top of the normalized
+`SentenceTransformerEmbedder` vectors: softmax logistic regression, or a
+one-hidden-layer ReLU MLP when `hidden > 0`. It is trained full-batch with
+Adam by `finetune_v2.train_label_head` and saved as a single `.npz` file
+(weights, label names, embedding model name; no pickle).
+
+Inference is two matrix products per batch, so once the paragraphs are
+embedded (one encode call, shared with the FAISS matcher) labelling costs
+microseconds per paragraph instead of an LLM round trip:
+
+    head = LabelClassifierHead.load(Config.LABEL_HEAD_PATH)
+    probs = head.predict_proba(embeddings)          # (B, L), rows sum to 1
+    ranked = head.predict(embeddings, top_k=2, threshold=0.3)
+
+`HeadLabelClassifier` wraps a head and an embedder behind the same
+`classify_batch(texts, chunk_ids)` interface as the cascade classifier, so it
+plugs into `SemanticEditorPipeline(classifier=...)`
+(`Config.CLASSIFIER_MODE = "head"`).
+"""
+
+from __future__ import annotations
+
+import json
+import zipfile
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from editor.classifier import map_labels_to_registry_keys
+from editor.tracing import span
+
+from .cascade import DECISIONS, CascadeDecision, top2_margin
+
+FORMAT_VERSION = 1
+
+
+def _softmax(logits: np.ndarray) -> np.ndarray:
+    shifted = logits - logits.max(axis=1, keepdims=True)
+    np.exp(shifted, out=shifted)
+    shifted /= shifted.sum(axis=1, keepdims=True)
+    return shifted
+
+
+class _Adam:
+    """Minimal Adam optimizer over a list of arrays updated in place."""
+
+    def __init__(self, params: List[np.ndarray], lr: float, beta1: float = 0.9, beta2: float = 0.999, eps: float = 1e-8):
+        self.params = params
+        self.lr, self.beta1, self.beta2, self.eps = lr, beta1, beta2, eps
+        self.m = [np.zeros_like(p) for p in params]
+        self.v = [np.zeros_like(p) for p in params]
+        self.t = 0
+
+    def step(self, grads: List[np.ndarray]) -> None:
+        self.t += 1
+        correction1 = 1.0 - self.beta1 ** self.t
+        correction2 = 1.0 - self.beta2 ** self.t
+        for param, grad, m, v in zip(self.params, grads, self.m, self.v):
+            m *= self.beta1
+            m += (1.0 - self.beta1) * grad
+            v *= self.beta2
+            v += (1.0 - self.beta2) * grad * grad
+            param -= self.lr * (m / correction1) / (np.sqrt(v / correction2) + self.eps)
+
+
+class LabelClassifierHead:
+    """Softmax classifier (optionally one hidden ReLU layer) over embedding vectors."""
+
+    def __init__(
+        self,
+        labels: Sequence[str],
+        weights: List[np.ndarray],
+        biases: List[np.ndarray],
+        *,
+        embedding_model: Optional[str] = None,
+        metrics: Optional[Dict[str, Any]] = None,
+    ):
+        if not labels:
+            raise ValueError("A label head needs at least one label.")
+        if len(weights) != len(biases) or len(weights) not in (1, 2):
+            raise ValueError("A label head has one (linear) or two (MLP) layers.")
+        if weights[-1].shape[1] != len(labels):
+            raise ValueError(f"Output layer has {weights[-1].shape[1]} units for {len(labels)} labels.")
+        self.labels = list(labels)
+        self.weights = [np.ascontiguousarray(w, dtype=np.float32) for w in weights]
+        self.biases = [np.ascontiguousarray(b, dtype=np.float32) for b in biases]
+        self.embedding_model = embedding_model
+        self.metrics = dict(metrics or {})
+
+    @property
+    def dimension(self) -> int:
+        return int(self.weights[0].shape[0])
+
+    @property
+    def hidden(self) -> int:
+        return int(self.weights[0].shape[1]) if len(self.weights) == 2 else 0
+
+    # --- training ---------------------------------------------------------
+
+    @classmethod
+    def fit(
+        cls,
+        X: np.ndarray,
+        y: np.ndarray,
+        labels: Sequence[str],
+        *,
+        hidden: int = 0,
+        epochs: int = 300,
+        lr: float = 0.05,
+        l2: float = 1e-4,
+        balanced: bool = False,
+        seed: int = 0,
+        embedding_model: Optional[str] = None,
+    ) -> "LabelClassifierHead":
+        """
+        Train on embeddings `X` (N, d) and label indices `y` (N,) into `labels`.
+
+        Full-batch Adam on the mean cross-entropy plus `l2` weight decay.
+        `balanced=True` weights each class by N / (L * count) so rare labels
+        are not drowned out by frequent ones.
+        """
+        X = np.asarray(X, dtype=np.float32)
+        y = np.asarray(y, dtype=np.int64)
+        n_labels = len(labels)
+        if X.ndim != 2 or X.shape[0] != y.shape[0] or X.shape[0] == 0:
+            raise ValueError("X must be (N, d) with one label index per row.")
+        if y.min() < 0 or y.max() >= n_labels:
+            raise ValueError("Label indices out of range.")
+
+        rng = np.random.default_rng(seed)
+        dim = X.shape[1]
+        if hidden > 0:
+            weights = [
+                (rng.standard_normal((dim, hidden)) * np.sqrt(2.0 / dim)).astype(np.float32),
+                (rng.standard_normal((hidden, n_labels)) * np.sqrt(1.0 / hidden)).astype(np.float32),
+            ]
+            biases = [np.zeros(hidden, dtype=np.float32), np.zeros(n_labels, dtype=np.float32)]
+        else:
+            weights = [np.zeros((dim, n_labels), dtype=np.float32)]
+            biases = [np.zeros(n_labels, dtype=np.float32)]
+
+        targets = np.zeros((X.shape[0], n_labels), dtype=np.float32)
+        targets[np.arange(X.shape[0]), y] = 1.0
+        if balanced:
+            counts = np.bincount(y, minlength=n_labels).astype(np.float32)
+            class_weight = np.where(counts > 0, X.shape[0] / (n_labels * np.maximum(counts, 1.0)), 0.0)
+            sample_weight = class_weight[y]
+        else:
+            sample_weight = np.ones(X.shape[0], dtype=np.float32)
+        sample_weight = (sample_weight / sample_weight.sum()).astype(np.float32)[:, None]
+
+        optimizer = _Adam(weights + biases, lr)
+        for _ in range(max(1, int(epochs))):
+            if hidden > 0:
+                pre = X @ weights[0] + biases[0]
+                act = np.maximum(pre, 0.0)
+                probs = _softmax(act @ weights[1] + biases[1])
+                d_logits = (probs - targets) * sample_weight
+                grad_w2 = act.T @ d_logits + l2 * weights[1]
+                grad_b2 = d_logits.sum(axis=0)
+                d_act = (d_logits @ weights[1].T) * (pre > 0)
+                grad_w1 = X.T @ d_act + l2 * weights[0]
+                grad_b1 = d_act.sum(axis=0)
+                optimizer.step([grad_w1, grad_w2, grad_b1, grad_b2])
+            else:
+                probs = _softmax(X @ weights[0] + biases[0])
+                d_logits = (probs - targets) * sample_weight
+                optimizer.step([X.T @ d_logits + l2 * weights[0], d_logits.sum(axis=0)])
+
+        return cls(labels, weights, biases, embedding_model=embedding_model)
+
+    # --- inference --------------------------------------------------------
+
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        """Label probabilities (B, L) for a batch of embeddings; columns follow `labels`."""
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim != 2 or X.shape[1] != self.dimension:
+            raise ValueError(
+                f"Embedding dimension {X.shape[-1]} does not match label head dimension {self.dimension}."
+            )
+        if len(self.weights) == 2:
+            X = np.maximum(X @ self.weights[0] + self.biases[0], 0.0)
+            return _softmax(X @ self.weights[1] + self.biases[1])
+        return _softmax(X @ self.weights[0] + self.biases[0])
+
+    def rank(self, probs: np.ndarray, *, top_k: int = 1, threshold: Optional[float] = None) -> List[List[Tuple[str, float]]]:
+        """
+        (label_name, probability) pairs per row, best first. At most `top_k`
+        labels; labels after the first must reach `threshold`, so every row
+        keeps at least its top-1 label.
+        """
+        k = max(1, min(int(top_k), probs.shape[1]))
+        order = np.argsort(-probs, axis=1, kind="stable")[:, :k]
+        results: List[List[Tuple[str, float]]] = []
+        for row, label_ids in zip(probs, order):
+            ranked = [(self.labels[label_ids[0]], float(row[label_ids[0]]))]
+            for label_id in label_ids[1:]:
+                score = float(row[label_id])
+                if threshold is not None and score < threshold:
+                    break
+                ranked.append((self.labels[label_id], score))
+            results.append(ranked)
+        return results
+
+    def predict(self, X: np.ndarray, *, top_k: int = 1, threshold: Optional[float] = None) -> List[List[Tuple[str, float]]]:
+        return self.rank(self.predict_proba(X), top_k=top_k, threshold=threshold)
+
+    def accuracy(self, X: np.ndarray, y: np.ndarray) -> float:
+        if len(y) == 0:
+            return 0.0
+        return float((self.predict_proba(X).argmax(axis=1) == np.asarray(y)).mean())
+
+    # --- persistence ------------------------------------------------------
+
+    def save(self, path: Path) -> None:
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        meta = {
+            "format_version": FORMAT_VERSION,
+            "embedding_model": self.embedding_model,
+            "dimension": self.dimension,
+            "hidden": self.hidden,
+            "metrics": self.metrics,
+        }
+        arrays = {f"w{i}": w for i, w in enumerate(self.weights)}
+        arrays.update({f"b{i}": b for i, b in enumerate(self.biases)})
+        tmp_path = path.with_name(path.name + ".tmp")
+        with tmp_path.open("wb") as handle:
+            np.savez(
+                handle,
+                labels=np.array(self.labels, dtype=np.str_),
+                meta=np.array(json.dumps(meta, ensure_ascii=False)),
+                **arrays,
+            )
+        tmp_path.replace(path)
+
+    @classmethod
+    def load(cls, path: Path) -> "LabelClassifierHead":
+        path = Path(path)
+        if not path.is_file():
+            raise FileNotFoundError(
+                f"Label head file not found at {path}. Train it with `python -m finetune_v2.train_label_head`."
+            )
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                meta = json.loads(str(data["meta"]))
+                if meta.get("format_version") != FORMAT_VERSION:
+                    raise ValueError(f"Unsupported label head format: {meta.get('format_version')}")
+                n_layers = 2 if "w1" in data.files else 1
+                weights = [data[f"w{i}"] for i in range(n_layers)]
+                biases = [data[f"b{i}"] for i in range(n_layers)]
+                labels = [str(label) for label in data["labels"]]
+        except (OSError, KeyError, zipfile.BadZipFile) as exc:
+            raise ValueError(f"Invalid label head file {path}: {exc}") from exc
+        return cls(
+            labels,
+            weights,
+            biases,
+            embedding_model=meta.get("embedding_model"),
+            metrics=meta.get("metrics"),
+        )
+
+
+class HeadLabelClassifier:
+    """Pipeline classifier: one encode call per batch, then the trained head."""
+
+    def __init__(
+        self,
+        *,
+        head: LabelClassifierHead,
+        embedder: Any,
+        top_k: int = 1,
+        threshold: Optional[float] = None,
+    ):
+        model_name = getattr(embedder, "model_name", None)
+        if head.embedding_model and model_name and head.embedding_model != model_name:
+            print(
+                f"[label_head] Cảnh báo: head được huấn luyện với '{head.embedding_model}' "
+                f"nhưng embedder đang dùng '{model_name}'."
+            )
+        self.head = head
+        self.embedder = embedder
+        self.top_k = max(1, int(top_k))
+        self.threshold = threshold
+
+    @classmethod
+    def from_config(cls, config: Any, *, embedder: Any) -> "HeadLabelClassifier":
+        return cls(
+            head=LabelClassifierHead.load(getattr(config, "LABEL_HEAD_PATH")),
+            embedder=embedder,
+            top_k=getattr(config, "SIMILARITY_TOP_K", 1),
+            threshold=getattr(config, "LABEL_HEAD_THRESHOLD", None),
+        )
+
+    def classify_batch(
+        self,
+        texts: Sequence[str],
+        chunk_ids: Optional[Sequence[str]] = None,
+    ) -> List[CascadeDecision]:
+        if not texts:
+            return []
+        with span("embed", batch=len(texts), backend=getattr(self.embedder, "backend", "torch")):
+            embeddings = self.embedder.encode(texts)
+        with span("classify.head", batch=len(texts)):
+            probs = self.head.predict_proba(embeddings)
+            top, margin = top2_margin(probs)
+            ranked = self.head.rank(probs, top_k=self.top_k, threshold=self.threshold)
+
+        decisions: List[CascadeDecision] = []
+        for i, pairs in enumerate(ranked):
+            label_keys = map_labels_to_registry_keys([name for name, _ in pairs])
+            gap = float(margin[i]) if np.isfinite(margin[i]) else None
+            decisions.append(CascadeDecision(label_keys, "head", float(top[i]), gap))
+        DECISIONS.inc(len(decisions), source="head")
+        return decisions
@@ -11,15 +11,29 @@ The matcher works in two stages:
 
 from __future__ import annotations
 
+import hashlib
 import json
+import os
+import shutil
+import tempfile
+import time
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Iterable, List, Optional, Sequence, Tuple
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional, Sequence, Tuple
 
-import faiss  # type: ignore
 import numpy as np
-import torch
-from sentence_transformers import SentenceTransformer
+
+from editor.tracing import span
+
+if TYPE_CHECKING:  # heavy imports are deferred to the functions that need them
+    import faiss  # type: ignore
+
+
+def _faiss():
+    """FAISS module, imported on first use so importing this module stays light."""
+    import faiss  # type: ignore
+
+    return faiss
 
 
 def _ensure_float32(matrix: np.ndarray) -> np.ndarray:
@@ -31,10 +45,55 @@ def _ensure_float32(matrix: np.ndarray) -> np.ndarray:
     return matrix
 
 
+EMBEDDING_BACKENDS = ("torch", "onnx", "onnx-int8")
+
+
 class SentenceTransformerEmbedder:
-    """SentenceTransformer wrapper that always returns normalized vectors."""
+    """
+    SentenceTransformer wrapper that always returns normalized vectors.
+
+    `backend` selects how the model runs:
+    - "torch"    : PyTorch on `device` (default).
+    - "onnx"     : ONNX Runtime on CPU, fp32.
+    - "onnx-int8": ONNX Runtime on CPU with int8 dynamic quantization.
+    ONNX backends are exported once and checked against PyTorch before use
+    (see finetune_v2.onnx_backend); any failure falls back to PyTorch.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        *,
+        device: Optional[str] = None,
+        backend: str = "torch",
+        onnx_dir: Optional[Path] = None,
+        quantization: str = "avx2",
+        parity_min_cosine: float = 0.98,
+    ):
+        from sentence_transformers import SentenceTransformer
+
+        normalized_backend = (backend or "torch").strip().lower()
+        if normalized_backend not in EMBEDDING_BACKENDS:
+            raise ValueError(f"backend must be one of {EMBEDDING_BACKENDS}")
+        self.model_name = model_name
+        self.backend = "torch"
+
+        if normalized_backend != "torch":
+            from .onnx_backend import load_onnx_sentence_transformer
+
+            try:
+                self.model = load_onnx_sentence_transformer(
+                    model_name,
+                    export_dir=onnx_dir,
+                    quantization=quantization if normalized_backend == "onnx-int8" else None,
+                    parity_min_cosine=parity_min_cosine,
+                )
+                self.device = "cpu"
+                self.backend = normalized_backend
+                return
+            except Exception as exc:  # noqa: BLE001
+                print(f"[label_matcher] Không thể dùng backend '{normalized_backend}': {exc}. Fallback về PyTorch.")
 
-    def __init__(self, model_name: str, *, device: Optional[str] = None):
         resolved_device = self._resolve_device(device)
         self.device = resolved_device
         try:
@@ -50,9 +109,23 @@ class SentenceTransformerEmbedder:
             else:
                 raise
 
+    @classmethod
+    def from_config(cls, config: Any) -> "SentenceTransformerEmbedder":
+        """Build the embedder from the EMBEDDING_* settings of editor.Config."""
+        return cls(
+            config.EMBEDDING_MODEL_NAME,
+            device=getattr(config, "EMBEDDING_DEVICE", None),
+            backend=getattr(config, "EMBEDDING_BACKEND", "torch"),
+            onnx_dir=getattr(config, "EMBEDDING_ONNX_DIR", None),
+            quantization=getattr(config, "EMBEDDING_ONNX_QUANTIZATION", "avx2"),
+            parity_min_cosine=getattr(config, "EMBEDDING_PARITY_MIN_COSINE", 0.98),
+        )
+
     @staticmethod
     def _resolve_device(requested: Optional[str]) -> str:
         """Chọn thiết bị hợp lệ; fallback sang CPU nếu CUDA không sẵn sàng."""
+        import torch
+
         if requested is None:
             return "cuda" if torch.cuda.is_available() else "cpu"
 
@@ -78,24 +151,233 @@ class SentenceTransformerEmbedder:
         return _ensure_float32(embeddings)
 
 
+# Supported FAISS index layouts. All of them use inner product on normalized
+# vectors, i.e. cosine similarity, so scores stay comparable across types.
+INDEX_TYPES = ("flat", "hnsw", "ivf_pq", "ivf_sq8", "sq8")
+
+DEFAULT_INDEX_PARAMS: Dict[str, Any] = {
+    "hnsw_m": 32,            # HNSW graph degree
+    "ef_construction": 200,  # HNSW build-time beam width
+    "ef_search": 64,         # HNSW query-time beam width
+    "nlist": 256,            # IVF coarse centroids (clamped to the number of vectors)
+    "nprobe": 16,            # IVF lists visited per query
+    "pq_m": 64,              # PQ sub-quantizers (must divide the embedding dim)
+    "pq_nbits": 8,           # bits per PQ code
+}
+
+
+def _resolve_index_params(index_params: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    params = dict(DEFAULT_INDEX_PARAMS)
+    for key, value in (index_params or {}).items():
+        if key not in DEFAULT_INDEX_PARAMS:
+            raise ValueError(f"Unknown FAISS index parameter: {key}")
+        params[key] = int(value)
+    return params
+
+
+def create_faiss_index(
+    embeddings: np.ndarray,
+    *,
+    index_type: str = "flat",
+    index_params: Optional[Dict[str, Any]] = None,
+    ids: Optional[np.ndarray] = None,
+) -> faiss.Index:
+    """
+    Build (train + add) a cosine-similarity FAISS index of the requested type.
+
+    Every index is ID-mapped: IVF variants store ids natively, the others are
+    wrapped in `IndexIDMap2`. `ids` defaults to 0..n-1 (i.e. row positions).
+
+    The effective parameters (after clamping) can be read back with
+    `describe_index`; `save_index` stores them in the metadata so
+    `LabelSemanticIndex.load` can restore the query-time settings.
+    """
+    faiss = _faiss()
+
+    index_type = (index_type or "flat").strip().lower()
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unsupported index_type '{index_type}'. Expected one of {INDEX_TYPES}.")
+
+    vectors = _ensure_float32(embeddings)
+    count, dim = vectors.shape
+    params = _resolve_index_params(index_params)
+
+    if index_type == "flat":
+        index = faiss.IndexFlatIP(dim)
+        params = {}
+    elif index_type == "hnsw":
+        index = faiss.index_factory(dim, f"HNSW{params['hnsw_m']}", faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = params["ef_construction"]
+        params = {key: params[key] for key in ("hnsw_m", "ef_construction", "ef_search")}
+    elif index_type == "sq8":
+        index = faiss.index_factory(dim, "SQ8", faiss.METRIC_INNER_PRODUCT)
+        params = {}
+    else:
+        nlist = max(1, min(params["nlist"], count))
+        if index_type == "ivf_pq":
+            pq_m, pq_nbits = params["pq_m"], params["pq_nbits"]
+            if dim % pq_m:
+                raise ValueError(f"pq_m={pq_m} must divide the embedding dimension {dim}.")
+            if count < 2 ** pq_nbits:
+                raise ValueError(
+                    f"ivf_pq needs at least {2 ** pq_nbits} vectors to train (got {count}); "
+                    "use 'flat', 'hnsw' or 'sq8' for small indexes."
+                )
+            factory = f"IVF{nlist},PQ{pq_m}x{pq_nbits}"
+            params = {"nlist": nlist, "nprobe": params["nprobe"], "pq_m": pq_m, "pq_nbits": pq_nbits}
+        else:
+            factory = f"IVF{nlist},SQ8"
+            params = {"nlist": nlist, "nprobe": params["nprobe"]}
+        index = faiss.index_factory(dim, factory, faiss.METRIC_INNER_PRODUCT)
+
+    if not index.is_trained:
+        index.train(vectors)
+    _apply_search_params(index, index_type, params)
+    if not index_type.startswith("ivf"):
+        index = faiss.IndexIDMap2(index)
+
+    row_ids = np.arange(count, dtype=np.int64) if ids is None else np.asarray(ids, dtype=np.int64)
+    if row_ids.shape[0] != count:
+        raise ValueError("ids must have one entry per embedding row.")
+    if count:
+        index.add_with_ids(vectors, row_ids)
+    return index
+
+
+def _base_index(index: faiss.Index) -> faiss.Index:
+    """Strip the IndexIDMap wrapper (if any) and return the concrete index."""
+    faiss = _faiss()
+
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexIDMap):
+        index = faiss.downcast_index(index.index)
+    return index
+
+
+def _supports_ids(index: faiss.Index) -> bool:
+    faiss = _faiss()
+
+    index = faiss.downcast_index(index)
+    return isinstance(index, (faiss.IndexIDMap, faiss.IndexIVF))
+
+
+def _mmap_io_flags(index_type: str) -> int:
+    """
+    FAISS read flags that memory-map the bulk storage of the given index type.
+
+    IVF indexes map their inverted lists (IO_FLAG_MMAP); flat, SQ8 and HNSW
+    indexes keep vectors in IndexFlatCodes storage, mapped by IO_FLAG_MMAP_IFC.
+    The two flags cannot be combined for IVF files.
+    """
+    faiss = _faiss()
+
+    flag = faiss.IO_FLAG_MMAP if index_type.startswith("ivf") else faiss.IO_FLAG_MMAP_IFC
+    return flag | faiss.IO_FLAG_READ_ONLY
+
+
+def describe_index(index: faiss.Index) -> Tuple[str, Dict[str, Any]]:
+    """Return (index_type, params) for an index built by `create_faiss_index`."""
+    faiss = _faiss()
+
+    index = _base_index(index)
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw", {
+            "hnsw_m": int(index.hnsw.nb_neighbors(1)),
+            "ef_construction": int(index.hnsw.efConstruction),
+            "ef_search": int(index.hnsw.efSearch),
+        }
+    if isinstance(index, faiss.IndexIVFPQ):
+        return "ivf_pq", {
+            "nlist": int(index.nlist),
+            "nprobe": int(index.nprobe),
+            "pq_m": int(index.pq.M),
+            "pq_nbits": int(index.pq.nbits),
+        }
+    if isinstance(index, faiss.IndexIVFScalarQuantizer):
+        return "ivf_sq8", {"nlist": int(index.nlist), "nprobe": int(index.nprobe)}
+    if isinstance(index, faiss.IndexScalarQuantizer):
+        return "sq8", {}
+    return "flat", {}
+
+
+def _apply_search_params(index: faiss.Index, index_type: str, params: Dict[str, Any]) -> None:
+    """Restore query-time knobs that FAISS does not persist in the index file."""
+    faiss = _faiss()
+
+    index = _base_index(index)
+    if index_type == "hnsw" and "ef_search" in params:
+        faiss.ParameterSpace().set_index_parameter(index, "efSearch", int(params["ef_search"]))
+    elif index_type in ("ivf_pq", "ivf_sq8") and "nprobe" in params:
+        faiss.ParameterSpace().set_index_parameter(index, "nprobe", int(params["nprobe"]))
+
+
+def content_hash(name: str, text: str) -> str:
+    """Stable fingerprint of one (label, exemplar text) row, used for incremental updates."""
+    payload = f"{(name or '').strip()}\n{_normalize_description(text)}"
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
 @dataclass
 class LabelEntry:
     """Metadata stored alongside each semantic label embedding."""
 
     name: str
     description: str
+    entry_id: int = -1       # FAISS id of the row (-1 = not assigned yet)
+    content_hash: str = ""   # content_hash(name, description)
 
 
 class LabelSemanticIndex:
     """Wrapper around a FAISS index plus label metadata."""
 
-    def __init__(self, index: faiss.Index, entries: List[LabelEntry]):
+    def __init__(
+        self,
+        index: faiss.Index,
+        entries: List[LabelEntry],
+        *,
+        index_type: str = "flat",
+        index_params: Optional[Dict[str, Any]] = None,
+        embedding_model: Optional[str] = None,
+        next_id: Optional[int] = None,
+        mmapped: bool = False,
+    ):
+        faiss = _faiss()
+
         if not isinstance(index, faiss.Index):
             raise TypeError("index must be a faiss.Index instance")
         self.index = index
         self.entries = entries
+        self.index_type = index_type
+        self.index_params = dict(index_params or {})
+        self.embedding_model = embedding_model
+        self.mmapped = mmapped
         if len(entries) != index.ntotal:
             raise ValueError("Metadata entries count does not match index size.")
+        # Entries without ids come from indexes built with plain add(): id == row position.
+        for position, entry in enumerate(self.entries):
+            if entry.entry_id < 0:
+                entry.entry_id = position
+            if not entry.content_hash:
+                entry.content_hash = content_hash(entry.name, entry.description)
+        # Ids are never reused, so a removed row cannot be confused with a later one.
+        self.next_id = max([next_id or 0] + [entry.entry_id + 1 for entry in self.entries])
+        self._rebuild_label_lookup()
+
+    def _rebuild_label_lookup(self) -> None:
+        """Map every FAISS row to a dense label id (several rows may share a label)."""
+        label_ids: Dict[str, int] = {}
+        row_ids: List[int] = []
+        for entry in self.entries:
+            row_ids.append(label_ids.setdefault(entry.name, len(label_ids)))
+        self._labels: List[str] = list(label_ids.keys())
+        self.row_label_ids: np.ndarray = np.asarray(row_ids, dtype=np.int64)
+
+        # FAISS returns ids; translate them to entry positions after removals.
+        entry_ids = np.asarray([entry.entry_id for entry in self.entries], dtype=np.int64)
+        self._ids_are_positions = bool(np.array_equal(entry_ids, np.arange(len(self.entries))))
+        order = np.argsort(entry_ids, kind="stable")
+        self._sorted_ids = entry_ids[order]
+        self._sorted_positions = order.astype(np.int64)
 
     @property
     def dimension(self) -> int:
@@ -103,33 +385,238 @@ class LabelSemanticIndex:
 
     @property
     def label_names(self) -> List[str]:
+        """Label name of every indexed row (one row per description/exemplar)."""
         return [entry.name for entry in self.entries]
 
+    @property
+    def labels(self) -> List[str]:
+        """Distinct label names, in first-seen order; position == label id."""
+        return list(self._labels)
+
     @classmethod
-    def load(cls, index_path: Path, metadata_path: Path) -> "LabelSemanticIndex":
-        if not index_path.is_file():
-            raise FileNotFoundError(f"Missing FAISS index at {index_path}")
+    def load(cls, index_path: Path, metadata_path: Path, *, mmap: bool = False) -> "LabelSemanticIndex":
+        """
+        Load the index and its metadata.
+
+        With `mmap=True` the vector/code storage is memory-mapped read-only
+        instead of copied into the process heap, so several worker processes
+        share the same page-cache pages and startup does not scale with the
+        index size. A memory-mapped index is read-only: use a regular load for
+        add/remove/update. Falls back to a normal read if mapping fails.
+        """
         if not metadata_path.is_file():
             raise FileNotFoundError(f"Missing metadata file at {metadata_path}")
 
-        index = faiss.read_index(str(index_path))
-        with metadata_path.open("r", encoding="utf-8") as f:
-            meta = json.load(f)
+        # The metadata names the index generation it belongs to (see save_index). Saves
+        # racing this load may prune that file before it is opened: re-read the pointer.
+        for attempt in range(1, _LOAD_ATTEMPTS + 1):
+            with metadata_path.open("r", encoding="utf-8") as f:
+                meta = json.load(f)
+            source = _index_file_for(index_path, meta)
+            # Indexes written before index_type existed are always IndexFlatIP.
+            index_type = str(meta.get("index_type") or "flat")
+            index_params = dict(meta.get("index_params") or {})
+            try:
+                index, mmapped = _read_index_file(source, index_type, mmap)
+                break
+            except (RuntimeError, FileNotFoundError):
+                if source.is_file() or attempt == _LOAD_ATTEMPTS:
+                    raise
+                time.sleep(0.01 * attempt)
 
         entries_data = meta.get("labels") or []
         entries = [
-            LabelEntry(name=str(item.get("name", "")).strip(), description=str(item.get("description", "")).strip())
+            LabelEntry(
+                name=str(item.get("name", "")).strip(),
+                description=str(item.get("description", "")).strip(),
+                entry_id=int(item.get("id", -1)),
+                content_hash=str(item.get("hash", "") or ""),
+            )
             for item in entries_data
         ]
 
-        return cls(index=index, entries=entries)
+        _apply_search_params(index, index_type, index_params)
+
+        return cls(
+            index=index,
+            entries=entries,
+            index_type=index_type,
+            index_params=index_params,
+            embedding_model=meta.get("embedding_model"),
+            next_id=meta.get("next_id"),
+            mmapped=mmapped,
+        )
+
+    def save(self, index_path: Path, metadata_path: Path) -> None:
+        """Atomically persist this index and its metadata (see `save_index`)."""
+        save_index(
+            self.index,
+            self.entries,
+            index_path=index_path,
+            metadata_path=metadata_path,
+            embedding_model=self.embedding_model,
+            next_id=self.next_id,
+        )
+
+    def _positions_for_ids(self, ids: np.ndarray) -> np.ndarray:
+        if self._ids_are_positions:
+            return ids
+        if not self._sorted_ids.size:
+            return np.full_like(ids, -1)
+        slots = np.clip(np.searchsorted(self._sorted_ids, ids), 0, self._sorted_ids.shape[0] - 1)
+        found = (ids >= 0) & (self._sorted_ids[slots] == ids)
+        return np.where(found, self._sorted_positions[slots], -1)
 
     def search(self, query_vector: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
-        """Run a FAISS search with the provided (batch) query vectors."""
+        """Run a FAISS search; returned indices are positions in `entries` (-1 = no hit)."""
         query = _ensure_float32(query_vector)
         if query.ndim == 1:
             query = query.reshape(1, -1)
-        return self.index.search(query, top_k)
+        distances, ids = self.index.search(query, top_k)
+        return distances, self._positions_for_ids(ids)
+
+    # -----------------------------
+    # Incremental updates
+    # -----------------------------
+    def _ensure_id_mapped(self) -> None:
+        """Upgrade indexes built before ids existed (plain IndexFlatIP etc.) to ID-mapped ones."""
+        if self.mmapped:
+            raise RuntimeError("Index was loaded with mmap=True and is read-only; reload it with mmap=False to modify.")
+        if _supports_ids(self.index):
+            return
+        vectors = self.index.reconstruct_n(0, self.index.ntotal)
+        ids = np.asarray([entry.entry_id for entry in self.entries], dtype=np.int64)
+        self.index = create_faiss_index(vectors, index_type=self.index_type, index_params=self.index_params, ids=ids)
+
+    def add(self, items: Iterable[Tuple[str, str]], embedder: SentenceTransformerEmbedder) -> List[int]:
+        """Embed and append (label_name, text) rows; returns the new FAISS ids."""
+        names: List[str] = []
+        texts: List[str] = []
+        for name, text in items:
+            norm_name, norm_text = (name or "").strip(), _normalize_description(text)
+            if norm_name and norm_text:
+                names.append(norm_name)
+                texts.append(norm_text)
+        if not names:
+            return []
+
+        self._ensure_id_mapped()
+        embeddings = embedder.encode(texts)
+        if embeddings.shape[1] != self.dimension:
+            raise ValueError(
+                f"Embedding dimension {embeddings.shape[1]} does not match index dimension {self.dimension}."
+            )
+        start = self.next_id
+        new_ids = np.arange(start, start + len(names), dtype=np.int64)
+        self.index.add_with_ids(embeddings, new_ids)
+        self.next_id = start + len(names)
+        for entry_id, name, text in zip(new_ids, names, texts):
+            self.entries.append(
+                LabelEntry(name=name, description=text, entry_id=int(entry_id), content_hash=content_hash(name, text))
+            )
+        self._rebuild_label_lookup()
+        return [int(i) for i in new_ids]
+
+    def remove(self, entry_ids: Iterable[int]) -> int:
+        """Remove rows by FAISS id without re-embedding the rest; returns the number removed."""
+        faiss = _faiss()
+
+        doomed = {int(i) for i in entry_ids}
+        if not doomed:
+            return 0
+        self._ensure_id_mapped()
+        keep = [entry for entry in self.entries if entry.entry_id not in doomed]
+        removed = len(self.entries) - len(keep)
+        if not removed:
+            return 0
+
+        if isinstance(_base_index(self.index), faiss.IndexHNSW):
+            # HNSW graphs cannot drop nodes: rebuild from the stored vectors (no re-embedding).
+            keep_ids = np.asarray([entry.entry_id for entry in keep], dtype=np.int64)
+            vectors = np.vstack([self.index.reconstruct(int(i)) for i in keep_ids]) if keep else np.zeros(
+                (0, self.dimension), dtype=np.float32
+            )
+            self.index = create_faiss_index(
+                vectors, index_type=self.index_type, index_params=self.index_params, ids=keep_ids
+            )
+        else:
+            self.index.remove_ids(np.asarray(sorted(doomed), dtype=np.int64))
+
+        self.entries = keep
+        self._rebuild_label_lookup()
+        return removed
+
+    def update(
+        self,
+        items: Iterable[Tuple[str, str]],
+        embedder: SentenceTransformerEmbedder,
+    ) -> Tuple[List[int], int]:
+        """
+        Synchronise the index with the desired (label_name, text) rows.
+
+        Rows whose content hash is already indexed are kept as-is, rows that
+        disappeared are removed, and only new/changed texts are embedded.
+        Returns (added_ids, removed_count).
+        """
+        desired: Dict[str, Tuple[str, str]] = {}
+        for name, text in items:
+            norm_name, norm_text = (name or "").strip(), _normalize_description(text)
+            if norm_name and norm_text:
+                desired.setdefault(content_hash(norm_name, norm_text), (norm_name, norm_text))
+
+        existing = {entry.content_hash for entry in self.entries}
+        stale = [entry.entry_id for entry in self.entries if entry.content_hash not in desired]
+        removed = self.remove(stale)
+        added = self.add([pair for digest, pair in desired.items() if digest not in existing], embedder)
+        return added, removed
+
+
+AGGREGATIONS = ("max", "mean", "vote")
+
+
+def aggregate_neighbor_scores(
+    scores: np.ndarray,
+    row_ids: np.ndarray,
+    row_label_ids: np.ndarray,
+    num_labels: int,
+    method: str = "max",
+) -> np.ndarray:
+    """
+    Reduce k-NN results (B, k) over exemplar rows into per-label scores (B, L).
+
+    - max : best neighbour similarity per label.
+    - mean: mean similarity of the neighbours belonging to the label.
+    - vote: share of the (non-negative) similarity mass won by the label, in [0, 1].
+
+    Labels without any neighbour get -inf so callers can drop them.
+    """
+    if method not in AGGREGATIONS:
+        raise ValueError(f"Unsupported aggregation '{method}'. Expected one of {AGGREGATIONS}.")
+
+    batch, k = scores.shape
+    valid = (row_ids >= 0) & (row_ids < row_label_ids.shape[0])
+    label_ids = row_label_ids[np.where(valid, row_ids, 0)] if row_label_ids.size else np.zeros_like(row_ids)
+    # Flatten (query, label) into one axis so a single ufunc.at call does the reduction.
+    flat = (np.arange(batch)[:, None] * num_labels + label_ids)[valid]
+    values = scores.astype(np.float64, copy=False)[valid]
+
+    counts = np.bincount(flat, minlength=batch * num_labels).reshape(batch, num_labels)
+    if method == "max":
+        out = np.full(batch * num_labels, -np.inf)
+        np.maximum.at(out, flat, values)
+        out = out.reshape(batch, num_labels)
+    elif method == "mean":
+        sums = np.bincount(flat, weights=values, minlength=batch * num_labels).reshape(batch, num_labels)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            out = sums / counts
+    else:
+        weights = np.clip(values, 0.0, None)
+        sums = np.bincount(flat, weights=weights, minlength=batch * num_labels).reshape(batch, num_labels)
+        totals = sums.sum(axis=1, keepdims=True)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            out = np.where(totals > 0, sums / totals, 0.0)
+
+    return np.where(counts > 0, out, -np.inf)
 
 
 class LabelSemanticMatcher:
@@ -142,31 +629,72 @@ class LabelSemanticMatcher:
         *,
         top_k: int = 1,
         threshold: Optional[float] = None,
+        neighbors: Optional[int] = None,
+        aggregation: str = "max",
     ):
         if top_k < 1:
             raise ValueError("top_k must be >= 1")
+        if aggregation not in AGGREGATIONS:
+            raise ValueError(f"aggregation must be one of {AGGREGATIONS}")
         self.index = index
         self.embedder = embedder
         self.top_k = top_k
         self.threshold = threshold
+        self.aggregation = aggregation
+        # Neighbours retrieved per query before aggregating per label. With one
+        # description per label this covers every label, so "max" reproduces the
+        # plain top-k ranking.
+        if neighbors is None:
+            neighbors = max(top_k, min(index.index.ntotal, 32))
+        self.neighbors = max(top_k, int(neighbors))
+
+    def score_matrix(self, embeddings: np.ndarray) -> np.ndarray:
+        """Return aggregated (B, L) label scores for a batch of query embeddings."""
+        k = min(self.neighbors, self.index.index.ntotal)
+        with span("faiss.search", batch=int(embeddings.shape[0]), k=int(k)):
+            distances, indices = self.index.search(embeddings, k)
+        return aggregate_neighbor_scores(
+            distances,
+            indices,
+            self.index.row_label_ids,
+            len(self.index.labels),
+            self.aggregation,
+        )
 
-    def label_scores(self, text: str) -> List[Tuple[str, float]]:
-        """Return (label_name, score) pairs sorted by similarity."""
-        embedding = self.embedder.encode([text])
-        distances, indices = self.index.search(embedding, self.top_k)
-        distance_row = distances[0]
-        index_row = indices[0]
-
+    def rank_row(self, row: np.ndarray) -> List[Tuple[str, float]]:
+        """Top-k (label_name, score) pairs of one `score_matrix` row, after the threshold."""
+        labels = self.index.labels
+        order = np.argsort(-row, kind="stable")[: self.top_k]
         results: List[Tuple[str, float]] = []
-        for idx, score in zip(index_row, distance_row):
-            if idx < 0 or idx >= len(self.index.entries):
+        for label_id in order:
+            score = float(row[label_id])
+            if not np.isfinite(score):
                 continue
             if self.threshold is not None and score < self.threshold:
                 continue
-            label_name = self.index.entries[idx].name
-            results.append((label_name, float(score)))
+            results.append((labels[label_id], score))
         return results
 
+    def rank_scores(self, matrix: np.ndarray) -> List[List[Tuple[str, float]]]:
+        """`rank_row` for every row of a (B, L) score matrix."""
+        return [self.rank_row(row) for row in matrix]
+
+    def score_texts(self, texts: Sequence[str]) -> np.ndarray:
+        """Embed texts and return the full (B, L) label score matrix (columns follow `index.labels`)."""
+        with span("embed", batch=len(texts), backend=getattr(self.embedder, "backend", "torch")):
+            embeddings = self.embedder.encode(texts)
+        return self.score_matrix(embeddings)
+
+    def label_scores_batch(self, texts: Sequence[str]) -> List[List[Tuple[str, float]]]:
+        """Embed and score many texts with one encode call and one FAISS search."""
+        if not texts:
+            return []
+        return self.rank_scores(self.score_texts(texts))
+
+    def label_scores(self, text: str) -> List[Tuple[str, float]]:
+        """Return (label_name, score) pairs sorted by aggregated similarity."""
+        return self.label_scores_batch([text])[0]
+
     def labels_for_text(self, text: str) -> List[str]:
         """Return label names ordered by semantic similarity."""
         return [name for name, _score in self.label_scores(text)]
@@ -179,9 +707,15 @@ def _normalize_description(text: str) -> str:
 def build_index_from_descriptions(
     descriptions: Iterable[Tuple[str, str]],
     embedder: SentenceTransformerEmbedder,
+    *,
+    index_type: str = "flat",
+    index_params: Optional[Dict[str, Any]] = None,
 ) -> Tuple[faiss.Index, List[LabelEntry]]:
     """
     Build a cosine-similarity FAISS index from (label_name, description) pairs.
+
+    `index_type` selects the FAISS layout (see INDEX_TYPES) and `index_params`
+    overrides DEFAULT_INDEX_PARAMS for the approximate/quantized variants.
     """
     names: List[str] = []
     descs: List[str] = []
@@ -197,30 +731,123 @@ def build_index_from_descriptions(
         raise ValueError("No valid label descriptions provided.")
 
     embeddings = embedder.encode(descs)
-    dim = embeddings.shape[1]
-    index = faiss.IndexFlatIP(dim)
-    index.add(embeddings)
+    index = create_faiss_index(embeddings, index_type=index_type, index_params=index_params)
 
-    entries = [LabelEntry(name=n, description=d) for n, d in zip(names, descs)]
+    entries = [
+        LabelEntry(name=n, description=d, entry_id=i, content_hash=content_hash(n, d))
+        for i, (n, d) in enumerate(zip(names, descs))
+    ]
     return index, entries
 
 
+_LOAD_ATTEMPTS = 5
+
+
+def _read_index_file(source: Path, index_type: str, mmap: bool) -> Tuple[faiss.Index, bool]:
+    faiss = _faiss()
+
+    if not source.is_file():
+        raise FileNotFoundError(f"Missing FAISS index at {source}")
+    if mmap:
+        try:
+            return faiss.read_index(str(source), _mmap_io_flags(index_type)), True
+        except RuntimeError as exc:
+            if not source.is_file():
+                raise
+            print(f"[label_matcher] Không thể mmap chỉ mục ({exc}); đọc toàn bộ vào RAM.")
+    return faiss.read_index(str(source)), False
+
+
+def _index_file_for(index_path: Path, meta: Dict[str, Any]) -> Path:
+    """Index generation the metadata points at; legacy metadata (no "index_file") uses `index_path`."""
+    name = meta.get("index_file")
+    return index_path.with_name(str(name)) if name else index_path
+
+
+def _prune_generations(index_path: Path, keep: Sequence[str]) -> None:
+    # Keep the current and the previous generation: a reader may have just read the old pointer.
+    for candidate in index_path.parent.glob(f"{index_path.name}.*"):
+        if candidate.name in keep or candidate.name.endswith(".tmp"):
+            continue
+        try:
+            candidate.unlink()
+        except OSError:
+            pass  # still open/mapped by another process (Windows); removed by a later save
+
+
+def _atomic_replace(target: Path, write: Any) -> None:
+    """Write through a temp file in the target directory, then rename over the target."""
+    target.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(prefix=f".{target.name}.", suffix=".tmp", dir=str(target.parent))
+    os.close(fd)
+    try:
+        write(tmp_name)
+        os.replace(tmp_name, target)
+    except BaseException:
+        Path(tmp_name).unlink(missing_ok=True)
+        raise
+
+
 def save_index(
     index: faiss.Index,
     entries: Sequence[LabelEntry],
     *,
     index_path: Path,
     metadata_path: Path,
+    embedding_model: Optional[str] = None,
+    next_id: Optional[int] = None,
 ) -> None:
-    """Persist the FAISS index and metadata to disk."""
-    index_path.parent.mkdir(parents=True, exist_ok=True)
-    metadata_path.parent.mkdir(parents=True, exist_ok=True)
+    """
+    Persist the FAISS index and metadata to disk.
+
+    The index is written to a new generation file next to `index_path`
+    (`label_index.faiss.<generation>`), then the metadata, which names that
+    file in "index_file", is renamed into place. That rename is the single
+    commit point: `LabelSemanticIndex.load` reads the metadata first and opens
+    the generation it names, so a concurrent reader sees either the old pair or
+    the new pair, never a mix. `index_path` itself is refreshed afterwards as a
+    plain copy for tools that read it directly; older generations are pruned.
+    """
+    faiss = _faiss()
 
-    faiss.write_index(index, str(index_path))
+    previous: Optional[str] = None
+    if metadata_path.is_file():
+        try:
+            previous = json.loads(metadata_path.read_text(encoding="utf-8")).get("index_file")
+        except (OSError, ValueError):
+            previous = None
+    generation = index_path.with_name(f"{index_path.name}.{time.time_ns():x}")
+
+    index_type, index_params = describe_index(index)
+    ids = [entry.entry_id if entry.entry_id >= 0 else position for position, entry in enumerate(entries)]
     meta_payload = {
-        "version": 1,
+        "version": 4,
         "embedding_dim": index.d,
-        "labels": [{"name": entry.name, "description": entry.description} for entry in entries],
+        "embedding_model": embedding_model,
+        "next_id": max([next_id or 0] + [entry_id + 1 for entry_id in ids]),
+        "index_type": index_type,
+        "index_params": index_params,
+        "index_file": generation.name,
+        "ntotal": int(index.ntotal),
+        "labels": [
+            {
+                "id": entry_id,
+                "name": entry.name,
+                "description": entry.description,
+                "hash": entry.content_hash or content_hash(entry.name, entry.description),
+            }
+            for entry_id, entry in zip(ids, entries)
+        ],
     }
-    with metadata_path.open("w", encoding="utf-8") as f:
-        json.dump(meta_payload, f, ensure_ascii=False, indent=2)
+
+    def _write_meta(tmp_name: str) -> None:
+        with open(tmp_name, "w", encoding="utf-8") as f:
+            json.dump(meta_payload, f, ensure_ascii=False, indent=2)
+
+    _atomic_replace(generation, lambda tmp_name: faiss.write_index(index, tmp_name))
+    _atomic_replace(metadata_path, _write_meta)
+    try:
+        _atomic_replace(index_path, lambda tmp_name: shutil.copyfile(generation, tmp_name))
+    except OSError as exc:  # e.g. index_path mapped by a reader on Windows; loads use the generation file
+        print(f"[label_matcher] Không cập nhật được {index_path.name} ({exc}); bản mới nằm ở {generation.name}.")
+    _prune_generations(index_path, keep=[generation.name] + ([previous] if previous else []))
@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+"""
+ONNX Runtime backend for the label embedder (CPU-only production nodes).
+
+The SentenceTransformer model is exported once to ONNX (optionally with int8
+dynamic quantization) into a per-model directory (`<export root>/<model slug>`),
+then loaded through sentence-transformers' ONNX backend. Before an exported
+file is used for the first time its vectors are compared with the PyTorch
+model on a fixed set of probe sentences; the result is cached in `parity.json`
+next to the export so later startups neither re-check nor load the PyTorch
+weights. Each parity record names the model and quantization it was made
+for; an export whose record names another model is discarded and redone.
+
+Requires `sentence-transformers>=3.2` and `optimum[onnxruntime]`.
+"""
+
+from __future__ import annotations
+
+import gc
+import json
+import re
+import shutil
+from pathlib import Path
+from typing import Any, Dict, Optional, Sequence
+
+import numpy as np
+
+QUANTIZATION_CONFIGS = ("arm64", "avx2", "avx512", "avx512_vnni")
+
+# Câu mẫu đại diện cho bản tin mục vụ, dùng để so khớp vector ONNX với PyTorch.
+PARITY_PROBES: Sequence[str] = (
+    "MỪNG LỄ KÍNH THÁNH AUGUSTINÔ - BỔN MẠNG GIỚI TRẺ GIÁO XỨ VĨNH HOÀ",
+    "Vào lúc 09g30, thứ Bảy, ngày 30/08/2025, cộng đoàn giáo xứ đã hiệp dâng Thánh lễ Tạ ơn.",
+    "Thánh lễ do cha Giuse chủ tế, với sự tham dự của quý Sơ, Hội đồng Mục vụ và đông đảo cộng đoàn.",
+    "Trong bài giảng, cha mời gọi cộng đoàn sống đức tin khiêm nhường, hiệp nhất và phục vụ.",
+    "Sau Thánh lễ, ca đoàn cùng quý Cha tham dự bữa tiệc mừng trong bầu khí thân tình.",
+    "Thánh lễ khép lại trong niềm vui tạ ơn và phép lành bình an.",
+)
+
+_PARITY_FILE = "parity.json"
+
+
+def model_slug(model_name: str) -> str:
+    """Directory-safe form of a model id or path."""
+    return re.sub(r"[^A-Za-z0-9_.-]", "_", model_name)
+
+
+def default_export_dir(model_name: str) -> Path:
+    """Per-model export directory under ~/.cache when none is configured."""
+    return Path.home() / ".cache" / "mucvu_onnx" / model_slug(model_name)
+
+
+def _onnx_file_name(quantization: Optional[str]) -> str:
+    return f"onnx/model_{_quantized_suffix(quantization)}.onnx" if quantization else "onnx/model.onnx"
+
+
+def _quantized_suffix(quantization: str) -> str:
+    # Explicit suffix: optimum names the file after the weight dtype (qint8/quint8), which varies per config.
+    return f"int8_{quantization}"
+
+
+def _export(model_name: str, export_dir: Path, quantization: Optional[str]) -> None:
+    from sentence_transformers import SentenceTransformer
+
+    base_file = export_dir / _onnx_file_name(None)
+    if not base_file.is_file():
+        # backend="onnx" converts the PyTorch checkpoint through optimum when the
+        # repository has no ONNX file of its own.
+        model = SentenceTransformer(model_name, device="cpu", backend="onnx")
+        model.save_pretrained(str(export_dir))
+    else:
+        model = SentenceTransformer(str(export_dir), device="cpu", backend="onnx")
+
+    if quantization:
+        from sentence_transformers.backend import export_dynamic_quantized_onnx_model
+
+        export_dynamic_quantized_onnx_model(
+            model,
+            quantization,
+            str(export_dir),
+            file_suffix=_quantized_suffix(quantization),
+        )
+    del model
+    gc.collect()
+
+
+def _read_parity(export_dir: Path) -> Dict[str, Any]:
+    path = export_dir / _PARITY_FILE
+    if not path.is_file():
+        return {}
+    try:
+        with path.open("r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def check_parity(model_name: str, onnx_model: Any, probes: Sequence[str] = PARITY_PROBES) -> float:
+    """Return the minimum cosine similarity between PyTorch and ONNX vectors on `probes`."""
+    from sentence_transformers import SentenceTransformer
+
+    reference = SentenceTransformer(model_name, device="cpu")
+    try:
+        expected = reference.encode(list(probes), convert_to_numpy=True, normalize_embeddings=True)
+    finally:
+        del reference
+        gc.collect()
+    actual = onnx_model.encode(list(probes), convert_to_numpy=True, normalize_embeddings=True)
+    return float(np.min(np.sum(expected * actual, axis=1)))
+
+
+def load_onnx_sentence_transformer(
+    model_name: str,
+    *,
+    export_dir: Optional[Path] = None,
+    quantization: Optional[str] = None,
+    parity_min_cosine: float = 0.98,
+) -> Any:
+    """
+    Export (if needed), verify and load an ONNX SentenceTransformer on CPU.
+
+    Args:
+        model_name: Hugging Face id or local path of the PyTorch model.
+        export_dir: export root; files and parity.json go to `<export_dir>/<model slug>`
+            (default: ~/.cache/mucvu_onnx/<model slug>).
+        quantization: None for fp32 ONNX, or one of QUANTIZATION_CONFIGS for int8 dynamic quantization.
+        parity_min_cosine: minimum cosine vs. PyTorch on the probe sentences for the export to be accepted.
+
+    Raises:
+        RuntimeError: the ONNX vectors diverge from PyTorch beyond `parity_min_cosine`.
+    """
+    from sentence_transformers import SentenceTransformer
+
+    if quantization is not None and quantization not in QUANTIZATION_CONFIGS:
+        raise ValueError(f"quantization must be one of {QUANTIZATION_CONFIGS} or None")
+
+    target_dir = Path(export_dir) / model_slug(model_name) if export_dir else default_export_dir(model_name)
+    file_name = _onnx_file_name(quantization)
+    onnx_path = target_dir / file_name
+
+    parity = _read_parity(target_dir)
+    stale = [
+        name for name, item in parity.items()
+        if isinstance(item, dict) and item.get("model_name") not in (None, model_name)
+    ]
+    if stale:
+        # Slug collision or a directory reused for another model: never load its files.
+        print(f"[onnx_backend] {target_dir} chứa bản xuất của model khác; xuất lại cho '{model_name}'.")
+        shutil.rmtree(target_dir, ignore_errors=True)
+        parity = {}
+    elif (parity.get(file_name) or {}).get("quantization", quantization) != quantization:
+        onnx_path.unlink(missing_ok=True)
+        parity.pop(file_name, None)
+
+    if not onnx_path.is_file():
+        print(f"[onnx_backend] Xuất model '{model_name}' sang ONNX ({file_name}) tại {target_dir}.")
+        target_dir.mkdir(parents=True, exist_ok=True)
+        _export(model_name, target_dir, quantization)
+
+    model = SentenceTransformer(
+        str(target_dir),
+        device="cpu",
+        backend="onnx",
+        model_kwargs={"file_name": file_name},
+    )
+
+    record = parity.get(file_name) or {}
+    stat = onnx_path.stat()
+    if (
+        record.get("model_name") != model_name
+        or record.get("quantization") != quantization
+        or record.get("size") != stat.st_size
+        or record.get("mtime") != int(stat.st_mtime)
+    ):
+        min_cosine = check_parity(model_name, model)
+        record = {
+            "model_name": model_name,
+            "quantization": quantization,
+            "size": stat.st_size,
+            "mtime": int(stat.st_mtime),
+            "min_cosine": round(min_cosine, 6),
+        }
+        parity[file_name] = record
+        with (target_dir / _PARITY_FILE).open("w", encoding="utf-8") as f:
+            json.dump(parity, f, ensure_ascii=False, indent=2)
+        print(f"[onnx_backend] Kiểm tra tương đồng {file_name}: cosine nhỏ nhất = {min_cosine:.4f}")
+
+    if float(record.get("min_cosine", -1.0)) < parity_min_cosine:
+        raise RuntimeError(
+            f"ONNX model {file_name} lệch so với PyTorch (cosine nhỏ nhất {record.get('min_cosine')} "
+            f"< {parity_min_cosine})."
+        )
+    return model
@@ -6,18 +6,37 @@ SemanticEditorPipeline: replace the classifier with FAISS semantic search.
 from __future__ import annotations
 
 import unicodedata
-import time
-from typing import Dict, List, Tuple
+from typing import TYPE_CHECKING, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
 
 from editor import Config as EditorConfig
 from editor.Registry import PromptRegistry
 from editor.chunking import Chunk, split_text
 from editor.classifier import map_labels_to_registry_keys
 from editor.llm import BaseLLM
-from editor.pipeline import ChunkResult
+from editor.pipeline import (
+    ChunkResult,
+    ResultCallback,
+    assemble,
+    edit_chunk,
+    failed_chunk,
+    run_chunks,
+    skip_noop_chunk,
+)
+from editor.tracing import span
 
 from .label_matcher import LabelSemanticMatcher
 
+if TYPE_CHECKING:
+    from editor.checkpoint import CheckpointLog
+    from editor.noop import NoopFilter
+    from editor.routing import LLMRouter
+
+    from .cascade import CascadeLabelClassifier
+    from .label_head import HeadLabelClassifier
+    from .sequence import LabelSequenceSmoother
+
 
 class SemanticEditorPipeline:
     """Pipeline that maps paragraphs to labels via semantic similarity."""
@@ -28,17 +47,76 @@ class SemanticEditorPipeline:
         editor_llm: BaseLLM,
         registry: PromptRegistry,
         matcher: LabelSemanticMatcher,
+        classifier: Optional[Union["CascadeLabelClassifier", "HeadLabelClassifier"]] = None,
+        smoother: Optional["LabelSequenceSmoother"] = None,
+        router: Optional["LLMRouter"] = None,
+        noop: Optional["NoopFilter"] = None,
     ):
         self.editor_llm = editor_llm
         self.registry = registry
         self.matcher = matcher
+        # Optional cascade (finetune_v2.cascade) or trained head (finetune_v2.label_head);
+        # None = semantic labels only.
+        self.classifier = classifier
+        # Optional Viterbi decoding over the document's FAISS score matrix (finetune_v2.sequence);
+        # only used for plain semantic labels.
+        self.smoother = smoother
+        # Optional per-label model routing for the edit step (editor.routing); None = editor_llm only.
+        self.router = router
+        # Optional no-op pre-filter (editor.noop); pass-through chunks are not edited.
+        self.noop = noop
 
     def _classify_with_semantics(self, text: str) -> List[str]:
-        label_names = self.matcher.labels_for_text(text)
-        label_keys = map_labels_to_registry_keys(label_names)
-        if not label_keys:
-            raise ValueError("Semantic matcher returned no valid labels.")
-        return label_keys
+        return self._classify_batch_with_semantics([text])[0]
+
+    def _classify_batch_with_semantics(
+        self,
+        texts: List[str],
+        chunk_ids: Optional[Sequence[str]] = None,
+        *,
+        strict: bool = True,
+    ) -> List[List[str]]:
+        """
+        Classify every chunk with one embedding call and one FAISS search.
+        A chunk without labels raises ValueError, or gets [] when `strict` is False.
+        """
+        if self.classifier is not None:
+            decisions = self.classifier.classify_batch(texts, chunk_ids)
+            if strict and any(not decision.label_keys for decision in decisions):
+                raise ValueError("Semantic matcher returned no valid labels.")
+            return [list(decision.label_keys) for decision in decisions]
+
+        if not texts:
+            return []
+        matrix = self.matcher.score_texts(texts)
+        results: List[List[str]] = []
+        for ranked in self.matcher.rank_scores(matrix):
+            label_keys = map_labels_to_registry_keys([name for name, _score in ranked])
+            if strict and not label_keys:
+                raise ValueError("Semantic matcher returned no valid labels.")
+            results.append(label_keys)
+        if self.smoother is not None:
+            results = self._smooth_labels(matrix, results)
+        return results
+
+    def _smooth_labels(self, matrix: np.ndarray, results: List[List[str]]) -> List[List[str]]:
+        """Put the Viterbi label first for every paragraph, keeping the other ranked labels."""
+        with span("classify.smooth", chunks=len(results)) as smooth_span:
+            path = self.smoother.decode(matrix, self.matcher.index.labels)
+            limit = max(1, self.matcher.top_k)
+            smoothed: List[List[str]] = []
+            changed = 0
+            for label_key, label_keys in zip(path, results):
+                if not label_keys:
+                    smoothed.append(label_keys)
+                    continue
+                merged = list(dict.fromkeys(map_labels_to_registry_keys([label_key]) + label_keys))[:limit]
+                changed += merged[0] != label_keys[0]
+                smoothed.append(merged)
+            smooth_span.set(changed=changed)
+        if changed:
+            print(f"[semantic] Làm mượt theo vị trí đã đổi nhãn {changed}/{len(results)} đoạn.")
+        return smoothed
 
     @staticmethod
     def _resolve_title_label_key() -> str:
@@ -52,15 +130,31 @@ class SemanticEditorPipeline:
                 return key
         return mapping.get("tittle", "tittle")
 
-    def process(self, big_text: str) -> Tuple[str, List[ChunkResult]]:
+    def process(
+        self,
+        big_text: str,
+        on_result: Optional[ResultCallback] = None,
+        checkpoint: Optional["CheckpointLog"] = None,
+    ) -> Tuple[str, List[ChunkResult]]:
+        """
+        Classify all chunks in one batch, then edit them. A chunk without labels
+        or whose edit fails/is rejected keeps its original text; failed edits are
+        retried (Config.EDIT_RETRY_ROUNDS) without touching the finished chunks.
+        `on_result` is called with every finished ChunkResult, retries included.
+        Segments already in `checkpoint` (editor.checkpoint) with the same text
+        and labels are restored instead of edited.
+        """
         chunks: List[Chunk] = split_text(big_text)
         if not chunks:
             return "", []
 
-        classified: List[Tuple[Chunk, List[str]]] = []
-        for chunk in chunks:
-            label_keys = self._classify_with_semantics(chunk.text)
-            classified.append((chunk, label_keys))
+        with span("classify.batch", chunks=len(chunks)):
+            batch_labels = self._classify_batch_with_semantics(
+                [chunk.text for chunk in chunks],
+                [chunk.chunk_id for chunk in chunks],
+                strict=False,
+            )
+        classified: List[Tuple[Chunk, List[str]]] = list(zip(chunks, batch_labels))
 
         title_label_key = self._resolve_title_label_key()
 
@@ -103,33 +197,54 @@ class SemanticEditorPipeline:
                 }
             )
 
-        results: List[ChunkResult] = []
-
-        for segment in sorted(segments, key=lambda item: item["order"]):
-            label_keys = segment["label_keys"]
+        def run(segment: Dict[str, object], attempts: int = 1) -> ChunkResult:
+            chunk_id = str(segment["chunk_id"])
+            label_keys = list(segment["label_keys"])
+            paragraph_indices = list(segment.get("paragraph_indices", []))
             if not label_keys:
-                raise ValueError("Segment is missing label keys after merging.")
-
-            system_prompt, selected_labels, edit_prompt_ids = self.registry.build_system_prompt(label_keys)
-
-            user_msg = "Ban thuc hien chinh sua doan van sau.\n\nDoan van:\n" + segment["text"]
-
-            t0 = time.time()
-            edited_text = self.editor_llm.chat(system_prompt, user_msg)
-            latency_ms = int((time.time() - t0) * 1000)
-
-            results.append(
-                ChunkResult(
-                    chunk_id=str(segment["chunk_id"]),
+                # A reference or signature line often has no label; passing it through is not a failure.
+                skipped = skip_noop_chunk(
+                    self.noop,
+                    chunk_id=chunk_id,
+                    order=int(segment["order"]),
+                    text=str(segment["text"]),
+                    paragraph_indices=paragraph_indices,
+                    attempts=attempts,
+                    log_prefix="semantic",
+                )
+                if skipped is not None:
+                    return skipped
+                print(f"[semantic] Đoạn {chunk_id} không có nhãn hợp lệ, giữ nguyên bản gốc.")
+                return failed_chunk(
+                    chunk_id=chunk_id,
                     order=int(segment["order"]),
-                    labels=selected_labels,
-                    edit_prompt_ids=edit_prompt_ids,
-                    edited_text=(edited_text or "").strip(),
-                    latency_ms=latency_ms,
-                    paragraph_indices=list(segment.get("paragraph_indices", [])),
+                    text=str(segment["text"]),
+                    error="no_label",
+                    paragraph_indices=paragraph_indices,
+                    attempts=attempts,
                 )
+            return edit_chunk(
+                self.editor_llm,
+                self.registry,
+                chunk_id=chunk_id,
+                order=int(segment["order"]),
+                text=str(segment["text"]),
+                label_keys=label_keys,
+                paragraph_indices=paragraph_indices,
+                attempts=attempts,
+                log_prefix="semantic",
+                router=self.router,
+                noop=self.noop,
             )
 
-        results.sort(key=lambda item: item.order)
-        final_text = "\n\n".join(item.edited_text for item in results)
-        return final_text, results
+        results = run_chunks(
+            sorted(segments, key=lambda item: item["order"]),
+            run,
+            key_parts=lambda segment: (segment["chunk_id"], segment["text"], segment["label_keys"]),
+            checkpoint=checkpoint,
+            on_result=on_result,
+            log_prefix="semantic",
+        )
+        if checkpoint is not None:
+            checkpoint.finish(results)
+        return assemble(results, log_prefix="semantic")
@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+"""
+Positional label smoothing across a document.
+
+Bulletins follow a strong order (title, lead, reportage, homily, closing), but
+the semantic matcher scores each paragraph on its own. `LabelSequenceSmoother`
+treats the labels as the hidden states of an HMM and runs Viterbi over the
+whole (paragraphs x labels) score matrix of a document:
+
+    emission   log_softmax(score / temperature) per paragraph
+    transition log P(label_t | label_t-1), learned from past documents
+    start      log P(label_0)
+
+so an isolated paragraph whose top-1 label would break the usual flow is
+relabelled when the runner-up fits the sequence much better. Decoding is one
+vectorized (L x L) step per paragraph.
+
+`TransitionPrior` holds Laplace-smoothed start/transition counts over registry
+label keys. It is learned by `python -m finetune_v2.train_label_transitions`
+from saved `/process` responses (audit order + labels) or from plain label
+sequences, and stored as JSON at `Config.LABEL_TRANSITIONS_PATH`.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+FORMAT_VERSION = 1
+
+
+class TransitionPrior:
+    """Start and transition counts between label keys (add-`alpha` smoothing on use)."""
+
+    def __init__(
+        self,
+        labels: Sequence[str] = (),
+        start_counts: Optional[Dict[str, float]] = None,
+        transition_counts: Optional[Dict[str, Dict[str, float]]] = None,
+        *,
+        documents: int = 0,
+        alpha: float = 1.0,
+    ):
+        if alpha <= 0:
+            raise ValueError("alpha must be > 0")
+        self.labels: List[str] = list(dict.fromkeys(labels))
+        self.start_counts: Dict[str, float] = dict(start_counts or {})
+        self.transition_counts: Dict[str, Dict[str, float]] = {
+            src: dict(row) for src, row in (transition_counts or {}).items()
+        }
+        self.documents = int(documents)
+        self.alpha = float(alpha)
+        self._cache: Dict[Tuple[str, ...], Tuple[np.ndarray, np.ndarray]] = {}
+
+    def _ensure_label(self, label: str) -> None:
+        if label not in self.labels:
+            self.labels.append(label)
+
+    def add_sequence(self, sequence: Sequence[str]) -> None:
+        """Count one document's label sequence (consecutive repeats are transitions too)."""
+        sequence = [label for label in sequence if label]
+        if not sequence:
+            return
+        for label in sequence:
+            self._ensure_label(label)
+        self.start_counts[sequence[0]] = self.start_counts.get(sequence[0], 0.0) + 1.0
+        for src, dst in zip(sequence, sequence[1:]):
+            row = self.transition_counts.setdefault(src, {})
+            row[dst] = row.get(dst, 0.0) + 1.0
+        self.documents += 1
+        self._cache.clear()
+
+    @classmethod
+    def fit(cls, sequences: Iterable[Sequence[str]], *, labels: Sequence[str] = (), alpha: float = 1.0) -> "TransitionPrior":
+        prior = cls(labels, alpha=alpha)
+        for sequence in sequences:
+            prior.add_sequence(sequence)
+        return prior
+
+    def log_probs(self, states: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Log start (K,) and transition (K, K) probabilities over `states`.
+
+        States never seen in training only get the `alpha` pseudo-counts, i.e.
+        a uniform, uninformative prior.
+        """
+        key = tuple(states)
+        cached = self._cache.get(key)
+        if cached is not None:
+            return cached
+        k = len(states)
+        start = np.full(k, self.alpha, dtype=np.float64)
+        trans = np.full((k, k), self.alpha, dtype=np.float64)
+        position = {label: i for i, label in enumerate(states)}
+        for label, count in self.start_counts.items():
+            if label in position:
+                start[position[label]] += count
+        for src, row in self.transition_counts.items():
+            i = position.get(src)
+            if i is None:
+                continue
+            for dst, count in row.items():
+                j = position.get(dst)
+                if j is not None:
+                    trans[i, j] += count
+        result = (
+            np.log(start / start.sum()),
+            np.log(trans / trans.sum(axis=1, keepdims=True)),
+        )
+        self._cache[key] = result
+        return result
+
+    # --- persistence ------------------------------------------------------
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "format_version": FORMAT_VERSION,
+            "labels": self.labels,
+            "documents": self.documents,
+            "alpha": self.alpha,
+            "start_counts": self.start_counts,
+            "transition_counts": self.transition_counts,
+        }
+
+    def save(self, path: Path) -> None:
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_name = tempfile.mkstemp(prefix=path.name, suffix=".tmp", dir=path.parent)
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as handle:
+                json.dump(self.to_dict(), handle, ensure_ascii=False, indent=2)
+            os.replace(tmp_name, path)
+        except BaseException:
+            if os.path.exists(tmp_name):
+                os.unlink(tmp_name)
+            raise
+
+    @classmethod
+    def load(cls, path: Path, *, alpha: Optional[float] = None) -> "TransitionPrior":
+        path = Path(path)
+        if not path.is_file():
+            raise FileNotFoundError(
+                f"Label transition prior not found at {path}. "
+                "Learn it with `python -m finetune_v2.train_label_transitions`."
+            )
+        with path.open("r", encoding="utf-8") as handle:
+            data = json.load(handle)
+        if data.get("format_version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported label transition format: {data.get('format_version')}")
+        return cls(
+            data.get("labels", []),
+            data.get("start_counts"),
+            data.get("transition_counts"),
+            documents=data.get("documents", 0),
+            alpha=alpha if alpha is not None else data.get("alpha", 1.0),
+        )
+
+
+def log_softmax(matrix: np.ndarray, temperature: float = 1.0) -> np.ndarray:
+    """Row-wise log-softmax of `matrix / temperature`; -inf cells stay -inf, all -inf rows become uniform."""
+    scaled = np.where(np.isfinite(matrix), matrix / temperature, -np.inf)
+    row_max = scaled.max(axis=1, keepdims=True)
+    empty = ~np.isfinite(row_max)
+    row_max = np.where(empty, 0.0, row_max)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        log_norm = np.log(np.exp(scaled - row_max).sum(axis=1, keepdims=True))
+        out = scaled - row_max - log_norm
+    return np.where(empty, -np.log(matrix.shape[1]), out)
+
+
+def viterbi(emissions: np.ndarray, log_start: np.ndarray, log_trans: np.ndarray) -> np.ndarray:
+    """Most likely state path (N,) for log emissions (N, K) under the given log start/transition."""
+    n, k = emissions.shape
+    if n == 0:
+        return np.zeros(0, dtype=np.int64)
+    backpointers = np.zeros((n, k), dtype=np.int64)
+    delta = log_start + emissions[0]
+    for t in range(1, n):
+        candidates = delta[:, None] + log_trans  # (prev, next)
+        backpointers[t] = candidates.argmax(axis=0)
+        delta = candidates[backpointers[t], np.arange(k)] + emissions[t]
+    path = np.zeros(n, dtype=np.int64)
+    path[-1] = int(delta.argmax())
+    for t in range(n - 1, 0, -1):
+        path[t - 1] = backpointers[t, path[t]]
+    return path
+
+
+class LabelSequenceSmoother:
+    """Viterbi decoding of per-paragraph label scores with a learned transition prior."""
+
+    def __init__(
+        self,
+        prior: TransitionPrior,
+        *,
+        temperature: float = 0.05,
+        transition_weight: float = 1.0,
+        name_to_key: Optional[Dict[str, str]] = None,
+    ):
+        if temperature <= 0:
+            raise ValueError("temperature must be > 0")
+        self.prior = prior
+        self.temperature = float(temperature)
+        self.transition_weight = float(transition_weight)
+        self.name_to_key = dict(name_to_key or {})
+
+    @classmethod
+    def from_config(cls, config: Any) -> "LabelSequenceSmoother":
+        return cls(
+            TransitionPrior.load(
+                getattr(config, "LABEL_TRANSITIONS_PATH"),
+                alpha=getattr(config, "SEQUENCE_SMOOTHING_ALPHA", None),
+            ),
+            temperature=getattr(config, "SEQUENCE_TEMPERATURE", 0.05),
+            transition_weight=getattr(config, "SEQUENCE_TRANSITION_WEIGHT", 1.0),
+            name_to_key=getattr(config, "LABEL_NAME_TO_KEY", {}),
+        )
+
+    def _states(self, column_labels: Sequence[str]) -> Tuple[List[str], np.ndarray]:
+        """Label keys used as HMM states and the state index of every score column."""
+        keys = [self.name_to_key.get(name, name) for name in column_labels]
+        states = list(dict.fromkeys(keys))
+        position = {key: i for i, key in enumerate(states)}
+        return states, np.array([position[key] for key in keys], dtype=np.int64)
+
+    def decode(self, matrix: np.ndarray, column_labels: Sequence[str]) -> List[str]:
+        """
+        Label key per paragraph for a (N, C) score matrix whose columns are
+        `column_labels` (label names or keys). Columns sharing a key are
+        merged with max.
+        """
+        matrix = np.asarray(matrix, dtype=np.float64)
+        if matrix.shape[0] == 0:
+            return []
+        states, column_state = self._states(column_labels)
+        if len(states) == len(column_labels) and np.array_equal(column_state, np.arange(len(states))):
+            state_scores = matrix
+        else:
+            state_scores = np.full((matrix.shape[0], len(states)), -np.inf)
+            for col, state in enumerate(column_state):
+                state_scores[:, state] = np.fmax(state_scores[:, state], matrix[:, col])
+        log_start, log_trans = self.prior.log_probs(states)
+        path = viterbi(
+            log_softmax(state_scores, self.temperature),
+            self.transition_weight * log_start,
+            self.transition_weight * log_trans,
+        )
+        return [states[i] for i in path]
+
+
+def build_sequence_smoother(config: Any) -> Optional[LabelSequenceSmoother]:
+    """Smoother when `config.SEQUENCE_SMOOTHING` is on, else None."""
+    if not getattr(config, "SEQUENCE_SMOOTHING", False):
+        return None
+    return LabelSequenceSmoother.from_config(config)
@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+"""
+Huấn luyện classifier head (finetune_v2.label_head) trên embedding của các đoạn đã gán nhãn.
+
+Dữ liệu (`--data`, có thể lặp lại):
+- JSONL: mỗi dòng {"text": "...", "label": "<tên hoặc key nhãn>"} hoặc "labels": [...]
+  (một đoạn nhiều nhãn được nhân thành nhiều mẫu).
+- JSON: cùng định dạng với Config.LABEL_DESCRIPTIONS_PATH / Config.LABEL_EXEMPLARS_PATH
+  (danh sách {"name", "description" | "exemplars" | "text"} hoặc ánh xạ tên -> đoạn).
+Không truyền `--data` thì dùng mô tả nhãn + tệp exemplars như build_label_index.
+
+Ví dụ:
+    python -m finetune_v2.train_label_head --data outputs/labelled_bulletins.jsonl --hidden 256 --balanced
+
+Kết quả lưu tại Config.LABEL_HEAD_PATH (hoặc `--out`); bật bằng Config.CLASSIFIER_MODE = "head".
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from . import Config
+from .build_label_index import _as_text_list, _collect_texts, _label_names_from_config, _load_descriptions
+from .label_head import LabelClassifierHead
+from .label_matcher import SentenceTransformerEmbedder
+
+
+def _resolve_label_name(value: str, known: Dict[str, str]) -> Optional[str]:
+    """Chấp nhận cả tên nhãn lẫn key nhãn trong registry; trả về tên nhãn."""
+    value = str(value).strip()
+    if value in known:
+        return value
+    return Config.LABEL_KEY_TO_NAME.get(value)
+
+
+def _load_jsonl(path: Path) -> List[Tuple[str, str]]:
+    pairs: List[Tuple[str, str]] = []
+    with path.open("r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as exc:
+                raise ValueError(f"{path}:{line_no}: JSON không hợp lệ ({exc})") from exc
+            text = str(record.get("text") or "").strip()
+            labels = _as_text_list(record.get("labels", record.get("label", record.get("name"))))
+            pairs.extend((label, text) for label in labels if text)
+    return pairs
+
+
+def _load_examples(paths: Sequence[Path], exemplars: Optional[Path]) -> List[Tuple[str, str]]:
+    """Trả về các cặp (label_name, đoạn văn) đã khử trùng lặp, chỉ gồm nhãn có trong registry."""
+    if not paths:
+        return list(_load_descriptions(Config.LABEL_DESCRIPTIONS_PATH, exemplars))
+
+    raw: List[Tuple[str, str]] = []
+    for path in paths:
+        if not path.is_file():
+            raise FileNotFoundError(f"Không tìm thấy tệp dữ liệu: {path}")
+        if path.suffix.lower() == ".jsonl":
+            raw.extend(_load_jsonl(path))
+        else:
+            with path.open("r", encoding="utf-8") as f:
+                collected = _collect_texts(json.load(f), ("description", "exemplars", "text"))
+            raw.extend((name, text) for name, items in collected.items() for text in items)
+
+    known = _label_names_from_config()
+    pairs: List[Tuple[str, str]] = []
+    unknown = set()
+    for label, text in raw:
+        name = _resolve_label_name(label, known)
+        if name is None:
+            unknown.add(label)
+            continue
+        pairs.append((name, " ".join(text.split())))
+    if unknown:
+        print(f"[label-head] Bỏ qua nhãn không có trong registry: {sorted(unknown)}", file=sys.stderr)
+    return list(dict.fromkeys(pairs))
+
+
+def _split_indices(y: np.ndarray, val_split: float, seed: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Chia train/val theo từng nhãn; nhãn chỉ có một mẫu luôn nằm ở tập train."""
+    rng = np.random.default_rng(seed)
+    train: List[int] = []
+    val: List[int] = []
+    for label_id in np.unique(y):
+        members = rng.permutation(np.flatnonzero(y == label_id))
+        n_val = int(round(len(members) * val_split)) if len(members) > 1 else 0
+        n_val = min(n_val, len(members) - 1)
+        val.extend(members[:n_val].tolist())
+        train.extend(members[n_val:].tolist())
+    return np.array(sorted(train), dtype=np.int64), np.array(sorted(val), dtype=np.int64)
+
+
+def parse_args(argv: Optional[Sequence[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Huấn luyện classifier head trên embedding cho nhãn ngữ nghĩa.")
+    parser.add_argument(
+        "--data",
+        type=Path,
+        action="append",
+        default=[],
+        help="Tệp JSONL/JSON chứa đoạn đã gán nhãn (lặp lại được; mặc định: mô tả nhãn + exemplars).",
+    )
+    parser.add_argument(
+        "--exemplars",
+        type=Path,
+        default=getattr(Config, "LABEL_EXEMPLARS_PATH", None),
+        help="Tệp exemplars dùng khi không truyền --data (mặc định: Config.LABEL_EXEMPLARS_PATH).",
+    )
+    parser.add_argument(
+        "--model",
+        default=Config.EMBEDDING_MODEL_NAME,
+        help="Model embedding (mặc định: Config.EMBEDDING_MODEL_NAME; phải trùng với model lúc suy luận).",
+    )
+    parser.add_argument(
+        "--out",
+        type=Path,
+        default=getattr(Config, "LABEL_HEAD_PATH", Config.SEMANTIC_INDEX_DIR / "label_head.npz"),
+        help="Tệp .npz đầu ra (mặc định: Config.LABEL_HEAD_PATH).",
+    )
+    parser.add_argument("--hidden", type=int, default=0, help="Số nơ-ron lớp ẩn (0 = hồi quy logistic).")
+    parser.add_argument("--epochs", type=int, default=300, help="Số vòng huấn luyện full-batch.")
+    parser.add_argument("--lr", type=float, default=0.05, help="Learning rate cho Adam.")
+    parser.add_argument("--l2", type=float, default=1e-4, help="Hệ số weight decay L2.")
+    parser.add_argument("--val-split", type=float, default=0.2, help="Tỉ lệ mẫu giữ lại để đánh giá (0 = không).")
+    parser.add_argument("--balanced", action="store_true", help="Cân bằng trọng số theo tần suất nhãn.")
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    args = parse_args(argv)
+    if not 0.0 <= args.val_split < 1.0:
+        print("[label-head] Lỗi: --val-split phải nằm trong [0, 1).", file=sys.stderr)
+        sys.exit(1)
+    try:
+        pairs = _load_examples(args.data, args.exemplars)
+    except Exception as exc:  # noqa: BLE001
+        print(f"[label-head] Lỗi: {exc}", file=sys.stderr)
+        sys.exit(1)
+
+    # Giữ thứ tự nhãn của registry; nhãn không có mẫu nào sẽ không bao giờ được dự đoán.
+    present = {name for name, _ in pairs}
+    labels = [name for name in _label_names_from_config() if name in present]
+    missing = sorted(set(_label_names_from_config()) - present)
+    if len(labels) < 2:
+        print("[label-head] Lỗi: cần mẫu của ít nhất 2 nhãn để huấn luyện.", file=sys.stderr)
+        sys.exit(1)
+    if missing:
+        print(f"[label-head] Cảnh báo: không có mẫu cho các nhãn: {missing}", file=sys.stderr)
+
+    Config.EMBEDDING_MODEL_NAME = args.model
+    embedder = SentenceTransformerEmbedder.from_config(Config)
+    label_ids = {name: i for i, name in enumerate(labels)}
+    X = embedder.encode([text for _, text in pairs])
+    y = np.array([label_ids[name] for name, _ in pairs], dtype=np.int64)
+    train_idx, val_idx = _split_indices(y, args.val_split, args.seed)
+
+    head = LabelClassifierHead.fit(
+        X[train_idx],
+        y[train_idx],
+        labels,
+        hidden=args.hidden,
+        epochs=args.epochs,
+        lr=args.lr,
+        l2=args.l2,
+        balanced=args.balanced,
+        seed=args.seed,
+        embedding_model=args.model,
+    )
+    head.metrics = {
+        "train_examples": int(len(train_idx)),
+        "val_examples": int(len(val_idx)),
+        "train_accuracy": round(head.accuracy(X[train_idx], y[train_idx]), 4),
+    }
+    if len(val_idx):
+        head.metrics["val_accuracy"] = round(head.accuracy(X[val_idx], y[val_idx]), 4)
+    head.save(args.out)
+
+    val_note = f", val_acc={head.metrics['val_accuracy']:.3f}" if len(val_idx) else ""
+    print(
+        "[label-head] Đã huấn luyện classifier head "
+        f"(labels={len(labels)}, d={head.dimension}, hidden={head.hidden}, "
+        f"train={len(train_idx)}, val={len(val_idx)}, train_acc={head.metrics['train_accuracy']:.3f}{val_note}) "
+        f"-> {args.out}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+Học xác suất chuyển nhãn giữa các đoạn liên tiếp (finetune_v2.sequence) từ các tài liệu cũ.
+
+Dữ liệu (`--data`, có thể lặp lại), mỗi tài liệu là một chuỗi nhãn theo thứ tự đoạn:
+- JSON phản hồi của `/process` (có trường "audit": [{"order", "labels"}, ...]),
+  hoặc danh sách các phản hồi như vậy.
+- JSONL: mỗi dòng một tài liệu, dạng phản hồi ở trên hoặc {"labels": ["tittle", "mo_bai_tom_tat_thanh_le", ...]}
+  (mỗi phần tử là tên/key nhãn hoặc danh sách nhãn; chỉ lấy nhãn đầu tiên).
+
+Ví dụ:
+    python -m finetune_v2.train_label_transitions --data outputs/audits.jsonl
+    python -m finetune_v2.train_label_transitions --data outputs/new_audits.jsonl --update
+
+Kết quả lưu tại Config.LABEL_TRANSITIONS_PATH (hoặc `--out`); bật bằng Config.SEQUENCE_SMOOTHING = True.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+from pathlib import Path
+from typing import Any, List, Optional, Sequence
+
+from editor.classifier import map_labels_to_registry_keys
+
+from . import Config
+from .sequence import TransitionPrior
+
+
+def _first_key(value: Any) -> Optional[str]:
+    items = value if isinstance(value, list) else [value]
+    keys = map_labels_to_registry_keys([str(item) for item in items if item])
+    return keys[0] if keys else None
+
+
+def _document_sequence(document: Any) -> List[str]:
+    """Chuỗi key nhãn của một tài liệu (phản hồi /process hoặc {"labels": [...]} hoặc danh sách)."""
+    if isinstance(document, dict) and "audit" in document:
+        entries = sorted(document["audit"] or [], key=lambda entry: entry.get("order", 0))
+        labels = [entry.get("labels") for entry in entries]
+    elif isinstance(document, dict):
+        labels = document.get("labels") or []
+    elif isinstance(document, list):
+        labels = document
+    else:
+        raise ValueError("Mỗi tài liệu phải là phản hồi /process, {\"labels\": [...]} hoặc danh sách nhãn.")
+    return [key for key in (_first_key(value) for value in labels) if key]
+
+
+def _load_documents(path: Path) -> List[List[str]]:
+    if not path.is_file():
+        raise FileNotFoundError(f"Không tìm thấy tệp dữ liệu: {path}")
+    with path.open("r", encoding="utf-8") as f:
+        if path.suffix.lower() == ".jsonl":
+            documents = [json.loads(line) for line in f if line.strip()]
+        else:
+            data = json.load(f)
+            documents = data if isinstance(data, list) and data and not isinstance(data[0], str) else [data]
+    return [sequence for sequence in (_document_sequence(doc) for doc in documents) if sequence]
+
+
+def parse_args(argv: Optional[Sequence[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Học prior chuyển nhãn cho bước làm mượt theo vị trí.")
+    parser.add_argument(
+        "--data",
+        type=Path,
+        action="append",
+        required=True,
+        help="Tệp JSON/JSONL chứa các tài liệu đã gán nhãn (lặp lại được).",
+    )
+    parser.add_argument(
+        "--out",
+        type=Path,
+        default=getattr(Config, "LABEL_TRANSITIONS_PATH", Config.SEMANTIC_INDEX_DIR / "label_transitions.json"),
+        help="Tệp JSON đầu ra (mặc định: Config.LABEL_TRANSITIONS_PATH).",
+    )
+    parser.add_argument("--alpha", type=float, default=1.0, help="Laplace smoothing cho số đếm (mặc định: 1.0).")
+    parser.add_argument(
+        "--update",
+        action="store_true",
+        help="Cộng dồn vào prior hiện có tại --out thay vì học lại từ đầu.",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    args = parse_args(argv)
+    try:
+        sequences = [sequence for path in args.data for sequence in _load_documents(path)]
+        if args.update and args.out.is_file():
+            prior = TransitionPrior.load(args.out, alpha=args.alpha)
+        else:
+            prior = TransitionPrior(list(Config.LABEL_KEY_TO_NAME), alpha=args.alpha)
+    except Exception as exc:  # noqa: BLE001
+        print(f"[label-transitions] Lỗi: {exc}", file=sys.stderr)
+        sys.exit(1)
+    if not sequences:
+        print("[label-transitions] Lỗi: không có tài liệu nào có nhãn hợp lệ.", file=sys.stderr)
+        sys.exit(1)
+
+    for sequence in sequences:
+        prior.add_sequence(sequence)
+    prior.save(args.out)
+
+    paragraphs = sum(len(sequence) for sequence in sequences)
+    print(
+        "[label-transitions] Đã học prior chuyển nhãn "
+        f"(+{len(sequences)} tài liệu / {paragraphs} đoạn, tổng {prior.documents} tài liệu, "
+        f"labels={len(prior.labels)}) -> {args.out}"
+    )
+
+
+if __name__ == "__main__":
+    main()
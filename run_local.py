@@ -15,16 +15,29 @@ from editor import Config
 from editor.Registry import PromptRegistry
 from editor.docx_load import ParagraphRecord, document_to_big_text_with_mapping, paragraphs_to_big_text
 from editor.export_local import save_document_with_edits, save_final_text_txt
-from editor.llm import OpenAIChatLLM, OllamaChatLLM
+from editor.checkpoint import open_checkpoint
+from editor.llm import OpenAIChatLLM, OllamaChatLLM, configure_logging
+from editor.llm_pool import get_shared_pool
+from editor.noop import build_noop_filter
+from editor.routing import build_llm_router
 from editor.pipeline import EditorPipeline
 
 from finetune_v2.docx_utils import build_paragraph_updates
 
 
 def choose_llm():
+    configure_logging(getattr(Config, "LLM_LOG_LEVEL", "INFO"))
+    pool = get_shared_pool(Config)
+    if pool is not None:
+        print(f"[Runner] Provider: POOL ({len(pool.stats())} backend)")
+        return pool
     if getattr(Config, "USE_OLLAMA", True):
         print("[Runner] Provider: OLLAMA")
-        return OllamaChatLLM(model=Config.OLLAMA_MODEL, api_url=Config.OLLAMA_API_URL)
+        return OllamaChatLLM(
+            model=Config.OLLAMA_MODEL,
+            api_url=Config.OLLAMA_API_URL,
+            debug_sample_every=getattr(Config, "LLM_STREAM_DEBUG_SAMPLE", 0),
+        )
     print("[Runner] Provider: OPENAI")
     if not Config.OPENAI_API_KEY:
         raise RuntimeError("OPENAI_API_KEY chua duoc dat trong Config.py")
@@ -62,8 +75,18 @@ def main():
 
     big_text, document, paragraphs = load_input_text()
 
-    pipeline = EditorPipeline(classifier_llm=llm, editor_llm=llm, registry=registry)
-    final_text, audit = pipeline.process(big_text)
+    router = build_llm_router(Config, llm)
+    pipeline = EditorPipeline(
+        classifier_llm=llm,
+        editor_llm=llm,
+        registry=registry,
+        router=router,
+        noop=build_noop_filter(Config, registry, router or llm),
+    )
+    checkpoint = open_checkpoint(big_text, pipeline="editor", registry=registry, llm=router or llm, config=Config)
+    if checkpoint is not None:
+        print(f"[Runner] Checkpoint: {checkpoint.path}")
+    final_text, audit = pipeline.process(big_text, checkpoint=checkpoint)
 
     print("\n=== FINAL TEXT ===\n")
     print(final_text)
@@ -77,6 +100,11 @@ def main():
                 "labels": entry.labels,
                 "edit_prompts": entry.edit_prompt_ids,
                 "latency_ms": entry.latency_ms,
+                "status": entry.status,
+                "error": entry.error,
+                "resumed": entry.resumed,
+                "backend": entry.backend,
+                "skipped": entry.skipped,
             }
         )
 
@@ -0,0 +1,7 @@
+import sys
+from pathlib import Path
+
+# The repo is run from its root (no installed package): make `editor` / `finetune_v2` importable.
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
@@ -0,0 +1,110 @@
+import dataclasses
+import gc
+import json
+import os
+
+import pytest
+
+from editor.checkpoint import CheckpointLog
+from editor.pipeline import ChunkResult
+
+
+def _result(chunk_id="c1", status="ok", text="đã sửa"):
+    return ChunkResult(
+        chunk_id=chunk_id,
+        order=0,
+        labels=["tittle"],
+        edit_prompt_ids=["EP_TITTLE"],
+        edited_text=text,
+        latency_ms=5,
+        status=status,
+    )
+
+
+def _line(key, result):
+    return json.dumps({"key": key, "result": dataclasses.asdict(result)}, ensure_ascii=False)
+
+
+def test_record_and_resume(tmp_path):
+    path = tmp_path / "doc.jsonl"
+    log = CheckpointLog(path)
+    log.record("k1", _result())
+    log.record("k2", _result("c2", status="failed"))  # failed results are not kept
+    log.close()
+
+    resumed = CheckpointLog(path)
+    assert len(resumed) == 1
+    restored = resumed.get("k1")
+    assert restored.resumed and restored.edited_text == "đã sửa"
+    assert resumed.get("k2") is None
+
+
+def test_torn_and_malformed_lines_are_skipped(tmp_path):
+    path = tmp_path / "doc.jsonl"
+    good = _line("k1", _result())
+    lines = [
+        good,
+        json.dumps({"result": dataclasses.asdict(_result("c2"))}),  # no "key"
+        json.dumps({"key": "k3"}),  # no "result"
+        json.dumps({"key": "k4", "result": "not an object"}),
+        json.dumps({"key": "k5", "result": {"chunk_id": "c5"}}),  # missing required fields
+        "[1, 2, 3]",
+        "",
+        good.replace("k1", "k6")[: len(good) // 2],  # torn last line
+    ]
+    path.write_text("\n".join(lines), encoding="utf-8")
+
+    log = CheckpointLog(path)
+    assert len(log) == 1
+    assert log.get("k1") is not None
+
+
+def test_finish_removes_log_only_when_everything_succeeded(tmp_path):
+    path = tmp_path / "doc.jsonl"
+    log = CheckpointLog(path)
+    log.record("k1", _result())
+    log.finish([_result(), _result("c2", status="failed")])
+    assert path.exists()
+
+    log = CheckpointLog(path)
+    log.finish([_result()])
+    assert not path.exists()
+    assert not log.lock_path.exists()
+
+
+def test_concurrent_run_does_not_delete_the_owners_log(tmp_path):
+    path = tmp_path / "doc.jsonl"
+    owner = CheckpointLog(path)
+    owner.record("k1", _result())
+
+    other = CheckpointLog(path, resume=False)
+    assert owner.owner and not other.owner
+    assert path.exists()  # resume=False does not wipe a log another run holds
+    other.finish([_result()])
+    assert path.exists()
+
+    owner.record("k2", _result("c2"))
+    assert len(CheckpointLog(path)) == 2
+    owner.finish([_result(), _result("c2")])
+    assert not path.exists()
+
+
+def test_lock_is_released_when_the_log_is_dropped(tmp_path):
+    path = tmp_path / "doc.jsonl"
+    log = CheckpointLog(path)
+    lock_path = log.lock_path
+    assert lock_path.exists()
+    del log
+    gc.collect()
+    assert not lock_path.exists()
+    assert CheckpointLog(path).owner
+
+
+@pytest.mark.skipif(os.name != "posix", reason="stale locks are only detected on POSIX")
+def test_stale_lock_of_a_dead_process_is_taken_over(tmp_path):
+    path = tmp_path / "doc.jsonl"
+    path.write_text(_line("k1", _result()) + "\n", encoding="utf-8")
+    (tmp_path / "doc.jsonl.lock").write_text("999999999 stale", encoding="utf-8")
+    log = CheckpointLog(path, resume=False)
+    assert log.owner
+    assert not path.exists()
@@ -0,0 +1,54 @@
+from typing import List, Optional
+
+from editor.classifier import classify_with_llm
+from editor.llm import BaseLLM, ChatResult
+
+GOOD = '{"labels": ["tiêu đề"]}'
+
+
+class JsonLLM(BaseLLM):
+    """chat_json answers from `replies` in order and records the cap of every call."""
+
+    def __init__(self, replies: List[ChatResult]):
+        self.replies = list(replies)
+        self.caps: List[Optional[int]] = []
+
+    def chat(self, system: str, user: str) -> str:
+        return "[]"
+
+    def chat_json(self, system, user, *, schema=None, max_tokens=None) -> ChatResult:
+        self.caps.append(max_tokens)
+        return self.replies.pop(0)
+
+
+def test_valid_reply_is_mapped_to_registry_keys():
+    llm = JsonLLM([ChatResult(GOOD, finish_reason="stop")])
+    assert classify_with_llm(llm, "Bảng tin", max_tokens=None, retries=1) == ["tittle"]
+    assert llm.caps == [None]
+
+
+def test_truncated_reply_is_retried_with_a_larger_cap():
+    llm = JsonLLM([ChatResult("", finish_reason="length"), ChatResult(GOOD, finish_reason="stop")])
+    assert classify_with_llm(llm, "Bảng tin", max_tokens=128, retries=1) == ["tittle"]
+    assert llm.caps == [128, 256]
+
+
+def test_invalid_reply_is_retried_with_the_same_cap():
+    llm = JsonLLM([ChatResult("không phải JSON", finish_reason="stop"), ChatResult(GOOD, finish_reason="stop")])
+    assert classify_with_llm(llm, "Bảng tin", max_tokens=128, retries=1) == ["tittle"]
+    assert llm.caps == [128, 128]
+
+
+def test_gives_up_after_the_retries():
+    llm = JsonLLM([ChatResult('{"labels": [', finish_reason="length")] * 2)
+    assert classify_with_llm(llm, "Bảng tin", max_tokens=64, retries=1) == []
+    assert llm.caps == [64, 128]
+
+
+def test_default_chat_json_wraps_chat():
+    class PlainLLM(BaseLLM):
+        def chat(self, system, user):
+            return GOOD
+
+    reply = PlainLLM().chat_json("s", "u", max_tokens=10)
+    assert isinstance(reply, ChatResult) and reply.text == GOOD and not reply.truncated
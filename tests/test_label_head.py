@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+from finetune_v2.label_head import LabelClassifierHead
+
+LABELS = ["tittle", "thong_bao", "gioi_thieu_nhan_su"]
+
+
+def _blobs(seed=0, per_label=20, dim=8):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((len(LABELS), dim)) * 3
+    X = np.concatenate([center + rng.standard_normal((per_label, dim)) * 0.3 for center in centers])
+    X /= np.linalg.norm(X, axis=1, keepdims=True)
+    y = np.repeat(np.arange(len(LABELS)), per_label)
+    return X.astype(np.float32), y
+
+
+@pytest.mark.parametrize("hidden", [0, 16])
+def test_fit_separates_clusters(hidden):
+    X, y = _blobs()
+    head = LabelClassifierHead.fit(X, y, LABELS, hidden=hidden, epochs=200)
+    assert head.hidden == hidden and head.dimension == X.shape[1]
+    assert head.accuracy(X, y) == 1.0
+    probs = head.predict_proba(X)
+    assert probs.shape == (len(X), len(LABELS))
+    assert np.allclose(probs.sum(axis=1), 1.0, atol=1e-5)
+
+
+@pytest.mark.parametrize("hidden", [0, 16])
+def test_save_load_round_trip(tmp_path, hidden):
+    X, y = _blobs(seed=1)
+    head = LabelClassifierHead.fit(X, y, LABELS, hidden=hidden, epochs=50, embedding_model="tiny-st")
+    head.metrics = {"val_accuracy": 0.9}
+    path = tmp_path / "head" / "label_head.npz"
+    head.save(path)
+    assert path.is_file() and not path.with_name(path.name + ".tmp").exists()
+
+    loaded = LabelClassifierHead.load(path)
+    assert loaded.labels == LABELS
+    assert loaded.hidden == hidden
+    assert loaded.embedding_model == "tiny-st"
+    assert loaded.metrics == {"val_accuracy": 0.9}
+    assert np.array_equal(loaded.predict_proba(X), head.predict_proba(X))
+    assert loaded.predict(X[:3], top_k=2) == head.predict(X[:3], top_k=2)
+
+
+def test_load_errors(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        LabelClassifierHead.load(tmp_path / "missing.npz")
+    head = LabelClassifierHead(LABELS, [np.zeros((4, 3))], [np.zeros(3)])
+    with pytest.raises(ValueError):
+        head.predict_proba(np.zeros((1, 5)))
+
+
+def test_rank_keeps_top1_and_applies_threshold():
+    head = LabelClassifierHead(LABELS, [np.zeros((2, 3))], [np.zeros(3)])
+    probs = np.array([[0.6, 0.3, 0.1], [0.2, 0.15, 0.65]])
+    assert head.rank(probs, top_k=2, threshold=0.25) == [
+        [("tittle", 0.6), ("thong_bao", 0.3)],
+        [("gioi_thieu_nhan_su", 0.65)],
+    ]
+
+
+def test_corrupt_file_is_a_value_error(tmp_path):
+    for name, content in (("garbage.npz", b"garbage"), ("torn.npz", b"PK\x03\x04junk")):
+        path = tmp_path / name
+        path.write_bytes(content)
+        with pytest.raises(ValueError):
+            LabelClassifierHead.load(path)
@@ -0,0 +1,131 @@
+import time
+
+import pytest
+import requests
+
+from editor.llm import BaseLLM
+from editor.llm_pool import LLMPool
+
+
+class StubLLM(BaseLLM):
+    def __init__(self, name):
+        self.model = name
+        self.error = None  # exception to raise, or None to answer
+        self.up = True
+        self.calls = 0
+
+    def chat(self, system, user):
+        self.calls += 1
+        if self.error is not None:
+            raise self.error
+        return self.model
+
+    def health_check(self, timeout=2.0):
+        return self.up
+
+
+def _http_error(status):
+    response = requests.Response()
+    response.status_code = status
+    return requests.HTTPError(f"{status} error", response=response)
+
+
+def _member(pool, name):
+    return next(item for item in pool.stats() if item["member"] == name)
+
+
+@pytest.fixture
+def pool():
+    members = {"a": StubLLM("a"), "b": StubLLM("b")}
+    return LLMPool(members, failure_threshold=2, cooldown=0.2), members
+
+
+def test_failover_to_the_other_member(pool):
+    pool, members = pool
+    members["a"].error = requests.ConnectionError("down")
+    assert {pool.chat("s", "u") for _ in range(4)} == {"b"}
+    assert _member(pool, "a")["errors"] == 2
+
+
+def test_circuit_opens_half_opens_and_closes(pool):
+    pool, members = pool
+    a = members["a"]
+    a.error = requests.Timeout("slow")
+    for _ in range(4):
+        pool.chat("s", "u")
+    assert _member(pool, "a")["circuit_open"]
+
+    calls = a.calls
+    for _ in range(3):
+        assert pool.chat("s", "u") == "b"
+    assert a.calls == calls  # open: skipped
+
+    time.sleep(0.25)
+    pool.chat("s", "u")  # half-open probe fails: reopened for another cooldown
+    assert a.calls == calls + 1
+    assert _member(pool, "a")["circuit_open"]
+
+    time.sleep(0.25)
+    a.error = None
+    answers = [pool.chat("s", "u") for _ in range(4)]
+    assert "a" in answers  # probe succeeded: closed again
+    assert not _member(pool, "a")["circuit_open"]
+
+
+def test_all_members_down_raises_the_last_error(pool):
+    pool, members = pool
+    for member in members.values():
+        member.error = requests.ConnectionError("down")
+    with pytest.raises(requests.ConnectionError):
+        pool.chat("s", "u")
+
+
+@pytest.mark.parametrize("status", [500, 503, 429])
+def test_server_errors_fail_over(pool, status):
+    pool, members = pool
+    members["a"].error = members["b"].error = _http_error(status)
+    with pytest.raises(requests.HTTPError):
+        pool.chat("s", "u")
+    assert members["a"].calls == members["b"].calls == 1
+
+
+@pytest.mark.parametrize("status", [400, 401, 404, 422])
+def test_client_errors_are_raised_without_failover_or_strikes(pool, status):
+    pool, members = pool
+    members["a"].error = members["b"].error = _http_error(status)
+    for _ in range(5):
+        with pytest.raises(requests.HTTPError):
+            pool.chat("s", "u")
+    assert members["a"].calls + members["b"].calls == 5
+    assert not any(item["circuit_open"] for item in pool.stats())
+
+
+def test_wrapped_errors_are_classified_by_their_cause(pool):
+    pool, members = pool
+    try:
+        raise _http_error(400)
+    except requests.HTTPError as exc:
+        try:
+            raise RuntimeError(f"Ollama request failed: {exc}") from exc
+        except RuntimeError as wrapped:
+            members["a"].error = members["b"].error = wrapped
+    with pytest.raises(RuntimeError):
+        pool.chat("s", "u")
+    assert members["a"].calls + members["b"].calls == 1
+
+    members["a"].error = RuntimeError("Ollama connection failed after 1 attempts")
+    members["a"].error.__cause__ = requests.ConnectionError("refused")
+    members["b"].error = None
+    assert pool.chat("s", "u") == "b"
+
+
+def test_health_check_opens_and_closes_the_circuit(pool):
+    pool, members = pool
+    members["a"].up = False
+    pool.check_health()
+    assert _member(pool, "a")["circuit_open"] and not _member(pool, "a")["healthy"]
+    assert {pool.chat("s", "u") for _ in range(3)} == {"b"}
+
+    members["a"].up = True
+    pool.check_health()
+    assert not _member(pool, "a")["circuit_open"] and _member(pool, "a")["healthy"]
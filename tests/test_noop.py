@@ -0,0 +1,117 @@
+import pytest
+
+from editor.noop import NoopDetector, is_name_list, is_signature
+
+# Headings and short lines from parish bulletins; the title/announcement prompts do edit these.
+HEADINGS = [
+    "Thông Báo, Lịch Lễ",
+    "Thánh Lễ, Chầu Thánh Thể, Giải Tội",
+    "Hội Đồng Mục Vụ, Ca Đoàn, Giới Trẻ",
+    "Tin Vui, Tin Buồn",
+    "Bảng Tin Tháng 7",
+    "Chúa Nhật XV Thường Niên",
+    "Lễ Các Thánh Tử Đạo Việt Nam",
+    "Mừng Lễ Quan Thầy Giáo Xứ",
+    "BẢNG TIN GIÁO XỨ CHÁNH THIỆN",
+    "Cha Giuse mời gọi ca đoàn noi gương Thánh Faustina",
+    "Linh mục chủ tế cùng cộng đoàn dâng lễ tạ ơn.",
+    "Lm. quản xứ kính báo: tuần này có chầu Thánh Thể!",
+]
+
+
+@pytest.fixture
+def detector():
+    return NoopDetector(history=False)
+
+
+@pytest.mark.parametrize("line", HEADINGS)
+def test_headings_are_not_skipped_by_default(detector, line):
+    assert detector.check(line) is None
+
+
+def test_name_lists_opt_in_only_matches_three_items():
+    detector = NoopDetector(history=False, name_lists=True)
+    skipped = {line for line in HEADINGS if detector.check(line) is not None}
+    # Three Title-Case items look exactly like names: the reason the check is off by default.
+    assert skipped == {"Thánh Lễ, Chầu Thánh Thể, Giải Tội", "Hội Đồng Mục Vụ, Ca Đoàn, Giới Trẻ"}
+    assert detector.check("Ông Giuse An, Bà Maria Bình, Anh Phêrô Cường") == "name_list"
+
+
+@pytest.mark.parametrize(
+    "text, reason",
+    [
+        ("Ga 3,16-18", "scripture"),
+        ("(1 Cr 13,4-7)", "scripture"),
+        ("Chúa nhật, ngày 19/10/2025", "date"),
+        ("https://giaoxu.example.org/bang-tin", "link"),
+        ("* * *", "no_words"),
+        ("Lm. Giuse Nguyễn Văn An", "signature"),
+        ("TM. Ban Mục vụ Giáo xứ", "signature"),
+        ("Ga 3,16-18\n19/10/2025", "mixed"),
+    ],
+)
+def test_pass_through_lines(detector, text, reason):
+    assert detector.check(text) == reason
+
+
+def test_name_list_needs_three_items():
+    assert not is_name_list("Ông Giuse An, Bà Maria Bình")
+    assert is_name_list("Ông Giuse An, Bà Maria Bình, Anh Phêrô Cường")
+    assert not is_name_list("ÔNG GIUSE AN, BÀ MARIA BÌNH, ANH PHÊRÔ CƯỜNG")  # all caps: a title
+    assert not is_name_list("Ông Giuse An, bà Maria Bình, anh Phêrô Cường")
+
+
+def test_signature_needs_a_capitalised_name():
+    assert is_signature("Gm. Phêrô Nguyễn Văn Khảm")
+    assert not is_signature("Linh mục chủ tế cùng cộng đoàn")
+    assert not is_signature("Lm. quản xứ kính báo: có chầu Thánh Thể")
+
+
+def test_long_or_mixed_chunks_are_edited(detector):
+    assert detector.check("Ga 3,16-18\nHôm nay giáo xứ mừng lễ bổn mạng.") is None
+    assert detector.check("Ga 3,16-18\n" * 40) is None  # over max_chars
+
+
+def test_history_skips_chunks_returned_unchanged(tmp_path):
+    path = tmp_path / "history.txt"
+    detector = NoopDetector(history_path=path)
+    text = "Thông Báo, Lịch Lễ"
+    assert not detector.observe(text, text + " (đã sửa)", scope="s")
+    assert detector.observe(text, "  Thông Báo,  Lịch Lễ ", scope="s")
+    assert detector.check(text, scope="s") == "history"
+    assert detector.check(text, scope="other") is None
+    assert NoopDetector(history_path=path).check(text, scope="s") == "history"
+
+
+def test_editor_pipeline_checks_each_chunk_once(monkeypatch):
+    from editor import Config
+    from editor.llm import BaseLLM, ChatResult
+    from editor.noop import NoopFilter
+    from editor.pipeline import EditorPipeline
+    from editor.Registry import PromptRegistry
+
+    class CountingDetector(NoopDetector):
+        calls = 0
+
+        def check(self, text, scope=""):
+            CountingDetector.calls += 1
+            return super().check(text, scope)
+
+    class StubLLM(BaseLLM):
+        def chat(self, system, user):
+            return '{"labels": ["tiêu đề"]}'
+
+        def chat_json(self, system, user, *, schema=None, max_tokens=None):
+            return ChatResult(self.chat(system, user), finish_reason="stop")
+
+        def complete(self, system, user, *, max_tokens=None):
+            return ChatResult("Giáo xứ thông báo lịch Thánh lễ.", finish_reason="stop")
+
+    monkeypatch.setattr(Config, "EDIT_RETRY_ROUNDS", 0)
+    llm = StubLLM()
+    pipeline = EditorPipeline(
+        llm, llm, PromptRegistry.from_dict(Config.REGISTRY_DICT), noop=NoopFilter(CountingDetector(history=False))
+    )
+    _, results = pipeline.process("Giáo xứ thông báo lịch lễ.\n\nGa 3,16-18")
+    assert [item.skipped for item in results] == [None, "scripture"]
+    assert CountingDetector.calls == 2  # one check per chunk, not two for the edited one
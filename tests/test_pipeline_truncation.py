@@ -0,0 +1,95 @@
+from typing import List, Optional
+
+import pytest
+
+from editor import Config
+from editor.budget import truncation_retry_budget
+from editor.llm import BaseLLM, ChatResult
+from editor.pipeline import assemble, edit_chunk, run_chunks
+from editor.Registry import PromptRegistry
+
+TEXT = "Giáo xứ thông báo lịch lễ Chúa nhật tuần này."
+EDITED = "Giáo xứ thông báo lịch Thánh lễ Chúa nhật tuần này."
+
+
+class ScriptedLLM(BaseLLM):
+    """Answers with EDITED, cut at the budget for the first `cut` calls."""
+
+    model = "scripted"
+
+    def __init__(self, cut: int):
+        self.cut = cut
+        self.budgets: List[Optional[int]] = []
+
+    def chat(self, system: str, user: str) -> str:
+        return self.complete(system, user).text
+
+    def complete(self, system: str, user: str, *, max_tokens: Optional[int] = None) -> ChatResult:
+        self.budgets.append(max_tokens)
+        if len(self.budgets) <= self.cut:
+            return ChatResult(EDITED[:10], finish_reason="length")
+        return ChatResult(EDITED, finish_reason="stop")
+
+
+@pytest.fixture
+def registry():
+    return PromptRegistry.from_dict(Config.REGISTRY_DICT)
+
+
+@pytest.fixture
+def budget_on(monkeypatch):
+    monkeypatch.setattr(Config, "EDIT_TOKEN_BUDGET", True)
+    monkeypatch.setattr(Config, "EDIT_BUDGET_MAX_TOKENS", 4096)
+
+
+def _edit(llm, registry, **kwargs):
+    return edit_chunk(llm, registry, chunk_id="c1", order=0, text=TEXT, label_keys=["tittle"], **kwargs)
+
+
+def test_truncated_reply_is_retried_with_double_budget(registry, budget_on):
+    llm = ScriptedLLM(cut=1)
+    result = _edit(llm, registry)
+    assert result.status == "ok"
+    assert result.edited_text == EDITED
+    assert not result.truncated
+    assert llm.budgets[1] == 2 * llm.budgets[0]
+    assert result.max_tokens == llm.budgets[1]
+
+
+def test_still_truncated_fails_and_keeps_original(registry, budget_on):
+    llm = ScriptedLLM(cut=2)
+    result = _edit(llm, registry)
+    assert len(llm.budgets) == 2
+    assert result.status == "failed"
+    assert result.error == "truncated"
+    assert result.truncated
+    assert result.edited_text == TEXT
+
+
+def test_truncated_without_budget_is_not_exported(registry, monkeypatch):
+    monkeypatch.setattr(Config, "EDIT_TOKEN_BUDGET", False)
+    llm = ScriptedLLM(cut=1)
+    result = _edit(llm, registry)
+    assert llm.budgets == [None]  # nothing to grow: no second call
+    assert result.status == "failed" and result.error == "truncated"
+
+
+def test_retry_rounds_recover_a_truncated_chunk(registry, budget_on):
+    llm = ScriptedLLM(cut=2)  # first attempt is cut twice, the retry round succeeds
+    results = run_chunks(
+        [TEXT],
+        lambda text, attempts: _edit(llm, registry, attempts=attempts),
+        key_parts=lambda text: (text,),
+        rounds=1,
+    )
+    final_text, results = assemble(results)
+    assert results[0].status == "ok" and results[0].attempts == 2
+    assert final_text == EDITED
+
+
+def test_retry_budget_is_capped():
+    config = type("Cfg", (), {"EDIT_BUDGET_MAX_TOKENS": 1000})
+    assert truncation_retry_budget(300, config) == 600
+    assert truncation_retry_budget(800, config) == 1000
+    assert truncation_retry_budget(1000, config) is None
+    assert truncation_retry_budget(None, config) is None
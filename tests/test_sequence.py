@@ -0,0 +1,74 @@
+import itertools
+
+import numpy as np
+import pytest
+
+from finetune_v2.sequence import LabelSequenceSmoother, TransitionPrior, log_softmax, viterbi
+
+FLOW = ["title", "lead", "homily", "homily", "closing"]
+
+
+def _path_score(path, emissions, log_start, log_trans):
+    score = log_start[path[0]] + emissions[0, path[0]]
+    for t in range(1, len(path)):
+        score += log_trans[path[t - 1], path[t]] + emissions[t, path[t]]
+    return score
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_viterbi_matches_brute_force(seed):
+    rng = np.random.default_rng(seed)
+    n, k = 5, 3
+    emissions = np.log(rng.dirichlet(np.ones(k), size=n))
+    log_start = np.log(rng.dirichlet(np.ones(k)))
+    log_trans = np.log(rng.dirichlet(np.ones(k), size=k))
+
+    best = max(itertools.product(range(k), repeat=n), key=lambda p: _path_score(p, emissions, log_start, log_trans))
+    assert tuple(viterbi(emissions, log_start, log_trans)) == best
+
+
+def test_viterbi_empty_and_single():
+    assert viterbi(np.zeros((0, 3)), np.zeros(3), np.zeros((3, 3))).shape == (0,)
+    assert list(viterbi(np.log([[0.2, 0.7, 0.1]]), np.log([1 / 3] * 3), np.zeros((3, 3)))) == [1]
+
+
+def test_log_softmax_rows():
+    out = log_softmax(np.array([[1.0, 2.0, -np.inf], [-np.inf, -np.inf, -np.inf]]))
+    assert np.allclose(np.exp(out).sum(axis=1), 1.0)
+    assert out[0, 2] == -np.inf
+    assert np.allclose(out[1], -np.log(3))
+
+
+def test_smoother_relabels_an_outlier_against_the_flow():
+    prior = TransitionPrior.fit([FLOW] * 20, labels=["title", "lead", "homily", "closing"])
+    smoother = LabelSequenceSmoother(prior, temperature=0.05)
+    labels = ["title", "lead", "homily", "closing"]
+    matrix = np.array(
+        [
+            [0.90, 0.30, 0.20, 0.10],
+            [0.30, 0.80, 0.40, 0.10],
+            [0.20, 0.30, 0.85, 0.10],
+            [0.61, 0.20, 0.60, 0.10],  # top-1 "title" in the middle of the homily
+            [0.10, 0.20, 0.30, 0.90],
+        ]
+    )
+    assert smoother.decode(matrix, labels) == FLOW
+
+
+def test_smoother_keeps_confident_scores_and_merges_columns():
+    prior = TransitionPrior.fit([FLOW] * 20)
+    smoother = LabelSequenceSmoother(prior, temperature=0.05, name_to_key={"Tiêu đề": "title", "Tiêu đề phụ": "title"})
+    matrix = np.array([[0.2, 0.9, 0.1], [0.1, 0.2, 0.95]])
+    assert smoother.decode(matrix, ["Tiêu đề", "Tiêu đề phụ", "closing"]) == ["title", "closing"]
+    assert smoother.decode(np.zeros((0, 3)), ["a", "b", "c"]) == []
+
+
+def test_transition_prior_round_trip(tmp_path):
+    prior = TransitionPrior.fit([FLOW, ["title", "closing"]], alpha=0.5)
+    path = tmp_path / "transitions.json"
+    prior.save(path)
+    loaded = TransitionPrior.load(path)
+    assert loaded.documents == 2 and loaded.alpha == 0.5
+    states = ["title", "lead", "homily", "closing"]
+    for expected, actual in zip(prior.log_probs(states), loaded.log_probs(states)):
+        assert np.allclose(expected, actual)
@@ -0,0 +1,61 @@
+from types import SimpleNamespace
+
+import pytest
+
+from editor.validation import validate_edit, vietnamese_ratio
+
+ORIGINAL = "Giáo xứ thông báo: thứ Bảy tuần này có chầu Thánh Thể lúc bảy giờ tối tại nhà thờ chính."
+
+
+def _config(**overrides):
+    values = dict(
+        EDIT_VALIDATION=True,
+        EDIT_MAX_LENGTH_RATIO=2.0,
+        EDIT_LENGTH_SLACK_CHARS=20,
+        EDIT_MIN_VIETNAMESE_RATIO=0.3,
+        EDIT_EXPLANATION_PATTERNS=None,
+    )
+    values.update(overrides)
+    return SimpleNamespace(**values)
+
+
+def test_good_edit_passes():
+    assert validate_edit(ORIGINAL, ORIGINAL.replace("chính", "giáo xứ"), _config()) is None
+
+
+@pytest.mark.parametrize(
+    "edited, reason",
+    [
+        ("", "empty"),
+        ("   \n", "empty"),
+        (ORIGINAL * 3, "too_long"),
+        ("The parish announces adoration of the Blessed Sacrament this Saturday at seven.", "not_vietnamese"),
+        ("Dưới đây là đoạn văn đã chỉnh sửa:\n" + ORIGINAL, "explanation"),
+        ("```\n" + ORIGINAL + "\n```", "explanation"),
+        (ORIGINAL + "\n\nGiải thích: đã sửa chính tả.", "explanation"),
+    ],
+)
+def test_rejection_reasons(edited, reason):
+    assert validate_edit(ORIGINAL, edited, _config()) == reason
+
+
+def test_truncated_is_rejected_first():
+    assert validate_edit(ORIGINAL, ORIGINAL, _config(), truncated=True) == "truncated"
+    assert validate_edit(ORIGINAL, "", _config(), truncated=True) == "truncated"
+
+
+def test_validation_off_keeps_truncation_and_empty_checks():
+    config = _config(EDIT_VALIDATION=False)
+    assert validate_edit(ORIGINAL, ORIGINAL * 3, config) is None
+    assert validate_edit(ORIGINAL, "", config) == "empty"
+    assert validate_edit(ORIGINAL, ORIGINAL, config, truncated=True) == "truncated"
+
+
+def test_phrase_already_in_source_is_not_commentary():
+    original = "Lưu ý: xin quý ông bà anh chị em đến sớm để ổn định chỗ ngồi trước giờ lễ."
+    assert validate_edit(original, original, _config()) is None
+
+
+def test_short_or_foreign_sources_skip_the_language_check():
+    assert validate_edit("Mass schedule for Sunday morning and evening.", "Mass times on Sunday.", _config()) is None
+    assert vietnamese_ratio("1234 ---") == 0.0